@@ -0,0 +1,122 @@
+"""
+Microbenchmark of reading the UVC controls while a device is constructed
+
+The controls of a simulated camera are served by a fake ioctl with a fixed cost per call, which stands in for the
+USB control transfer. Eager reads every control's metadata and value one ioctl at a time for every device, which is
+what Device._get_controls used to do. Lazy shares the metadata between devices of the same model and reads the
+values with one VIDIOC_G_EXT_CTRLS per control class.
+
+Run from the backend_py directory:
+    python -m benchmarks.control_construction
+"""
+
+import argparse
+import ctypes
+import time
+
+from src.services.cameras import controls, v4l2
+
+# (id, type, name, minimum, maximum, step, default)
+SIMULATED_CONTROLS = [
+    (v4l2.V4L2_CID_BRIGHTNESS, 1, b"Brightness", -64, 64, 1, 0),
+    (v4l2.V4L2_CID_CONTRAST, 1, b"Contrast", 0, 64, 1, 32),
+    (v4l2.V4L2_CID_SATURATION, 1, b"Saturation", 0, 128, 1, 64),
+    (v4l2.V4L2_CID_HUE, 1, b"Hue", -40, 40, 1, 0),
+    (v4l2.V4L2_CID_AUTO_WHITE_BALANCE, 2, b"White Balance, Automatic", 0, 1, 1, 1),
+    (v4l2.V4L2_CID_GAMMA, 1, b"Gamma", 72, 500, 1, 100),
+    (v4l2.V4L2_CID_GAIN, 1, b"Gain", 0, 100, 1, 0),
+    (v4l2.V4L2_CID_POWER_LINE_FREQUENCY, 3, b"Power Line Frequency", 0, 2, 1, 1),
+    (v4l2.V4L2_CID_WHITE_BALANCE_TEMPERATURE, 1, b"White Balance Temperature", 2800, 6500, 1, 4600),
+    (v4l2.V4L2_CID_SHARPNESS, 1, b"Sharpness", 0, 6, 1, 3),
+    (v4l2.V4L2_CID_BACKLIGHT_COMPENSATION, 1, b"Backlight Compensation", 0, 2, 1, 1),
+    (v4l2.V4L2_CID_EXPOSURE_AUTO, 3, b"Auto Exposure", 0, 3, 1, 3),
+    (v4l2.V4L2_CID_EXPOSURE_ABSOLUTE, 1, b"Exposure Time, Absolute", 1, 5000, 1, 157),
+    (v4l2.V4L2_CID_EXPOSURE_AUTO_PRIORITY, 2, b"Exposure, Dynamic Framerate", 0, 1, 1, 0),
+]
+
+
+class FakeFcntl:
+    """
+    Replacement for the fcntl module which serves the simulated controls
+    """
+
+    def __init__(self, ioctl_cost: float) -> None:
+        self.ioctl_cost = ioctl_cost
+        self.calls = 0
+        self._controls = {control[0]: control for control in SIMULATED_CONTROLS}
+        self._ids = sorted(self._controls)
+
+    def ioctl(self, fd, request, arg):
+        self.calls += 1
+        time.sleep(self.ioctl_cost)
+        if request == v4l2.VIDIOC_QUERYCTRL:
+            return self._queryctrl(arg)
+        if request == v4l2.VIDIOC_QUERYMENU:
+            arg.name = b"Menu item"
+            return 0
+        if request == v4l2.VIDIOC_G_CTRL:
+            arg.value = self._controls[arg.id][6]
+            return 0
+        if request == v4l2.VIDIOC_G_EXT_CTRLS:
+            for i in range(arg.count):
+                arg.controls[i].value = self._controls[arg.controls[i].id][6]
+            return 0
+        raise OSError("unsupported ioctl")
+
+    def _queryctrl(self, arg):
+        control_id = arg.id & ~v4l2.V4L2_CTRL_FLAG_NEXT_CTRL
+        next_ids = [i for i in self._ids if i > control_id]
+        if not next_ids:
+            raise OSError("no more controls")
+        (arg.id, arg.type, arg.name, arg.minimum, arg.maximum, arg.step, arg.default) = self._controls[next_ids[0]]
+        arg.flags = 0
+        return 0
+
+
+def construct_eager(fd: int):
+    control_infos = controls.query_controls(fd)
+    values = controls._read_control_values_individually(
+        fd, [info.control_id for info in control_infos if info.is_readable]
+    )
+    return [info.create_model(values[info.control_id]) for info in control_infos]
+
+
+def construct_lazy(fd: int, cache: controls.ControlInfoCache):
+    control_infos = cache.get_controls(fd, "0c45:6366:0100:0")
+    models = [info.create_model(info.flags.default_value) for info in control_infos]
+    values = controls.read_control_values(fd, control_infos)
+    for model in models:
+        model.value = values[model.control_id]
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=6)
+    parser.add_argument(
+        "--ioctl-cost",
+        type=float,
+        default=0.001,
+        help="Simulated cost of a control ioctl in seconds",
+    )
+    args = parser.parse_args()
+
+    fake_fcntl = FakeFcntl(args.ioctl_cost)
+    controls.fcntl = fake_fcntl
+
+    print(f"{'mode':>6} {'per device (ms)':>16} {'ioctls':>7}")
+    for mode in ("eager", "lazy"):
+        cache = controls.ControlInfoCache()
+        fake_fcntl.calls = 0
+        start = time.perf_counter()
+        for _ in range(args.devices):
+            if mode == "eager":
+                construct_eager(0)
+            else:
+                construct_lazy(0, cache)
+        per_device = (time.perf_counter() - start) / args.devices * 1000
+        print(f"{mode:>6} {per_device:>16.2f} {fake_fcntl.calls // args.devices:>7}")
+
+
+if __name__ == "__main__":
+    main()
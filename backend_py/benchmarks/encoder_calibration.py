@@ -0,0 +1,58 @@
+"""
+Frames per second and CPU time of the H.264 encoders available for the SOFTWARE_H264 encode type
+
+Runs the same calibration as /devices/calibrate_encoder: every available encoder encodes a moving videotestsrc clip as
+fast as it can, and the encoders are listed in the order they would be selected in.
+
+Requires gst-launch-1.0. Run from the backend_py directory:
+    python -m benchmarks.encoder_calibration
+"""
+
+import argparse
+
+from src.services.cameras.encoders import CALIBRATION_FRAMES, DEFAULT_RAW_FORMAT, calibrate_encoders
+from src.services.cameras.pydantic_schemas import EncoderModel, H264EncoderEnum, X264PresetEnum
+
+X264_PRESETS = [X264PresetEnum.ULTRAFAST, X264PresetEnum.SUPERFAST, X264PresetEnum.VERYFAST]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--frames", type=int, default=CALIBRATION_FRAMES)
+    parser.add_argument("--threads", type=int, nargs="+", default=[0], help="x264 thread counts to try")
+    parser.add_argument("--key-int-max", type=int, default=None)
+    parser.add_argument(
+        "--format", default=DEFAULT_RAW_FORMAT, help="raw format of the clip, Y42B for most 4:2:2 MJPEG cameras"
+    )
+    args = parser.parse_args()
+
+    candidates = [
+        EncoderModel(backend=H264EncoderEnum.X264, preset=preset, threads=threads, key_int_max=args.key_int_max)
+        for preset in X264_PRESETS
+        for threads in args.threads
+    ]
+    candidates += [
+        EncoderModel(backend=backend, key_int_max=args.key_int_max)
+        for backend in (H264EncoderEnum.OPENH264, H264EncoderEnum.V4L2)
+    ]
+    results = calibrate_encoders(args.width, args.height, args.fps, candidates, args.frames, args.format)
+    if not results:
+        print("No encoder is available")
+        return
+
+    print(f"{'encoder':>10} {'preset':>10} {'threads':>8} {'fps':>7} {'cpu (ms/frame)':>15} {'target':>7}")
+    for result in results:
+        encoder = result.encoder
+        preset = encoder.preset.value if encoder.backend == H264EncoderEnum.X264 else ""
+        threads = (encoder.threads or "auto") if encoder.backend == H264EncoderEnum.X264 else ""
+        print(
+            f"{encoder.backend.value:>10} {preset:>10} {threads:>8} {result.fps:>7.1f} {result.cpu_time:>15.1f} "
+            f"{'ok' if result.meets_target else 'slow':>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Frames lost by an existing client while other clients join and leave a running stream
+
+A videotestsrc stands in for the camera and the RTP stream is received on localhost. While the pipeline runs, a
+second client is added and removed repeatedly. Restart rebuilds the pipeline for every change, which is what
+configure_stream used to do. Live adds and removes the multiudpsink client on the running pipeline. The existing
+client should receive every frame in live mode.
+
+Requires the GStreamer python bindings. Run from the backend_py directory:
+    python -m benchmarks.endpoint_changes
+"""
+
+import argparse
+import socket
+import struct
+import threading
+import time
+
+from src.services.cameras.pipeline_engine import Gst, PipelineEngineType
+from src.services.cameras.pydantic_schemas import (
+    IntervalModel,
+    StreamEncodeTypeEnum,
+    StreamEndpointModel,
+)
+from src.services.cameras.stream import Stream, StreamRunner
+
+HOST = "127.0.0.1"
+
+
+class TestStream(Stream):
+    """
+    Stream with a videotestsrc instead of the camera
+    """
+
+    def _build_source(self):
+        framerate = f"{self.interval.denominator}/{self.interval.numerator}"
+        return (
+            f"videotestsrc is-live=true ! video/x-raw,width={self.width},height={self.height},framerate={framerate}"
+            " ! jpegenc"
+        )
+
+
+class RtpReceiver:
+    """
+    Counts the frames and the RTP sequence number gaps received on a port
+    """
+
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((HOST, port))
+        self._socket.settimeout(0.1)
+        self._running = True
+        self.frames = 0
+        self.lost_packets = 0
+        self.longest_gap = 0.0
+        self._last_sequence = None
+        self._last_arrival = None
+        self._thread = threading.Thread(target=self._receive)
+        self._thread.start()
+
+    def reset(self):
+        self.frames = 0
+        self.lost_packets = 0
+        self.longest_gap = 0.0
+        self._last_sequence = None
+        self._last_arrival = None
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self._socket.close()
+
+    def _receive(self):
+        while self._running:
+            try:
+                packet = self._socket.recv(65536)
+            except socket.timeout:
+                continue
+            now = time.perf_counter()
+            (flags, sequence) = struct.unpack_from("!xBH", packet)
+            if self._last_sequence is not None:
+                # a restarted pipeline starts a new random sequence, which is counted by the arrival gap instead
+                lost = (sequence - self._last_sequence - 1) & 0xFFFF
+                if lost < 1000:
+                    self.lost_packets += lost
+            if self._last_arrival is not None:
+                self.longest_gap = max(self.longest_gap, now - self._last_arrival)
+            self._last_sequence = sequence
+            self._last_arrival = now
+            # the marker bit is set on the last packet of a frame
+            if flags & 0x80:
+                self.frames += 1
+
+
+def run(mode: str, args, receiver: RtpReceiver, churn_port: int):
+    stream = TestStream(
+        device_path="/dev/video0",
+        encode_type=StreamEncodeTypeEnum.MJPG,
+        width=args.width,
+        height=args.height,
+        interval=IntervalModel(numerator=1, denominator=args.fps),
+        endpoints=[StreamEndpointModel(host=HOST, port=receiver.port)],
+        configured=True,
+    )
+    runner = StreamRunner(stream, engine_type=PipelineEngineType.GST)
+    runner.start()
+    time.sleep(1)
+    receiver.reset()
+
+    start = time.perf_counter()
+    churn_endpoint = StreamEndpointModel(host=HOST, port=churn_port)
+    for i in range(args.changes):
+        if i % 2 == 0:
+            stream.endpoints = [*stream.endpoints, churn_endpoint]
+        else:
+            stream.endpoints = stream.endpoints[:1]
+        if mode == "restart":
+            runner.stop()
+        runner.start()
+        time.sleep(args.change_interval)
+    duration = time.perf_counter() - start
+
+    runner.stop()
+    expected = int(duration * args.fps)
+    print(
+        f"{mode:>8} {receiver.frames:>7} {expected:>9} {receiver.lost_packets:>13} {receiver.longest_gap * 1000:>17.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--changes", type=int, default=20)
+    parser.add_argument("--change-interval", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=5600)
+    args = parser.parse_args()
+
+    if not Gst:
+        print("The GStreamer python bindings are required")
+        return
+
+    receiver = RtpReceiver(args.port)
+    churn_receiver = RtpReceiver(args.port + 1)
+    try:
+        print(f"{'mode':>8} {'frames':>7} {'expected':>9} {'lost packets':>13} {'longest gap (ms)':>17}")
+        for mode in ("restart", "live"):
+            run(mode, args, receiver, churn_receiver.port)
+    finally:
+        receiver.close()
+        churn_receiver.close()
+
+
+if __name__ == "__main__":
+    main()
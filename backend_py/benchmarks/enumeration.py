@@ -0,0 +1,102 @@
+"""
+Benchmark of steady-state device enumeration with simulated video nodes
+
+Run from the backend_py directory:
+    python -m benchmarks.enumeration
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from src.services.cameras.enumeration import (
+    DeviceEnumerator,
+    NodeInfo,
+    _get_vid_pid,
+)
+
+# exploreHD cameras create three nodes each
+NODES_PER_DEVICE = 3
+
+
+class SimulatedEnumerator(DeviceEnumerator):
+    """
+    Enumerator which simulates VIDIOC_QUERYCAP against a fake sysfs tree
+    """
+
+    def __init__(self, sysfs_path: str, ioctl_cost: float) -> None:
+        super().__init__(sysfs_path)
+        self.ioctl_cost = ioctl_cost
+
+    def _query_node(self, devname: str) -> NodeInfo | None:
+        # opening the node and the ioctl round trip
+        with open(f"{self.sysfs_path}/{devname}/name") as f:
+            card = f.read().strip()
+        time.sleep(self.ioctl_cost)
+        index = int(devname.removeprefix("video"))
+        (vid, pid) = _get_vid_pid(devname, self.sysfs_path)
+        bus_info = f"usb-sim-1.{index // NODES_PER_DEVICE}"
+        return NodeInfo(devname, f"/dev/{devname}", card, bus_info, vid, pid)
+
+
+def create_sysfs(root: str, node_count: int) -> str:
+    """
+    Create a fake /sys/class/video4linux with the same layout as the kernel
+    """
+    class_path = os.path.join(root, "class", "video4linux")
+    os.makedirs(class_path)
+    for i in range(node_count):
+        usb_device = f"1-{i // NODES_PER_DEVICE}"
+        usb_path = os.path.join(root, "devices", "usb1", usb_device)
+        node_path = os.path.join(usb_path, f"{usb_device}:1.0", "video4linux", f"video{i}")
+        os.makedirs(node_path)
+        for attr, value in (("idVendor", "0c45"), ("idProduct", "6366")):
+            with open(os.path.join(usb_path, attr), "w") as f:
+                f.write(value)
+        with open(os.path.join(node_path, "name"), "w") as f:
+            f.write("exploreHD USB Camera")
+        os.symlink(os.path.relpath(node_path, class_path), os.path.join(class_path, f"video{i}"))
+    return class_path
+
+
+def measure(create_enumerator, passes: int) -> float:
+    """
+    Average time of a pass in milliseconds
+    """
+    start = time.perf_counter()
+    for _ in range(passes):
+        create_enumerator().scan()
+    return (time.perf_counter() - start) / passes * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--passes", type=int, default=200)
+    parser.add_argument(
+        "--ioctl-cost",
+        type=float,
+        default=0.0005,
+        help="Simulated cost of opening a node and VIDIOC_QUERYCAP in seconds",
+    )
+    args = parser.parse_args()
+
+    print(f"{'nodes':>6} {'uncached (ms)':>14} {'cached (ms)':>12} {'speedup':>8}")
+    for node_count in (1, 8, 32):
+        with tempfile.TemporaryDirectory() as root:
+            sysfs_path = create_sysfs(root, node_count)
+
+            # Previous behaviour: every pass queries every node
+            uncached = measure(
+                lambda: SimulatedEnumerator(sysfs_path, args.ioctl_cost), args.passes
+            )
+
+            enumerator = SimulatedEnumerator(sysfs_path, args.ioctl_cost)
+            enumerator.scan()
+            cached = measure(lambda: enumerator, args.passes)
+
+        print(f"{node_count:>6} {uncached:>14.3f} {cached:>12.3f} {uncached / cached:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
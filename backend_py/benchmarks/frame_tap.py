@@ -0,0 +1,103 @@
+"""
+Frames per second delivered by the frame tap of a stream to N local readers
+
+A videotestsrc stands in for the camera. Every reader is a separate process connected to the shared memory sink with
+ShmFrameClient, and touches every byte of every frame it receives. The readers should get the frame rate of the stream
+independent of their number, because the frames are mapped rather than copied.
+
+Requires gst-launch-1.0 (or the GStreamer python bindings with --engine gst). Run from the backend_py directory:
+    python -m benchmarks.frame_tap
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from src.services.cameras.pipeline_engine import PipelineEngineType
+from src.services.cameras.pydantic_schemas import IntervalModel, StreamEncodeTypeEnum
+from src.services.cameras.shm_client import ShmFrameClient
+from src.services.cameras.stream import StreamRunner
+
+from .endpoint_changes import TestStream
+
+
+def read_frames(socket_path: str, duration: float, results: multiprocessing.Queue):
+    frames = 0
+    frame_bytes = 0
+    with ShmFrameClient(socket_path) as client:
+        client.read_frame().release()
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            with client.read_frame() as frame:
+                # reads every byte, like a consumer decoding the frame would
+                sum(frame.data)
+                frame_bytes += len(frame.data)
+                frames += 1
+        elapsed = time.perf_counter() - start
+    results.put((frames / elapsed, frame_bytes / frames if frames else 0))
+
+
+def wait_for_socket(socket_path: str, timeout: float = 10):
+    start = time.perf_counter()
+    while not os.path.exists(socket_path):
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f"The frame tap did not open {socket_path}")
+        time.sleep(0.05)
+
+
+def measure(readers: int, args) -> tuple:
+    stream = TestStream(
+        device_path="/dev/video_frame_tap",
+        encode_type=StreamEncodeTypeEnum.MJPG,
+        width=args.width,
+        height=args.height,
+        interval=IntervalModel(numerator=1, denominator=args.fps),
+        configured=True,
+        frame_tap=True,
+    )
+    runner = StreamRunner(stream, engine_type=PipelineEngineType(args.engine))
+    runner.start()
+    try:
+        wait_for_socket(stream.frame_tap_path)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=read_frames, args=(stream.frame_tap_path, args.duration, results)
+            )
+            for _ in range(readers)
+        ]
+        for process in processes:
+            process.start()
+        rates = [results.get(timeout=args.duration + 10) for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        runner.stop()
+    fps = [rate for (rate, _) in rates]
+    frame_size = max(size for (_, size) in rates)
+    return (min(fps), sum(fps) / len(fps), frame_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--readers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument(
+        "--engine",
+        choices=[engine_type.value for engine_type in PipelineEngineType],
+        default=PipelineEngineType.SUBPROCESS.value,
+    )
+    args = parser.parse_args()
+
+    print(f"{'readers':>8} {'min fps':>8} {'mean fps':>9} {'frame (kB)':>11}")
+    for readers in args.readers:
+        (min_fps, mean_fps, frame_size) = measure(readers, args)
+        print(f"{readers:>8} {min_fps:>8.1f} {mean_fps:>9.1f} {frame_size / 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
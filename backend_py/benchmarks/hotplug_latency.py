@@ -0,0 +1,133 @@
+"""
+Event loop latency while a simulated 8 camera rig is plugged in at once
+
+Run from the backend_py directory:
+    python -m benchmarks.hotplug_latency
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import statistics
+import time
+
+from src.services.cameras.device_manager import DeviceManager
+from src.services.cameras.enumeration import DeviceInfo
+from src.services.cameras.pydantic_schemas import DeviceType, StreamEncodeTypeEnum
+from src.services.cameras.stream import Stream, StreamRunner
+
+
+class FakeSio:
+    async def emit(self, *args, **kwargs):
+        pass
+
+
+class FakeSettingsManager:
+    def load_device(self, device):
+        pass
+
+    def load_leader_followers(self, devices):
+        pass
+
+
+class FakeDevice:
+    """
+    Just enough of a device to be validated as a DeviceModel
+    """
+
+    def __init__(self, device_info: DeviceInfo) -> None:
+        self.device_info = device_info
+        self.bus_info = device_info.bus_info
+        self.vid = device_info.vid
+        self.pid = device_info.pid
+        self.nickname = ""
+        self.controls = []
+        self.device_type = DeviceType.EXPLOREHD
+        self.stream = Stream(
+            device_path=device_info.device_paths[0],
+            encode_type=StreamEncodeTypeEnum.H264,
+            width=1920,
+            height=1080,
+        )
+        self.stream_runner = StreamRunner(self.stream)
+
+
+class InlineExecutor(concurrent.futures.Executor):
+    """
+    Runs the work on the calling thread, which is how devices used to be constructed
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class SimulatedDeviceManager(DeviceManager):
+
+    def __init__(self, construction_time: float) -> None:
+        super().__init__(FakeSio(), FakeSettingsManager())
+        self.construction_time = construction_time
+
+    def create_device(self, device_info: DeviceInfo):
+        # format enumeration, opening the device and reading the controls all block on ioctls
+        time.sleep(self.construction_time)
+        return FakeDevice(device_info)
+
+
+async def measure_burst(manager: DeviceManager, camera_count: int, interval: float):
+    devices_info = [
+        DeviceInfo(
+            "exploreHD USB Camera",
+            f"usb-sim-1.{i}",
+            [f"/dev/video{i * 3}", f"/dev/video{i * 3 + 1}", f"/dev/video{i * 3 + 2}"],
+            0xC45,
+            0x6366,
+        )
+        for i in range(camera_count)
+    ]
+
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        # measure how late every tick is scheduled
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append((time.perf_counter() - start - interval) * 1000)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(interval)
+    start = time.perf_counter()
+    await manager._get_devices([], devices_info)
+    duration = time.perf_counter() - start
+    done.set()
+    await ticker_task
+    assert len(manager.devices) == camera_count
+    return (duration, lags)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument(
+        "--construction-time",
+        type=float,
+        default=0.3,
+        help="Simulated blocking time to construct a device in seconds",
+    )
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} {'burst (s)':>10} {'max lag (ms)':>13} {'p50 lag (ms)':>13}")
+    for mode in ("inline", "pool"):
+        manager = SimulatedDeviceManager(args.construction_time)
+        if mode == "inline":
+            manager._executor = InlineExecutor()
+        (duration, lags) = asyncio.run(measure_burst(manager, args.cameras, args.interval))
+        print(f"{mode:>8} {duration:>10.2f} {max(lags):>13.1f} {statistics.median(lags):>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
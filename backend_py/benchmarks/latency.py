@@ -0,0 +1,283 @@
+"""
+Capture-to-receive latency, jitter and throughput of the generated stream pipelines
+
+For every encode type and latency profile, the pipeline of Stream._construct_pipeline runs with a live videotestsrc
+instead of the camera. The test source stamps every frame with the clock time it was captured at, which the payloader
+turns into the RTP timestamp. The RTP stream is received on localhost, and the arrival time of the last packet of every
+frame is compared to its capture time. The H.264 encode type is fed by x264enc, so the encoding time of the camera
+itself is not included.
+
+The results are written as JSON, and can be compared with the results of another version:
+    python -m benchmarks.latency --output new.json --baseline old.json
+
+Requires the GStreamer python bindings. Run from the backend_py directory:
+    python -m benchmarks.latency
+"""
+
+import argparse
+import json
+import platform
+import socket
+import statistics
+import struct
+import subprocess
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from src.services.cameras.pipeline_engine import Gst, PipelineEngineType
+from src.services.cameras.pydantic_schemas import (
+    IntervalModel,
+    StreamEncodeTypeEnum,
+    StreamEndpointModel,
+    StreamLatencyProfileEnum,
+)
+from src.services.cameras.stream import Stream, StreamRunner
+
+from .endpoint_changes import HOST
+
+RESULTS_VERSION = 1
+
+
+class LatencyTestStream(Stream):
+    """
+    Stream with a live videotestsrc, which timestamps every frame with its capture time, instead of the camera
+    """
+
+    def _build_source(self):
+        framerate = f"{self.interval.denominator}/{self.interval.numerator}"
+        source = (
+            f"videotestsrc is-live=true pattern=ball ! "
+            f"video/x-raw,width={self.width},height={self.height},framerate={framerate}"
+        )
+        if self.encode_type == StreamEncodeTypeEnum.H264:
+            return f"{source} ! x264enc tune=zerolatency speed-preset=ultrafast key-int-max=30"
+        return f"{source} ! jpegenc"
+
+
+class FrameReceiver:
+    """
+    Records the RTP timestamp, the arrival time and the size of every frame received on a port
+    """
+
+    def __init__(self, port: int) -> None:
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self._socket.bind((HOST, port))
+        self._socket.settimeout(0.1)
+        self._running = True
+        # (RTP timestamp, arrival in ns of the monotonic clock, bytes)
+        self.frames: List[Tuple[int, int, int]] = []
+        self.lost_packets = 0
+        self._frame_bytes = 0
+        self._last_sequence = None
+        self._thread = threading.Thread(target=self._receive)
+        self._thread.start()
+
+    def reset(self):
+        self.frames = []
+        self.lost_packets = 0
+        self._frame_bytes = 0
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self._socket.close()
+
+    def _receive(self):
+        while self._running:
+            try:
+                packet = self._socket.recv(65536)
+            except socket.timeout:
+                continue
+            arrival = time.monotonic_ns()
+            (flags, sequence, timestamp) = struct.unpack_from("!xBHI", packet)
+            if self._last_sequence is not None:
+                lost = (sequence - self._last_sequence - 1) & 0xFFFF
+                if lost < 1000:
+                    self.lost_packets += lost
+            self._last_sequence = sequence
+            self._frame_bytes += len(packet)
+            # the marker bit is set on the last packet of a frame
+            if flags & 0x80:
+                self.frames.append((timestamp, arrival, self._frame_bytes))
+                self._frame_bytes = 0
+
+
+def summarize(
+    frames: List[Tuple[int, int, int]], capture_time, duration: float, lost_packets: int
+) -> Dict:
+    latencies = []
+    jitter = 0.0
+    previous = None
+    for timestamp, arrival, _ in frames:
+        captured = capture_time(timestamp)
+        latencies.append((arrival - captured) / 1_000_000)
+        # interarrival jitter of RFC 3550, in ms
+        if previous:
+            transit_difference = (arrival - previous[1]) - (captured - previous[0])
+            jitter += (abs(transit_difference) / 1_000_000 - jitter) / 16
+        previous = (captured, arrival)
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "frames": len(frames),
+        "latency_ms": {
+            "mean": statistics.mean(latencies),
+            "min": min(latencies),
+            "p50": percentiles[49],
+            "p95": percentiles[94],
+            "max": max(latencies),
+            "stdev": statistics.stdev(latencies),
+        },
+        "jitter_ms": jitter,
+        "fps": len(frames) / duration,
+        "bitrate_kbps": sum(size for (_, _, size) in frames) * 8 / duration / 1000,
+        "lost_packets": lost_packets,
+    }
+
+
+def measure(
+    encode_type: StreamEncodeTypeEnum,
+    latency_profile: StreamLatencyProfileEnum,
+    receiver: FrameReceiver,
+    args,
+) -> Dict:
+    stream = LatencyTestStream(
+        device_path="/dev/video0",
+        encode_type=encode_type,
+        width=args.width,
+        height=args.height,
+        interval=IntervalModel(numerator=1, denominator=args.fps),
+        endpoints=[StreamEndpointModel(host=HOST, port=args.port)],
+        latency_profile=latency_profile,
+        configured=True,
+    )
+    runner = StreamRunner(stream, engine_type=PipelineEngineType.GST)
+    runner.start()
+    try:
+        time.sleep(args.warmup)
+        receiver.reset()
+        time.sleep(args.duration)
+        frames = receiver.frames
+        lost_packets = receiver.lost_packets
+
+        # the RTP timestamp is the running time of the frame, offset by a random value
+        stats = runner.engine.get_property(stream._element_name("payloader"), "stats")
+        base_time = runner.engine.get_base_time()
+    finally:
+        runner.stop()
+
+    (timestamp_offset, clock_rate) = (stats["timestamp-offset"], stats["clock-rate"])
+
+    def capture_time(timestamp: int) -> int:
+        running_time = ((timestamp - timestamp_offset) & 0xFFFFFFFF) * 1_000_000_000 // clock_rate
+        return base_time + running_time
+
+    return summarize(frames, capture_time, args.duration, lost_packets)
+
+
+def get_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: List[Dict], baseline: List[Dict] | None):
+    baseline_results = {
+        (result["encode_type"], result["latency_profile"]): result for result in baseline or []
+    }
+    print(
+        f"{'encode type':>14} {'profile':>12} {'frames':>7} {'mean (ms)':>10} {'p95 (ms)':>9} {'jitter (ms)':>12} "
+        f"{'fps':>6} {'kbit/s':>8} {'lost':>5}"
+    )
+    for result in results:
+        latency = result["latency_ms"]
+        print(
+            f"{result['encode_type']:>14} {result['latency_profile']:>12} {result['frames']:>7} "
+            f"{latency['mean']:>10.1f} {latency['p95']:>9.1f} {result['jitter_ms']:>12.2f} {result['fps']:>6.1f} "
+            f"{result['bitrate_kbps']:>8.0f} {result['lost_packets']:>5}"
+        )
+        previous = baseline_results.get((result["encode_type"], result["latency_profile"]))
+        if previous:
+            print(
+                f"{'':>14} {'vs baseline':>12} {'':>7} "
+                f"{latency['mean'] - previous['latency_ms']['mean']:>+10.1f} "
+                f"{latency['p95'] - previous['latency_ms']['p95']:>+9.1f} "
+                f"{result['jitter_ms'] - previous['jitter_ms']:>+12.2f} {result['fps'] - previous['fps']:>+6.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--port", type=int, default=5600)
+    parser.add_argument(
+        "--encode-types",
+        nargs="+",
+        choices=[encode_type.value for encode_type in StreamEncodeTypeEnum],
+        default=[encode_type.value for encode_type in StreamEncodeTypeEnum],
+    )
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        choices=[profile.value for profile in StreamLatencyProfileEnum],
+        default=[profile.value for profile in StreamLatencyProfileEnum],
+    )
+    parser.add_argument("--output", default="latency_results.json")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    args = parser.parse_args()
+
+    if not Gst:
+        print("The GStreamer python bindings are required")
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    receiver = FrameReceiver(args.port)
+    results = []
+    try:
+        for encode_type in args.encode_types:
+            for latency_profile in args.profiles:
+                result = measure(
+                    StreamEncodeTypeEnum(encode_type), StreamLatencyProfileEnum(latency_profile), receiver, args
+                )
+                results.append({"encode_type": encode_type, "latency_profile": latency_profile, **result})
+    finally:
+        receiver.close()
+
+    print_results(results, baseline)
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "results_version": RESULTS_VERSION,
+                "version": get_version(),
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "machine": platform.machine(),
+                "gstreamer": Gst.version_string(),
+                "config": {
+                    "width": args.width,
+                    "height": args.height,
+                    "fps": args.fps,
+                    "duration": args.duration,
+                },
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
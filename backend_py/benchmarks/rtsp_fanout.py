@@ -0,0 +1,114 @@
+"""
+CPU and bandwidth of the RTSP stream type from 1 to 16 clients
+
+A videotestsrc stands in for the camera and is encoded once with x264. The stream pipeline and the RTSP server run in
+this process, so its CPU time covers capture, encoding and serving. Every client is a separate gst-launch-1.0 process
+receiving the stream over RTP/UDP on localhost, and the traffic on the loopback interface is measured. With the shared
+media, the CPU time should stay nearly flat and the bandwidth should grow by one stream per client.
+
+Requires the GStreamer and gst-rtsp-server python bindings and gst-launch-1.0. Run from the backend_py directory:
+    python -m benchmarks.rtsp_fanout
+"""
+
+import argparse
+import resource
+import subprocess
+import time
+
+from src.services.cameras.pipeline_engine import PipelineEngineType
+from src.services.cameras.pydantic_schemas import IntervalModel, StreamEncodeTypeEnum, StreamTypeEnum
+from src.services.cameras.rtsp_server import RtspServer
+from src.services.cameras.stream import StreamRunner
+
+from .endpoint_changes import HOST, TestStream
+
+LOOPBACK_INTERFACE = "lo"
+
+
+def get_cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def get_loopback_bytes() -> int:
+    with open("/proc/net/dev") as f:
+        for line in f:
+            (interface, _, counters) = line.partition(":")
+            if interface.strip() == LOOPBACK_INTERFACE:
+                # the received bytes, which equal the sent bytes on the loopback interface
+                return int(counters.split()[0])
+    return 0
+
+
+def start_client(url: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        ["gst-launch-1.0", "-q", "rtspsrc", f"location={url}", "protocols=udp", "latency=0", "!", "fakesink"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def measure(duration: float) -> tuple:
+    (cpu_time, loopback_bytes, start) = (get_cpu_time(), get_loopback_bytes(), time.perf_counter())
+    time.sleep(duration)
+    elapsed = time.perf_counter() - start
+    cpu = (get_cpu_time() - cpu_time) / elapsed * 100
+    bandwidth = (get_loopback_bytes() - loopback_bytes) * 8 / elapsed / 1_000_000
+    return (cpu, bandwidth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--port", type=int, default=RtspServer.DEFAULT_PORT + 100)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    args = parser.parse_args()
+
+    rtsp_server = RtspServer(args.port)
+    if not rtsp_server.available:
+        print("The GStreamer and gst-rtsp-server python bindings are required")
+        return
+
+    stream = TestStream(
+        device_path="/dev/video90",
+        encode_type=StreamEncodeTypeEnum.SOFTWARE_H264,
+        stream_type=StreamTypeEnum.RTSP,
+        width=args.width,
+        height=args.height,
+        interval=IntervalModel(numerator=1, denominator=30),
+        configured=True,
+    )
+    runner = StreamRunner(stream, engine_type=PipelineEngineType.GST)
+    rtsp_server.start()
+    rtsp_server.update_stream(stream)
+    runner.start()
+    url = f"rtsp://{HOST}:{args.port}{stream.rtsp_mount}"
+
+    clients = []
+    try:
+        time.sleep(args.warmup)
+        (cpu, bandwidth) = measure(args.duration)
+        print(f"{'clients':>8} {'cpu (%)':>8} {'loopback (Mbit/s)':>18} {'per client (Mbit/s)':>20}")
+        print(f"{0:>8} {cpu:>8.1f} {bandwidth:>18.2f} {'':>20}")
+        relay_bandwidth = bandwidth
+
+        for count in args.clients:
+            while len(clients) < count:
+                clients.append(start_client(url))
+            time.sleep(args.warmup)
+            (cpu, bandwidth) = measure(args.duration)
+            per_client = (bandwidth - relay_bandwidth) / count
+            print(f"{count:>8} {cpu:>8.1f} {bandwidth:>18.2f} {per_client:>20.2f}")
+    finally:
+        for client in clients:
+            client.terminate()
+            client.wait()
+        runner.stop()
+        rtsp_server.stop()
+
+
+if __name__ == "__main__":
+    main()
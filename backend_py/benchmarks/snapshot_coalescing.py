@@ -0,0 +1,74 @@
+"""
+Frame grabs and latency of concurrent snapshot requests
+
+A dashboard with a grid of thumbnails requests the snapshot of every camera at about the same time, and refreshes them
+periodically. The grab of a frame is simulated with the time it takes to wait for the next frame of the stream. Every
+wave of concurrent requests should cost one grab per camera, and requests within the TTL should be served from the
+cache.
+
+Run from the backend_py directory:
+    python -m benchmarks.snapshot_coalescing
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.services.cameras.snapshot_cache import SnapshotCache
+
+
+class SimulatedCamera:
+    def __init__(self, frame_interval: float) -> None:
+        self.frame_interval = frame_interval
+
+    def grab(self) -> bytes:
+        # on average, the next frame arrives after half a frame interval
+        time.sleep(self.frame_interval / 2)
+        return b"\xff\xd8" + bytes(50_000) + b"\xff\xd9"
+
+
+async def request(cache: SnapshotCache, executor: ThreadPoolExecutor) -> float:
+    start = time.perf_counter()
+    await cache.get(executor)
+    return time.perf_counter() - start
+
+
+async def run(args):
+    executor = ThreadPoolExecutor(max_workers=4)
+    cameras = [SimulatedCamera(1 / args.fps) for _ in range(args.cameras)]
+    caches = [SnapshotCache(camera.grab, ttl=args.ttl) for camera in cameras]
+
+    latencies = []
+    for _ in range(args.waves):
+        # every viewer requests the snapshot of every camera at the same time
+        requests = [request(cache, executor) for cache in caches for _ in range(args.viewers)]
+        latencies += await asyncio.gather(*requests)
+        await asyncio.sleep(args.refresh_interval)
+    executor.shutdown()
+
+    requests_count = args.cameras * args.viewers * args.waves
+    grabs = sum(cache.grabs for cache in caches)
+    print(f"{requests_count} requests, {grabs} frame grabs ({grabs / args.cameras:.1f} per camera)")
+    print(
+        f"latency: median {statistics.median(latencies) * 1000:.1f} ms, "
+        f"max {max(latencies) * 1000:.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--viewers", type=int, default=8)
+    parser.add_argument("--waves", type=int, default=10)
+    parser.add_argument("--refresh-interval", type=float, default=0.5)
+    parser.add_argument("--ttl", type=float, default=SnapshotCache.DEFAULT_TTL)
+    parser.add_argument("--fps", type=float, default=30)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
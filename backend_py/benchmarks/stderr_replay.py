@@ -0,0 +1,103 @@
+"""
+Replays recorded gst-launch-1.0 stderr transcripts through the stderr classifier and the restart supervisor
+
+Every transcript in benchmarks/gst_transcripts is checked against its expected severity, error block and restart
+decision. A failing camera is then replayed against the supervisor with a simulated clock, to show the backoff
+schedule and where the restart budget runs out.
+
+Run from the backend_py directory:
+    python -m benchmarks.stderr_replay
+"""
+
+import argparse
+import os
+import sys
+
+from src.services.cameras.gst_stderr import GstSeverity, GstStderrParser
+from src.services.cameras.stream_supervisor import StreamSupervisor
+
+TRANSCRIPTS_PATH = os.path.join(os.path.dirname(__file__), "gst_transcripts")
+
+# transcript -> (severity, lines in the error block, restartable)
+EXPECTED = {
+    "camera_disconnected.txt": (GstSeverity.FATAL, 4, True),
+    "device_busy.txt": (GstSeverity.FATAL, 4, True),
+    "missing_element.txt": (GstSeverity.INVALID, 1, False),
+    "not_negotiated.txt": (GstSeverity.INVALID, 4, False),
+    "harmless_warnings.txt": (GstSeverity.WARNING, 0, True),
+    "warning_then_error.txt": (GstSeverity.FATAL, 4, True),
+}
+
+
+class SimulatedClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def replay_transcripts() -> int:
+    failures = 0
+    print(f"{'transcript':>26} {'severity':>9} {'error lines':>12} {'restart':>8} {'result':>7}")
+    for name in sorted(os.listdir(TRANSCRIPTS_PATH)):
+        parser = GstStderrParser()
+        with open(os.path.join(TRANSCRIPTS_PATH, name)) as f:
+            for line in f:
+                parser.feed(line)
+
+        result = (parser.severity, len(parser.error_block), parser.restartable)
+        expected = EXPECTED.get(name)
+        passed = result == expected
+        failures += not passed
+        print(
+            f"{name:>26} {parser.severity.name:>9} {len(parser.error_block):>12} {str(parser.restartable):>8} "
+            f"{'ok' if passed else 'FAIL':>7}"
+        )
+        if not passed:
+            print(f"    expected {expected}")
+    return failures
+
+
+def replay_failures(uptime: float, failures: int):
+    """
+    A camera which fails every time after running for the given time
+    """
+    clock = SimulatedClock()
+    supervisor = StreamSupervisor(clock)
+    supervisor.on_started()
+
+    print(f"\nfailing after {uptime} s of uptime")
+    print(f"{'failure':>8} {'time (s)':>9} {'delay (s)':>10}")
+    for i in range(failures):
+        clock.now += uptime
+        delay = supervisor.on_failure()
+        print(f"{i + 1:>8} {clock.now:>9.1f} {'give up' if delay is None else delay:>10}")
+        if delay is None:
+            break
+        clock.now += delay
+        supervisor.on_started()
+
+    restarts = supervisor.get_model()
+    print(
+        f"restarts: {restarts.restart_count}, downtime: {restarts.total_downtime:.1f} s, gave up: {restarts.gave_up}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--failures", type=int, default=10)
+    args = parser.parse_args()
+
+    failures = replay_transcripts()
+    # a camera which keeps failing right away, and one which fails after running for a while
+    replay_failures(0.5, args.failures)
+    replay_failures(StreamSupervisor.STABLE_TIME * 2, args.failures)
+
+    if failures:
+        print(f"\n{failures} transcript(s) did not match")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
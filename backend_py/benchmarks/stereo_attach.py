@@ -0,0 +1,136 @@
+"""
+Leader interruption and frame timestamp skew when a follower is attached to a running stereo pipeline
+
+Two videotestsrc streams stand in for a stellarHD leader and follower. The follower is attached to and detached
+from the leader's runner repeatedly. Restart rebuilds the whole pipeline for every change, which is what
+set_leader and remove_leader used to do. Live links and unlinks the follower branch on the running pipeline.
+
+The skew is the distance between every follower frame timestamp and the closest leader frame timestamp, sampled
+at the sinks while both branches run.
+
+Requires the GStreamer python bindings. Run from the backend_py directory:
+    python -m benchmarks.stereo_attach
+"""
+
+import argparse
+import bisect
+import statistics
+import time
+
+from benchmarks.endpoint_changes import HOST, RtpReceiver, TestStream
+from src.services.cameras.pipeline_engine import Gst, PipelineEngineType
+from src.services.cameras.pydantic_schemas import (
+    IntervalModel,
+    StreamEncodeTypeEnum,
+    StreamEndpointModel,
+)
+from src.services.cameras.stream import Stream, StreamRunner
+
+
+class TimestampProbe:
+    """
+    Records the timestamp of every frame leaving a stream's branch
+    """
+
+    def __init__(self) -> None:
+        self.timestamps = []
+
+    def attach(self, runner: StreamRunner, stream: Stream):
+        sink = runner.engine.pipeline.get_by_name(stream._element_name("sink"))
+        sink.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_buffer)
+
+    def _on_buffer(self, pad, info):
+        timestamp = info.get_buffer().pts
+        # every RTP packet of a frame has the same timestamp
+        if not self.timestamps or self.timestamps[-1] != timestamp:
+            self.timestamps.append(timestamp)
+        return Gst.PadProbeReturn.OK
+
+
+def measure_skew(leader: TimestampProbe, follower: TimestampProbe):
+    leader_timestamps = sorted(leader.timestamps)
+    skews = []
+    for timestamp in follower.timestamps:
+        i = bisect.bisect_left(leader_timestamps, timestamp)
+        neighbours = leader_timestamps[max(i - 1, 0) : i + 1]
+        if neighbours:
+            skews.append(min(abs(timestamp - neighbour) for neighbour in neighbours) / Gst.MSECOND)
+    return skews
+
+
+def create_stream(args, device_path: str, port: int):
+    return TestStream(
+        device_path=device_path,
+        encode_type=StreamEncodeTypeEnum.MJPG,
+        width=args.width,
+        height=args.height,
+        interval=IntervalModel(numerator=1, denominator=args.fps),
+        endpoints=[StreamEndpointModel(host=HOST, port=port)],
+        configured=True,
+    )
+
+
+def run(mode: str, args, leader_receiver: RtpReceiver, follower_port: int):
+    leader = create_stream(args, "/dev/video0", leader_receiver.port)
+    follower = create_stream(args, "/dev/video4", follower_port)
+    runner = StreamRunner(leader, engine_type=PipelineEngineType.GST)
+    runner.start()
+    time.sleep(1)
+    leader_receiver.reset()
+
+    skews = []
+    for i in range(args.changes):
+        attach = i % 2 == 0
+        if attach:
+            runner.streams.append(follower)
+        else:
+            runner.streams.remove(follower)
+        if mode == "restart":
+            runner.stop()
+        runner.start()
+
+        if attach:
+            leader_probe = TimestampProbe()
+            follower_probe = TimestampProbe()
+            leader_probe.attach(runner, leader)
+            follower_probe.attach(runner, follower)
+            time.sleep(args.change_interval)
+            skews += measure_skew(leader_probe, follower_probe)
+        else:
+            time.sleep(args.change_interval)
+
+    runner.stop()
+    mean_skew = statistics.mean(skews) if skews else float("nan")
+    max_skew = max(skews) if skews else float("nan")
+    print(
+        f"{mode:>8} {leader_receiver.longest_gap * 1000:>24.1f} {mean_skew:>15.2f} {max_skew:>14.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--changes", type=int, default=10)
+    parser.add_argument("--change-interval", type=float, default=1)
+    parser.add_argument("--port", type=int, default=5600)
+    args = parser.parse_args()
+
+    if not Gst:
+        print("The GStreamer python bindings are required")
+        return
+
+    leader_receiver = RtpReceiver(args.port)
+    follower_receiver = RtpReceiver(args.port + 1)
+    try:
+        print(f"{'mode':>8} {'leader longest gap (ms)':>24} {'mean skew (ms)':>15} {'max skew (ms)':>14}")
+        for mode in ("restart", "live"):
+            run(mode, args, leader_receiver, follower_receiver.port)
+    finally:
+        leader_receiver.close()
+        follower_receiver.close()
+
+
+if __name__ == "__main__":
+    main()
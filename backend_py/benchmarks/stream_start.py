@@ -0,0 +1,146 @@
+"""
+Time to first packet when starting a stream and when switching the format of a running stream
+
+The RTP stream is received on localhost, and the time from starting the stream until its first packet arrives is
+measured, next to the time to first packet the runner reports for the stream:
+    cold        a new runner starts the stream, with the given engine
+    prepared    the branch was built and its camera opened by prepare_stream before the stream was started
+    switch      the running stream is switched to another resolution, which rebuilds its branch
+    switch (prepared)   the same, with the branch of the new resolution prepared while the old one was streaming
+
+A videotestsrc stands in for the camera, which opens instantly, so the gain of preparing the branch is larger with
+--device, which streams MJPG from a camera instead.
+
+Requires the GStreamer python bindings. Run from the backend_py directory:
+    python -m benchmarks.stream_start
+"""
+
+import argparse
+import socket
+import statistics
+import time
+from dataclasses import replace
+from typing import Callable, List, Tuple
+
+from src.services.cameras.pipeline_engine import Gst, PipelineEngineType
+from src.services.cameras.pydantic_schemas import IntervalModel, StreamEncodeTypeEnum, StreamEndpointModel
+from src.services.cameras.stream import Stream, StreamRunner
+
+from .endpoint_changes import HOST, TestStream
+
+FORMATS = [(640, 480), (1280, 720)]
+
+
+def create_stream(args, width: int, height: int, port: int) -> Stream:
+    stream_type = Stream if args.device else TestStream
+    return stream_type(
+        device_path=args.device or "/dev/video90",
+        encode_type=StreamEncodeTypeEnum.MJPG,
+        width=width,
+        height=height,
+        interval=IntervalModel(numerator=1, denominator=args.fps),
+        endpoints=[StreamEndpointModel(host=HOST, port=port)],
+        configured=True,
+    )
+
+
+def time_first_packet(port: int, start: Callable[[], None], timeout: float) -> float | None:
+    """
+    :return: The seconds from calling start until the first packet arrives on the port, or None on timeout
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver:
+        receiver.bind((HOST, port))
+        receiver.settimeout(timeout)
+        started_at = time.perf_counter()
+        start()
+        try:
+            receiver.recv(65536)
+        except socket.timeout:
+            return None
+        return time.perf_counter() - started_at
+
+
+def wait_for_metric(runner: StreamRunner, stream: Stream, timeout: float) -> float | None:
+    # the first frame may still be counted when the packet was already received
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time_to_first_packet = runner.get_time_to_first_packet(stream)
+        if time_to_first_packet is not None:
+            return time_to_first_packet
+        time.sleep(0.01)
+    return None
+
+
+def measure_start(args, engine_type: PipelineEngineType, prepare: bool) -> Tuple[float | None, float | None]:
+    stream = create_stream(args, *FORMATS[0], args.port)
+    runner = StreamRunner(stream, engine_type=engine_type)
+    if prepare:
+        runner.prepare_stream(stream)
+    try:
+        received = time_first_packet(args.port, runner.start, args.timeout)
+        return (received, wait_for_metric(runner, stream, args.timeout))
+    finally:
+        runner.stop()
+        runner.discard_prepared()
+
+
+def measure_switch(args, prepare: bool) -> Tuple[float | None, float | None]:
+    stream = create_stream(args, *FORMATS[0], args.port)
+    runner = StreamRunner(stream, engine_type=PipelineEngineType.GST)
+    runner.start()
+    try:
+        time.sleep(args.warmup)
+        # the new format is sent to another port, so its first packet is not mistaken for one of the old format
+        (width, height) = FORMATS[1]
+        endpoints = [StreamEndpointModel(host=HOST, port=args.port + 1)]
+        if prepare:
+            runner.prepare_stream(replace(stream, width=width, height=height, endpoints=endpoints))
+        (stream.width, stream.height, stream.endpoints) = (width, height, endpoints)
+        received = time_first_packet(args.port + 1, runner.start, args.timeout)
+        return (received, wait_for_metric(runner, stream, args.timeout))
+    finally:
+        runner.stop()
+        runner.discard_prepared()
+
+
+def print_result(name: str, measurements: List[Tuple[float | None, float | None]]):
+    received = [value * 1000 for (value, _) in measurements if value is not None]
+    reported = [value * 1000 for (_, value) in measurements if value is not None]
+    failed = len(measurements) - len(received)
+    if not received:
+        print(f"{name:>24} {'no packets received':>30}")
+        return
+    reported_median = f"{statistics.median(reported):.1f}" if reported else "-"
+    print(
+        f"{name:>24} {statistics.median(received):>13.1f} {max(received):>10.1f} {reported_median:>15} {failed:>7}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--device", help="camera to stream MJPG from instead of a videotestsrc")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=float, default=1)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--port", type=int, default=5600)
+    args = parser.parse_args()
+
+    if not Gst:
+        print("The GStreamer python bindings are required")
+        return
+
+    scenarios = [
+        ("cold (gst-launch)", lambda: measure_start(args, PipelineEngineType.SUBPROCESS, False)),
+        ("cold (in process)", lambda: measure_start(args, PipelineEngineType.GST, False)),
+        ("prepared", lambda: measure_start(args, PipelineEngineType.GST, True)),
+        ("switch", lambda: measure_switch(args, False)),
+        ("switch (prepared)", lambda: measure_switch(args, True)),
+    ]
+    print(f"{'':>24} {'median (ms)':>13} {'max (ms)':>10} {'reported (ms)':>15} {'failed':>7}")
+    for name, measure in scenarios:
+        print_result(name, [measure() for _ in range(args.repeat)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Throughput of extension unit (XU) operations through camera_helper
+
+Every ioctl goes to /dev/null, where it fails right away with ENOTTY, so the benchmark measures what it costs to
+issue the operations from Python rather than the USB transfers themselves. Legacy makes one ctypes call with fresh
+buffers for the command switch and one for the payload, which is what Option used to do. Option goes through
+uvc_xu_transact with preallocated buffers, and batch reads the given number of options with one uvc_xu_transact.
+
+Run from the backend_py directory:
+    python -m benchmarks.xu_transactions
+"""
+
+import argparse
+import ctypes
+import time
+
+from src.services.cameras import ehd_controls as xu
+from src.services.cameras.camera_helper.camera_helper_loader import (
+    camera_helper,
+    uvc_xu_transaction,
+    UVC_GET_CUR,
+)
+from src.services.cameras.device import Option
+
+SIZE = 11
+
+
+class FakeCamera:
+    """
+    Just enough of a Camera for an Option, backed by /dev/null
+    """
+
+    def __init__(self) -> None:
+        self._file_object = open("/dev/null")
+        self._fd = self._file_object.fileno()
+
+    def uvc_xu_transact(self, transactions, count: int = 1) -> int:
+        return camera_helper.uvc_xu_transact(self._fd, transactions, count)
+
+
+def legacy_get(fd: int):
+    # Option._get_ctrl before uvc_xu_transact
+    data = bytearray(SIZE)
+    data[0] = xu.EHD_DEVICE_TAG
+    data[1] = xu.Command.H264_BITRATE_CTRL.value
+    payload = bytes(SIZE)
+    camera_helper.uvc_set_ctrl(
+        fd, xu.Unit.USR_ID.value, xu.Selector.USR_H264_CTRL.value, bytes(data), SIZE
+    )
+    camera_helper.uvc_get_ctrl(
+        fd, xu.Unit.USR_ID.value, xu.Selector.USR_H264_CTRL.value, payload, SIZE
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--operations", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=3)
+    args = parser.parse_args()
+
+    camera = FakeCamera()
+    option = Option(
+        camera,
+        ">I",
+        xu.Unit.USR_ID,
+        xu.Selector.USR_H264_CTRL,
+        xu.Command.H264_BITRATE_CTRL,
+        "Bitrate",
+    )
+    transactions = (uvc_xu_transaction * args.batch_size)()
+    buffers = [(ctypes.c_uint8 * SIZE)() for _ in range(args.batch_size)]
+    for transaction, buffer in zip(transactions, buffers):
+        transaction.unit = xu.Unit.USR_ID.value
+        transaction.selector = xu.Selector.USR_H264_CTRL.value
+        transaction.command = xu.Command.H264_BITRATE_CTRL.value
+        transaction.query = UVC_GET_CUR
+        transaction.size = SIZE
+        transaction.data = buffer
+
+    def run_batch():
+        camera.uvc_xu_transact(transactions, args.batch_size)
+
+    modes = [
+        ("legacy", 1, lambda: legacy_get(camera._fd)),
+        ("option", 1, option._get_ctrl),
+        ("batch", args.batch_size, run_batch),
+    ]
+
+    print(f"{'mode':>8} {'XU ops/s':>12}")
+    for mode, operations_per_call, run in modes:
+        calls = args.operations // operations_per_call
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        duration = time.perf_counter() - start
+        print(f"{mode:>8} {calls * operations_per_call / duration:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
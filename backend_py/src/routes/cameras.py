@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Request, Response
 from ..services import DeviceManager, StreamInfoModel, DeviceNicknameModel, UVCControlModel, DeviceDescriptorModel, DeviceLeaderModel
 import logging
 
 from typing import List
 
-from ..services.cameras.pydantic_schemas import StreamInfoModel, DeviceNicknameModel, UVCControlModel, DeviceLeaderModel, DeviceModel
+from ..services.cameras.pydantic_schemas import StreamInfoModel, DeviceNicknameModel, UVCControlModel, DeviceLeaderModel, DeviceModel, UVCControlsModel, UVCControlErrorModel, StreamEndpointDescriptorModel, DeviceStreamStatsModel, DeviceStallWatchdogModel, DeviceFrameTapModel, StartRecordingModel, DeviceRecordingModel, DeviceEncoderModel, EncoderCalibrationModel, DeviceLatencyProfileModel
 
 camera_router = APIRouter(tags=['cameras'])
 
@@ -14,6 +14,29 @@ def get_devices(request: Request) -> List[DeviceModel]:
 
     return device_manager.get_devices()
 
+@camera_router.get('/devices/stream_stats', summary='Get the recent stream stats of all devices')
+def get_stream_stats(request: Request) -> List[DeviceStreamStatsModel]:
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    return device_manager.get_stream_stats()
+
+@camera_router.get('/devices/recordings', summary='Get the recordings of all devices')
+def get_recordings(request: Request) -> List[DeviceRecordingModel]:
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    return device_manager.get_recordings()
+
+@camera_router.get('/devices/{bus_info}/snapshot', summary='Get a still frame of a device stream', response_class=Response)
+async def get_snapshot(request: Request, bus_info: str):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    snapshot = await device_manager.get_snapshot(bus_info)
+    if snapshot is None:
+        # the stream is not running
+        return Response(status_code=503)
+
+    return Response(content=snapshot, media_type='image/jpeg')
+
 @camera_router.post('/devices/configure_stream', summary='Configure a stream')
 async def configure_stream(request: Request, stream_info: StreamInfoModel):
     device_manager: DeviceManager = request.app.state.device_manager
@@ -22,6 +45,38 @@ async def configure_stream(request: Request, stream_info: StreamInfoModel):
 
     return {}
 
+@camera_router.post('/devices/prepare_stream', summary='Build the pipeline of a stream ahead of configuring it')
+def prepare_stream(request: Request, stream_info: StreamInfoModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.prepare_device_stream(stream_info)
+
+    return {}
+
+@camera_router.post('/devices/add_stream_endpoint', summary='Add a client to a running stream')
+def add_stream_endpoint(request: Request, stream_endpoint: StreamEndpointDescriptorModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.add_stream_endpoint(stream_endpoint.bus_info, stream_endpoint.endpoint)
+
+    return {}
+
+@camera_router.post('/devices/remove_stream_endpoint', summary='Remove a client from a running stream')
+def remove_stream_endpoint(request: Request, stream_endpoint: StreamEndpointDescriptorModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.remove_stream_endpoint(stream_endpoint.bus_info, stream_endpoint.endpoint)
+
+    return {}
+
+@camera_router.post('/devices/request_keyframe', summary='Make a running stream send a keyframe')
+def request_keyframe(request: Request, device_descriptor: DeviceDescriptorModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.request_device_keyframe(device_descriptor.bus_info)
+
+    return {}
+
 @camera_router.post('/devices/unconfigure_stream', summary='Unconfigure a stream')
 def unconfigure_stream(request: Request, device_descriptor: DeviceDescriptorModel):
     device_manager: DeviceManager = request.app.state.device_manager
@@ -32,6 +87,84 @@ def unconfigure_stream(request: Request, device_descriptor: DeviceDescriptorMode
 
     return {}
 
+@camera_router.post('/devices/refresh_formats', summary='Enumerate the formats of a device again')
+def refresh_formats(request: Request, device_descriptor: DeviceDescriptorModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.refresh_device_formats(device_descriptor.bus_info)
+
+    return {}
+
+@camera_router.post('/devices/refresh_controls', summary='Read the controls of a device back from the camera')
+def refresh_controls(request: Request, device_descriptor: DeviceDescriptorModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.refresh_device_controls(device_descriptor.bus_info)
+
+    return {}
+
+@camera_router.post('/devices/clear_format_cache', summary='Clear the cached formats of all camera models')
+def clear_format_cache(request: Request):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.clear_format_cache()
+
+    return {}
+
+@camera_router.post('/devices/start_recording', summary='Record a stream into segments while streaming')
+def start_recording(request: Request, recording: StartRecordingModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.start_device_recording(recording.bus_info, recording.segment_duration, recording.container)
+
+    return {}
+
+@camera_router.post('/devices/stop_recording', summary='Stop recording a stream')
+def stop_recording(request: Request, device_descriptor: DeviceDescriptorModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.stop_device_recording(device_descriptor.bus_info)
+
+    return {}
+
+@camera_router.post('/devices/set_latency_profile', summary='Choose between smooth and low latency streaming')
+def set_latency_profile(request: Request, latency_profile: DeviceLatencyProfileModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.set_device_latency_profile(latency_profile.bus_info, latency_profile.latency_profile)
+
+    return {}
+
+@camera_router.post('/devices/set_encoder', summary='Select the encoder of a software H.264 stream')
+def set_encoder(request: Request, device_encoder: DeviceEncoderModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.set_device_encoder(device_encoder.bus_info, device_encoder.encoder)
+
+    return {}
+
+@camera_router.post('/devices/calibrate_encoder', summary='Benchmark the encoders and select the fastest one')
+async def calibrate_encoder(request: Request, device_descriptor: DeviceDescriptorModel) -> List[EncoderCalibrationModel]:
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    return await device_manager.calibrate_device_encoder(device_descriptor.bus_info)
+
+@camera_router.post('/devices/set_frame_tap', summary='Share the frames of a device with local processes')
+def set_frame_tap(request: Request, frame_tap: DeviceFrameTapModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.set_device_frame_tap(frame_tap.bus_info, frame_tap.enabled)
+
+    return {}
+
+@camera_router.post('/devices/set_stall_watchdog', summary='Configure the stalled stream watchdog of a device')
+def set_stall_watchdog(request: Request, stall_watchdog: DeviceStallWatchdogModel):
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    device_manager.set_device_stall_watchdog(stall_watchdog.bus_info, stall_watchdog.enabled, stall_watchdog.timeout)
+
+    return {}
+
 @camera_router.post('/devices/set_nickname', summary='Set a device nickname')
 def set_nickname(request: Request, device_nickname: DeviceNicknameModel):
     device_manager: DeviceManager = request.app.state.device_manager
@@ -50,6 +183,13 @@ def set_uvc_control(request: Request, uvc_control: UVCControlModel):
 
     return {}
 
+@camera_router.post('/devices/set_uvc_controls', summary='Set multiple UVC controls at once')
+def set_uvc_controls(request: Request, uvc_controls: UVCControlsModel) -> List[UVCControlErrorModel]:
+    device_manager: DeviceManager = request.app.state.device_manager
+
+    controls = {control.control_id: control.value for control in uvc_controls.controls}
+    return device_manager.set_device_uvc_controls(uvc_controls.bus_info, controls)
+
 @camera_router.post('/devices/set_leader', summary='Set a device as a leader')
 def set_leader(request: Request, device_leader: DeviceLeaderModel):
     device_manager: DeviceManager = request.app.state.device_manager
@@ -40,7 +40,10 @@ class Server:
 
         # Device Manager
         self.device_manager = DeviceManager(
-            settings_manager=self.settings_manager, sio=self.sio
+            settings_manager=self.settings_manager,
+            sio=self.sio,
+            format_cache=FormatCache(settings_path),
+            recordings_path=f"{settings_path}/recordings",
         )
 
         # Lights
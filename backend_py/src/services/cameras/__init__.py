@@ -1,11 +1,24 @@
 from .device_manager import *
-from .device_utils import *
+from .device_registry import *
 from .device import *
 from .ehd_controls import *
 from .ehd import *
+from .controls import *
 from .enumeration import *
+from .format_cache import *
+from .hotplug import *
+from .pipeline_engine import *
 from .pydantic_schemas import *
 from .settings import *
 from .shd import *
 from .stream import *
+from .stream_stats import *
+from .stream_supervisor import *
+from .stall_watchdog import *
+from .gst_stderr import *
 from .exceptions import *
+from .shm_client import *
+from .recording_stats import *
+from .rtsp_server import *
+from .snapshot_cache import *
+from .encoders import *
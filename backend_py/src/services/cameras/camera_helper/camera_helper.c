@@ -1,3 +1,4 @@
+#include <errno.h>
 #include <fcntl.h>
 #include <linux/usb/video.h>
 #include <linux/uvcvideo.h>
@@ -9,6 +10,8 @@
 #include <sys/ioctl.h>
 #include <unistd.h>
 
+#define EHD_DEVICE_TAG 0x9A
+
 int uvc_set_ctrl(
     int fd, uint32_t unit, uint32_t ctrl, uint8_t *data, uint8_t size)
 {
@@ -41,6 +44,73 @@ int uvc_get_ctrl(
     return ret;
 }
 
+/* Largest payload of an extension unit control */
+#define UVC_XU_MAX_SIZE 64
+
+struct uvc_xu_transaction
+{
+    uint8_t unit;
+    uint8_t selector;
+    uint8_t command;
+    /* UVC_SET_CUR or UVC_GET_CUR */
+    uint8_t query;
+    uint16_t size;
+    uint8_t *data;
+    /* errno of the first failed ioctl, 0 on success */
+    int32_t error;
+};
+
+/*
+ * Execute a list of extension unit transactions. Each transaction switches the
+ * command of the selector and then sets or gets its payload.
+ * Returns the number of failed transactions.
+ */
+int uvc_xu_transact(int fd, struct uvc_xu_transaction *transactions, int count)
+{
+    /* The command switch is the same for every transaction apart from the command */
+    uint8_t switch_data[UVC_XU_MAX_SIZE] = {0};
+    struct uvc_xu_control_query xctrlq;
+    int failed = 0;
+
+    switch_data[0] = EHD_DEVICE_TAG;
+    for (int i = 0; i < count; i++)
+    {
+        struct uvc_xu_transaction *transaction = &transactions[i];
+        transaction->error = 0;
+        if (transaction->size > UVC_XU_MAX_SIZE)
+        {
+            transaction->error = EINVAL;
+            failed++;
+            continue;
+        }
+
+        xctrlq.unit = transaction->unit;
+        xctrlq.selector = transaction->selector;
+        xctrlq.size = transaction->size;
+
+        /* Switch command */
+        switch_data[1] = transaction->command;
+        xctrlq.query = UVC_SET_CUR;
+        xctrlq.data = switch_data;
+        if (ioctl(fd, UVCIOC_CTRL_QUERY, &xctrlq) < 0)
+        {
+            /* The selector still has the previous command, so the payload would go to the wrong one */
+            transaction->error = errno;
+            failed++;
+            continue;
+        }
+
+        xctrlq.query = transaction->query;
+        xctrlq.data = transaction->data;
+        if (ioctl(fd, UVCIOC_CTRL_QUERY, &xctrlq) < 0)
+        {
+            transaction->error = errno;
+            failed++;
+        }
+    }
+    return failed;
+}
+
 int query_menu_name(int fd, int control_id, int mindex, char *name)
 {
     struct v4l2_querymenu qmenu;
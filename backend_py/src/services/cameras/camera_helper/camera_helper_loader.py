@@ -1,11 +1,37 @@
-from ctypes import CDLL
+from ctypes import CDLL, Structure, POINTER, c_int, c_int32, c_uint8, c_uint16
 import os
 import subprocess
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 CAMERA_HELPER_SO_FILE = f'{dir_path}/build/camera_helper.so'
+CAMERA_HELPER_SOURCE_FILE = f'{dir_path}/camera_helper.c'
 
-if not os.path.exists(CAMERA_HELPER_SO_FILE):
+# rebuild when the source has changed, so new functions are always available
+if (not os.path.exists(CAMERA_HELPER_SO_FILE)
+        or os.path.getmtime(CAMERA_HELPER_SO_FILE) < os.path.getmtime(CAMERA_HELPER_SOURCE_FILE)):
     subprocess.call(['sh', 'build.sh'], cwd=f'{dir_path}')
 
 camera_helper = CDLL(CAMERA_HELPER_SO_FILE)
+
+# UVC request codes, see linux/usb/video.h
+UVC_SET_CUR = 0x01
+UVC_GET_CUR = 0x81
+
+
+class uvc_xu_transaction(Structure):
+    '''
+    Extension unit transaction executed by uvc_xu_transact, see camera_helper.c
+    '''
+    _fields_ = [
+        ('unit', c_uint8),
+        ('selector', c_uint8),
+        ('command', c_uint8),
+        ('query', c_uint8),
+        ('size', c_uint16),
+        ('data', POINTER(c_uint8)),
+        ('error', c_int32),
+    ]
+
+
+camera_helper.uvc_xu_transact.argtypes = [c_int, POINTER(uvc_xu_transaction), c_int]
+camera_helper.uvc_xu_transact.restype = c_int
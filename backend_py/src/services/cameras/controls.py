@@ -0,0 +1,208 @@
+from typing import Dict, Iterable, List
+import threading
+import fcntl
+import ctypes
+import logging
+
+from . import v4l2
+from .pydantic_schemas import ControlModel, ControlFlagsModel, ControlTypeEnum, MenuItemModel
+
+# Controls which do not have a value that can be read
+_VALUELESS_CONTROL_TYPES = (ControlTypeEnum.BUTTON, ControlTypeEnum.CTRL_CLASS)
+
+
+class ControlInfo:
+    '''
+    Metadata of a control, shared between every device of the same camera model
+    '''
+
+    def __init__(self, control_id: int, name: str, flags: ControlFlagsModel, v4l2_flags: int) -> None:
+        self.control_id = control_id
+        self.name = name
+        self.flags = flags
+        self.v4l2_flags = v4l2_flags
+
+    @property
+    def control_class(self) -> int:
+        return v4l2.V4L2_CTRL_ID2CLASS(self.control_id)
+
+    @property
+    def is_readable(self) -> bool:
+        return (self.flags.control_type not in _VALUELESS_CONTROL_TYPES
+                and not self.v4l2_flags & v4l2.V4L2_CTRL_FLAG_WRITE_ONLY)
+
+    def create_model(self, value: float) -> ControlModel:
+        # the flags are shared by every device of the model, so each device gets its own copy
+        return ControlModel(
+            control_id=self.control_id, name=self.name, value=value, flags=self.flags.model_copy(deep=True)
+        )
+
+
+def query_controls(fd: int) -> List[ControlInfo]:
+    '''
+    Enumerate the controls of a video node with VIDIOC_QUERYCTRL
+    '''
+    controls: List[ControlInfo] = []
+    queryctrl = v4l2.v4l2_queryctrl()
+    queryctrl.id = v4l2.V4L2_CTRL_FLAG_NEXT_CTRL
+    while True:
+        try:
+            fcntl.ioctl(fd, v4l2.VIDIOC_QUERYCTRL, queryctrl)
+        except OSError:
+            break
+        control_id = queryctrl.id
+        queryctrl.id = control_id | v4l2.V4L2_CTRL_FLAG_NEXT_CTRL
+
+        if queryctrl.flags & v4l2.V4L2_CTRL_FLAG_DISABLED:
+            continue
+        try:
+            control_type = ControlTypeEnum(queryctrl.type)
+        except ValueError:
+            # compound controls are not supported
+            continue
+        if control_type == ControlTypeEnum.CTRL_CLASS:
+            continue
+
+        menu: List[MenuItemModel] = []
+        if control_type == ControlTypeEnum.MENU:
+            menu = _query_menu(fd, control_id, queryctrl.minimum, queryctrl.maximum)
+
+        flags = ControlFlagsModel(
+            default_value=queryctrl.default,
+            max_value=queryctrl.maximum,
+            min_value=queryctrl.minimum,
+            step=queryctrl.step,
+            control_type=control_type,
+            menu=menu,
+        )
+        controls.append(ControlInfo(control_id, queryctrl.name.decode(), flags, queryctrl.flags))
+    return controls
+
+
+def _query_menu(fd: int, control_id: int, minimum: int, maximum: int) -> List[MenuItemModel]:
+    menu: List[MenuItemModel] = []
+    querymenu = v4l2.v4l2_querymenu()
+    querymenu.id = control_id
+    for i in range(minimum, maximum + 1):
+        querymenu.index = i
+        try:
+            fcntl.ioctl(fd, v4l2.VIDIOC_QUERYMENU, querymenu)
+        except OSError:
+            # menus can have gaps
+            continue
+        menu.append(MenuItemModel(index=i, name=querymenu.name.decode()))
+    return menu
+
+
+def read_control_values(fd: int, controls: Iterable[ControlInfo]) -> Dict[int, int]:
+    '''
+    Read the current value of the controls with one VIDIOC_G_EXT_CTRLS call per control class
+
+    :return: The values keyed by control id, controls which could not be read are left out
+    '''
+    control_classes: Dict[int, List[int]] = {}
+    for control in controls:
+        if control.is_readable:
+            control_classes.setdefault(control.control_class, []).append(control.control_id)
+
+    values: Dict[int, int] = {}
+    for control_class, control_ids in control_classes.items():
+        ext_controls = (v4l2.v4l2_ext_control * len(control_ids))()
+        for ext_control, control_id in zip(ext_controls, control_ids):
+            ext_control.id = control_id
+
+        request = v4l2.v4l2_ext_controls()
+        request.ctrl_class = control_class
+        request.count = len(control_ids)
+        request.controls = ctypes.cast(ext_controls, ctypes.POINTER(v4l2.v4l2_ext_control))
+        try:
+            fcntl.ioctl(fd, v4l2.VIDIOC_G_EXT_CTRLS, request)
+        except OSError as e:
+            # Fall back to reading the controls one at a time, so one bad control does not fail the others
+            logging.debug(f'Batched control read failed for class {hex(control_class)}: {e}')
+            values.update(_read_control_values_individually(fd, control_ids))
+            continue
+        for ext_control in ext_controls:
+            values[ext_control.id] = ext_control.value
+    return values
+
+
+def _read_control_values_individually(fd: int, control_ids: List[int]) -> Dict[int, int]:
+    values: Dict[int, int] = {}
+    for control_id in control_ids:
+        control = v4l2.v4l2_control()
+        control.id = control_id
+        try:
+            fcntl.ioctl(fd, v4l2.VIDIOC_G_CTRL, control)
+        except OSError:
+            continue
+        values[control_id] = control.value
+    return values
+
+
+def write_control_values(fd: int, values: Dict[int, int]) -> Dict[int, str]:
+    '''
+    Set controls with one VIDIOC_S_EXT_CTRLS call per control class
+
+    :return: The error of every control that could not be set, keyed by control id
+    '''
+    control_classes: Dict[int, Dict[int, int]] = {}
+    for control_id, value in values.items():
+        control_classes.setdefault(v4l2.V4L2_CTRL_ID2CLASS(control_id), {})[control_id] = value
+
+    errors: Dict[int, str] = {}
+    for control_class, class_values in control_classes.items():
+        ext_controls = (v4l2.v4l2_ext_control * len(class_values))()
+        for ext_control, (control_id, value) in zip(ext_controls, class_values.items()):
+            ext_control.id = control_id
+            ext_control.value = value
+
+        request = v4l2.v4l2_ext_controls()
+        request.ctrl_class = control_class
+        request.count = len(class_values)
+        request.controls = ctypes.cast(ext_controls, ctypes.POINTER(v4l2.v4l2_ext_control))
+        try:
+            fcntl.ioctl(fd, v4l2.VIDIOC_S_EXT_CTRLS, request)
+        except OSError as e:
+            # The kernel only reports the first failing control, and may have applied the controls before it,
+            # so set the class one control at a time to find out which controls fail
+            logging.debug(f'Batched control write failed for class {hex(control_class)}: {e}')
+            errors.update(_write_control_values_individually(fd, class_values))
+    return errors
+
+
+def _write_control_values_individually(fd: int, values: Dict[int, int]) -> Dict[int, str]:
+    errors: Dict[int, str] = {}
+    for control_id, value in values.items():
+        control = v4l2.v4l2_control()
+        control.id = control_id
+        control.value = value
+        try:
+            fcntl.ioctl(fd, v4l2.VIDIOC_S_CTRL, control)
+        except OSError as e:
+            errors[control_id] = e.strerror
+    return errors
+
+
+class ControlInfoCache:
+    '''
+    Control metadata keyed by camera model, so it is only queried for the first device of a model
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._controls: Dict[str, List[ControlInfo]] = {}
+
+    def get_controls(self, fd: int, key: str | None) -> List[ControlInfo]:
+        if key is None:
+            return query_controls(fd)
+        with self._lock:
+            controls = self._controls.get(key)
+        if controls is None:
+            controls = query_controls(fd)
+            with self._lock:
+                self._controls[key] = controls
+        return controls
+
+
+control_info_cache = ControlInfoCache()
@@ -1,12 +1,13 @@
 from ctypes import *
 import struct
-from dataclasses import dataclass
-from typing import Dict, Callable, Any, Tuple
+import os
+import threading
+from dataclasses import dataclass, replace
+from typing import Dict, Callable, Any, List, Tuple
 from abc import ABC, abstractmethod
 
 import event_emitter as events
 
-from linuxpy.video import device
 from enum import Enum
 
 from . import v4l2
@@ -16,7 +17,15 @@ from .stream_utils import fourcc2s
 from .enumeration import *
 from .camera_helper.camera_helper_loader import *
 from .stream import *
+from .pipeline_engine import PipelineEngineType
+from .stream_stats import StreamStatsHistory
+from .stall_watchdog import StallWatchdog
+from .recording_stats import RecordingStats, next_segment_index
+from .snapshot_cache import SnapshotCache
+from .shm_client import ShmFrameClient
 from .stream_utils import string_to_stream_encode_type
+from .format_cache import FormatCache, get_format_cache_key
+from .controls import control_info_cache, read_control_values, write_control_values
 from .pydantic_schemas import *
 from .saved_pydantic_schemas import *
 
@@ -50,11 +59,22 @@ class Camera:
     Camera base class
     """
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, format_cache: FormatCache | None = None) -> None:
         self.path = path
         self._file_object = open(path)
         self._fd = self._file_object.fileno()  # get the file descriptor
-        self._get_formats()
+        self._format_cache = format_cache
+        # Held across the extension unit transactions of an option and the packing and unpacking of its buffer, which
+        # run concurrently from the request threads
+        self.xu_lock = threading.RLock()
+        # Identifies the camera model and firmware of this node
+        self.model_key = get_format_cache_key(path)
+
+        self.formats: Dict[str, List[FormatSizeModel]] = None
+        if self._format_cache and self.model_key:
+            self.formats = self._format_cache.get(self.model_key)
+        if self.formats is None:
+            self.refresh_formats()
 
     # uvc_set_ctrl function defined in uvc_functions.c
     def uvc_set_ctrl(
@@ -68,9 +88,28 @@ class Camera:
     ) -> int:
         return camera_helper.uvc_get_ctrl(self._fd, unit, ctrl, data, size)
 
+    # uvc_xu_transact function defined in camera_helper.c
+    def uvc_xu_transact(self, transactions, count: int = 1) -> int:
+        """
+        Execute extension unit transactions in one call
+
+        :param transactions: A uvc_xu_transaction or an array of them
+        :param count: The number of transactions
+        :return: The number of failed transactions, the error of each is set on the transaction
+        """
+        return camera_helper.uvc_xu_transact(self._fd, transactions, count)
+
     def has_format(self, pixformat: str) -> bool:
         return pixformat in self.formats.keys()
 
+    def refresh_formats(self):
+        """
+        Enumerate the formats with ioctls and update the format cache
+        """
+        self._get_formats()
+        if self._format_cache and self.model_key:
+            self._format_cache.put(self.model_key, self.formats)
+
     def _get_formats(self):
         self.formats: Dict[str, List[FormatSizeModel]] = {}
         for i in range(1000):
@@ -132,6 +171,12 @@ class BaseOption(ABC):
     def set_value(self, value):
         pass
 
+    def invalidate(self):
+        """
+        Forget any cached value, so it is read from the device the next time
+        """
+        pass
+
 
 class Option(BaseOption):
     """
@@ -161,13 +206,31 @@ class Option(BaseOption):
         self._ctrl = ctrl
         self._command = command
         self._size = size
-        self._data = b"\x00" * size
+        # Preallocated so reading or writing the option does not allocate new buffers
+        self._data = (c_uint8 * size)()
+        self._get_transaction = self._create_transaction(UVC_GET_CUR)
+        self._set_transaction = self._create_transaction(UVC_SET_CUR)
+
+        # Value cached after the first readback or write, so the device is not queried every time
+        self._value: Any = None
+        self._cached = False
+
+    def _create_transaction(self, query: int) -> uvc_xu_transaction:
+        return uvc_xu_transaction(
+            unit=self._unit.value,
+            selector=self._ctrl.value,
+            command=self._command.value,
+            query=query,
+            size=self._size,
+            data=self._data,
+        )
 
     # get the control value(s)
     def get_value_raw(self):
-        self._get_ctrl()
-        values = self._unpack(self._fmt)
-        self._clear()
+        with self._camera.xu_lock:
+            self._get_ctrl()
+            values = self._unpack(self._fmt)
+            self._clear()
         # all cases will basically be this, but otherwise this will still work
         if len(values) == 1:
             return values[0]
@@ -175,69 +238,114 @@ class Option(BaseOption):
 
     # set the control value
     def set_value_raw(self, *arg: list):
-        self._pack(self._fmt, *arg)
-        self._set_ctrl()
-        self._clear()
+        with self._camera.xu_lock:
+            self._pack(self._fmt, *arg)
+            self._set_ctrl()
+            self._clear()
 
     def set_value(self, value):
-        converted = self._conversion_func_set(value)
-        if type(converted) == list:
-            self.set_value_raw(*converted)
-        else:
-            self.set_value_raw(converted)
+        with self._camera.xu_lock:
+            if self._cached and value == self._value:
+                # the device already has this value
+                return
+            converted = self._conversion_func_set(value)
+            if type(converted) == list:
+                self.set_value_raw(*converted)
+            else:
+                self.set_value_raw(converted)
+
+            error = self._set_transaction.error
+            if error:
+                self._cached = False
+                raise OSError(error, os.strerror(error))
+            self._value = value
+            self._cached = True
 
     def get_value(self):
-        return self._conversion_func_get(self.get_value_raw())
+        with self._camera.xu_lock:
+            if not self._cached:
+                value = self._conversion_func_get(self.get_value_raw())
+                # do not cache failed reads
+                if self._get_transaction.error:
+                    return value
+                self._cache_value(value)
+            return self._value
+
+    def invalidate(self):
+        self._cached = False
+
+    def _cache_value(self, value):
+        self._value = value
+        self._cached = True
 
     # pack data to internal buffer
     def _pack(self, fmt: str, *arg: list) -> None:
-        data = struct.pack(fmt, *arg)
-        # make sure the data is of the right length
-        self._data = data + bytearray(self._size - len(data))
+        # make sure the rest of the data is zeroed
+        self._clear()
+        struct.pack_into(fmt, self._data, 0, *arg)
 
     # unpack data from internal buffer
     def _unpack(self, fmt: str) -> list:
         return struct.unpack_from(fmt, self._data)
 
+    # switch the command and set the payload in one call
     def _set_ctrl(self):
-        data = bytearray(self._size)
-        data[0] = xu.EHD_DEVICE_TAG
-        data[1] = self._command.value
+        self._camera.uvc_xu_transact(self._set_transaction)
 
-        # Switch command
-        self._camera.uvc_set_ctrl(
-            self._unit.value, self._ctrl.value, bytes(data), self._size
-        )
+    # switch the command and get the payload in one call
+    def _get_ctrl(self):
+        self._clear()
+        self._camera.uvc_xu_transact(self._get_transaction)
 
-        self._camera.uvc_set_ctrl(
-            self._unit.value, self._ctrl.value, self._data, self._size
-        )
+    def _clear(self):
+        memset(self._data, 0, self._size)
 
-    def _get_ctrl(self):
-        data = bytearray(self._size)
-        data[0] = xu.EHD_DEVICE_TAG
-        data[1] = self._command.value
-        self._data = bytes(self._size)
-        # Switch command
-        self._camera.uvc_set_ctrl(
-            self._unit.value, self._ctrl.value, bytes(data), self._size
-        )
 
-        self._camera.uvc_get_ctrl(
-            self._unit.value, self._ctrl.value, self._data, self._size
+def refresh_options(options: List[Option]):
+    """
+    Read back options with one uvc_xu_transact per camera and cache their values
+    """
+    options_by_camera: Dict[Camera, List[Option]] = {}
+    for option in options:
+        options_by_camera.setdefault(option._camera, []).append(option)
+
+    for camera, camera_options in options_by_camera.items():
+        with camera.xu_lock:
+            _refresh_camera_options(camera, camera_options)
+
+
+def _refresh_camera_options(camera: Camera, options: List[Option]):
+    transactions = (uvc_xu_transaction * len(options))()
+    for i, option in enumerate(options):
+        option._clear()
+        transactions[i] = option._get_transaction
+    camera.uvc_xu_transact(transactions, len(options))
+
+    for option, transaction in zip(options, transactions):
+        if transaction.error:
+            continue
+        values = option._unpack(option._fmt)
+        option._cache_value(
+            option._conversion_func_get(values[0] if len(values) == 1 else values)
         )
-
-    def _clear(self):
-        self._data = b"\x00" * self._size
+        option._clear()
 
 
 class Device(events.EventEmitter):
 
-    def __init__(self, device_info: DeviceInfo) -> None:
+    # Seconds to wait for the next frame of the stream when taking a snapshot
+    SNAPSHOT_TIMEOUT = 1.0
+
+    def __init__(
+        self,
+        device_info: DeviceInfo,
+        format_cache: FormatCache | None = None,
+        engine_type: PipelineEngineType | None = None,
+    ) -> None:
         super().__init__()
         self.cameras: List[Camera] = []
         for device_path in device_info.device_paths:
-            self.cameras.append(Camera(device_path))
+            self.cameras.append(Camera(device_path, format_cache))
 
         self.device_info = device_info
         self.vid = device_info.vid
@@ -253,9 +361,15 @@ class Device(events.EventEmitter):
         self.bus_info = device_info.bus_info
         self.nickname = ""
         self.stream = Stream()
+        # whichever way clients are added to the running stream, they need a keyframe to start decoding
+        self.stream.on("clients_added", self.request_keyframe)
 
         # each device has a streamrunner, but not all of them are used if they are a follower (shd)
-        self.stream_runner = StreamRunner(self.stream)
+        self.stream_runner = StreamRunner(self.stream, engine_type=engine_type)
+        self.stream_stats = StreamStatsHistory()
+        self.stall_watchdog = StallWatchdog()
+        self.recording_stats: RecordingStats | None = None
+        self.snapshot_cache = SnapshotCache(self.grab_snapshot)
 
         for camera in self.cameras:
             for encoding in camera.formats:
@@ -274,8 +388,6 @@ class Device(events.EventEmitter):
                     )
                     break
 
-        self.v4l2_device = device.Device(self.cameras[0].path)  # for control purposes
-        self.v4l2_device.open()
 
         # This must be configured by the implementing class
         self._options: Dict[str, BaseOption] = self._get_options()
@@ -287,6 +399,8 @@ class Device(events.EventEmitter):
         self.controls = []
 
         self._id_counter = 1
+        # DWE control id -> option name
+        self._option_names: Dict[int, str] = {}
 
         self._get_controls()
 
@@ -294,53 +408,50 @@ class Device(events.EventEmitter):
         return {}
 
     def _get_controls(self):
-        fd = self.cameras[0]._fd
-        self.controls: List[ControlModel] = []
-
-        for ctrl in self.v4l2_device.controls.values():
-            control_type = ControlTypeEnum(ctrl.type)
-
-            max_value = 0
-            min_value = 0
-            step = 0
-
-            try:
-                max_value = ctrl.maximum
-            except:
-                pass
-
-            try:
-                min_value = ctrl.minimum
-            except:
-                pass
-
-            try:
-                step = ctrl.step
-            except:
-                pass
-
-            default_value = ctrl._info.default_value
-
-            menu: List[MenuItemModel] = []
-            match control_type:
-                case ControlTypeEnum.MENU:
-                    for i in ctrl.data:
-                        menu_item = ctrl.data[i]
-                        menu.append(MenuItemModel(index=i, name=menu_item))
-
-            flags = ControlFlagsModel(
-                default_value=default_value,
-                max_value=max_value,
-                min_value=min_value,
-                step=step,
-                control_type=control_type,
-                menu=menu,
-            )
-            control = ControlModel(
-                control_id=ctrl.id, name=ctrl.name, value=ctrl.value, flags=flags
+        camera = self.cameras[0]
+        # The metadata is only queried for the first device of a camera model
+        self._control_infos = control_info_cache.get_controls(
+            camera._fd, camera.model_key
+        )
+        self.controls: List[ControlModel] = [
+            control_info.create_model(control_info.flags.default_value)
+            for control_info in self._control_infos
+        ]
+        self._controls_by_id: Dict[int, ControlModel] = {
+            control.control_id: control for control in self.controls
+        }
+        self.refresh_control_values()
+
+    def refresh_control_values(self):
+        """
+        Read the current value of every UVC control and option from the device
+        """
+        values = read_control_values(self.cameras[0]._fd, self._control_infos)
+        for control in self.controls:
+            if control.control_id in values:
+                control.value = values[control.control_id]
+        self.refresh_options()
+
+    def refresh_options(self):
+        """
+        Drop the cached option values and read them back from the device
+        """
+        for option in self._options.values():
+            option.invalidate()
+        refresh_options(
+            [option for option in self._options.values() if isinstance(option, Option)]
+        )
+        for control_id, option_name in self._option_names.items():
+            self._controls_by_id[control_id].value = int(
+                self._options[option_name].get_value()
             )
 
-            self.controls.append(control)
+    def refresh_formats(self):
+        """
+        Enumerate the formats of every camera again, bypassing the format cache
+        """
+        for camera in self.cameras:
+            camera.refresh_formats()
 
     def find_camera_with_format(self, fmt: str) -> Camera | None:
         for cam in self.cameras:
@@ -356,20 +467,11 @@ class Device(events.EventEmitter):
         interval: IntervalModel,
         stream_type: StreamTypeEnum,
         stream_endpoints: List[StreamEndpointModel] = [],
+        multicast: MulticastOptionsModel | None = None,
     ):
         logging.info(self._fmt_log("Configuring stream"))
 
-        camera: Camera = None
-        match encode_type:
-            case StreamEncodeTypeEnum.H264:
-                camera = self.find_camera_with_format("H264")
-            case StreamEncodeTypeEnum.MJPG:
-                camera = self.find_camera_with_format("MJPG")
-            case StreamEncodeTypeEnum.SOFTWARE_H264:
-                camera = self.find_camera_with_format("MJPG")
-            case _:
-                pass
-
+        camera = self._find_stream_camera(encode_type)
         if not camera:
             logging.warn(
                 "Attempting to select incompatible encoding type. This is undefined behavior."
@@ -383,8 +485,60 @@ class Device(events.EventEmitter):
         self.stream.endpoints = stream_endpoints
         self.stream.encode_type = encode_type
         self.stream.stream_type = stream_type
+        self.stream.multicast = multicast
         self.stream.configured = True
 
+    def prepare_stream(
+        self,
+        encode_type: StreamEncodeTypeEnum,
+        width: int,
+        height: int,
+        interval: IntervalModel,
+        stream_type: StreamTypeEnum,
+        stream_endpoints: List[StreamEndpointModel] = [],
+        multicast: MulticastOptionsModel | None = None,
+    ) -> bool:
+        """
+        Build the pipeline of a stream configuration ahead of time, while the current stream keeps running, so that
+        configuring the stream with it afterwards starts without delay
+
+        :return: False if the pipeline could not be prepared
+        """
+        camera = self._find_stream_camera(encode_type)
+        if not camera:
+            return False
+
+        stream = replace(
+            self.stream,
+            device_path=camera.path,
+            width=width,
+            height=height,
+            interval=interval,
+            endpoints=stream_endpoints,
+            encode_type=encode_type,
+            stream_type=stream_type,
+            multicast=multicast,
+            configured=True,
+        )
+        stream.software_h264_bitrate = self.stream.software_h264_bitrate
+        return self.get_stream_runner().prepare_stream(stream)
+
+    def _find_stream_camera(self, encode_type: StreamEncodeTypeEnum) -> Camera | None:
+        match encode_type:
+            case StreamEncodeTypeEnum.H264:
+                return self.find_camera_with_format("H264")
+            case StreamEncodeTypeEnum.MJPG:
+                return self.find_camera_with_format("MJPG")
+            case StreamEncodeTypeEnum.SOFTWARE_H264:
+                return self.find_camera_with_format("MJPG")
+            case _:
+                return None
+
+    def _prewarm_stream(self):
+        # keep the pipeline of the stopped stream ready, so starting it again is instant
+        if self.stream.device_path and self.stream.encode_type and self.stream.width:
+            self.stream_runner.prepare_stream(self.stream)
+
     def add_control_from_option(
         self,
         option_name: str,
@@ -397,21 +551,21 @@ class Device(events.EventEmitter):
         try:
             option = self._options[option_name]
             value = int(option.get_value())
-            self.controls.insert(
-                0,
-                ControlModel(
-                    control_id=-self._id_counter,
-                    name=option.name,
-                    value=value,
-                    flags=ControlFlagsModel(
-                        default_value=default_value,
-                        max_value=max_value,
-                        min_value=min_value,
-                        step=step,
-                        control_type=control_type,
-                    ),
+            control = ControlModel(
+                control_id=-self._id_counter,
+                name=option.name,
+                value=value,
+                flags=ControlFlagsModel(
+                    default_value=default_value,
+                    max_value=max_value,
+                    min_value=min_value,
+                    step=step,
+                    control_type=control_type,
                 ),
             )
+            self.controls.insert(0, control)
+            self._controls_by_id[control.control_id] = control
+            self._option_names[control.control_id] = option_name
             self._id_counter += 1
         except AttributeError:
             logging.error(
@@ -422,14 +576,55 @@ class Device(events.EventEmitter):
     def start_stream(self):
         self.stream_runner.start()
 
+    def get_stream_runner(self) -> StreamRunner:
+        """
+        The runner whose pipeline holds the stream of this device
+        """
+        return self.stream_runner
+
+    def sample_stream_stats(self) -> StreamStatsModel | None:
+        """
+        Sample the statistics of the running stream into the stream stats history
+        """
+        return self.stream_stats.sample(self.get_stream_runner().get_counters(self.stream))
+
+    def get_time_to_first_packet(self) -> float | None:
+        """
+        The time in seconds it took the running stream to send its first frame after it was started
+        """
+        return self.get_stream_runner().get_time_to_first_packet(self.stream)
+
+    def check_stream_stalled(self) -> float | None:
+        """
+        Restart the stream if its camera stopped delivering frames
+
+        :return: The time in seconds since the last frame if the stream stalled, otherwise None
+        """
+        runner = self.get_stream_runner()
+        # the supervisor restarts the stream after its backoff, so it is not stalled meanwhile
+        if runner.restart_pending:
+            self.stall_watchdog.reset()
+            return None
+        counters = runner.get_counters(self.stream)
+        stalled_for = self.stall_watchdog.check(counters.frames if counters else None)
+        if stalled_for is None:
+            return None
+
+        logging.warning(self._fmt_log(f"No frames for {stalled_for:.1f} s, restarting the stream"))
+        runner.restart_stream(self.stream)
+        return stalled_for
+
+    def configure_stall_watchdog(self, enabled: bool, timeout: float):
+        self.stall_watchdog.configure(enabled, timeout)
+
     def load_settings(self, saved_device: SavedDeviceModel):
         logging.info(self._fmt_log("Loading device settings"))
 
-        for control in saved_device.controls:
-            try:
-                self.set_pu(control.control_id, control.value)
-            except:
-                continue
+        errors = self.apply_controls(
+            {control.control_id: control.value for control in saved_device.controls}
+        )
+        for control_id, error in errors.items():
+            logging.debug(self._fmt_log(f"Error loading control {control_id}: {error}"))
 
         self.configure_stream(
             saved_device.stream.encode_type,
@@ -438,43 +633,239 @@ class Device(events.EventEmitter):
             saved_device.stream.interval,
             saved_device.stream.stream_type,
             saved_device.stream.endpoints,
+            saved_device.stream.multicast,
         )
         self.stream.configured = saved_device.stream.configured
+        self.stream.frame_tap = bool(saved_device.stream.frame_tap)
+        if saved_device.stream.encoder:
+            self.stream.encoder = saved_device.stream.encoder
+        if saved_device.stream.latency_profile:
+            self.stream.latency_profile = saved_device.stream.latency_profile
         self.nickname = saved_device.nickname
+        if saved_device.stall_watchdog:
+            self.configure_stall_watchdog(
+                saved_device.stall_watchdog.enabled, saved_device.stall_watchdog.timeout
+            )
+        if self.stream.configured:
+            self.start_stream()
+        else:
+            self._prewarm_stream()
+
+    def add_stream_endpoint(self, endpoint: StreamEndpointModel) -> bool:
+        """
+        Add a client to the stream, without restarting the pipeline when it is running
+
+        :return: False if the stream already has the endpoint
+        """
+        if endpoint in self.stream.endpoints:
+            return False
+        self.stream.endpoints = [*self.stream.endpoints, endpoint]
+        self._update_stream_endpoints()
+        return True
+
+    def remove_stream_endpoint(self, endpoint: StreamEndpointModel) -> bool:
+        """
+        Remove a client from the stream, without restarting the pipeline when it is running
+
+        :return: False if the stream does not have the endpoint
+        """
+        if endpoint not in self.stream.endpoints:
+            return False
+        self.stream.endpoints = [
+            stream_endpoint
+            for stream_endpoint in self.stream.endpoints
+            if stream_endpoint != endpoint
+        ]
+        self._update_stream_endpoints()
+        return True
+
+    def request_keyframe(self) -> bool:
+        """
+        Make the running stream send a keyframe now, instead of at the end of the current group of pictures
+
+        :return: False if the stream is not running or its encoder cannot be asked for a keyframe
+        """
+        if not self.get_stream_runner().started:
+            return False
+        match self.stream.encode_type:
+            case StreamEncodeTypeEnum.MJPG:
+                # every frame is a keyframe
+                return True
+            case StreamEncodeTypeEnum.SOFTWARE_H264:
+                return self.get_stream_runner().request_keyframe(self.stream)
+            case _:
+                return self._request_camera_keyframe()
+
+    def _request_camera_keyframe(self) -> bool:
+        """
+        Make the H.264 encoder of the camera send a keyframe, which only some models support
+        """
+        return False
+
+    def grab_snapshot(self) -> bytes | None:
+        """
+        Take the next frame of the running stream as JPEG, without opening the camera
+
+        :return: The frame, or None if the stream is not running or its frames cannot be read
+        """
+        snapshot = self.get_stream_runner().pull_snapshot(
+            self.stream, self.SNAPSHOT_TIMEOUT, self.request_keyframe
+        )
+        # without the in-process engine, the frame tap has the JPEG frames of the camera
+        if snapshot is None and self.stream.frame_tap and self.stream.encode_type != StreamEncodeTypeEnum.H264:
+            snapshot = self._read_frame_tap()
+        return snapshot
+
+    def _read_frame_tap(self) -> bytes | None:
+        try:
+            client = ShmFrameClient(self.stream.frame_tap_path)
+            client.connect(self.SNAPSHOT_TIMEOUT)
+            try:
+                with client.read_frame() as frame:
+                    return bytes(frame.data)
+            finally:
+                client.close()
+        except OSError as e:
+            logging.debug(self._fmt_log(f"Failed to read the frame tap: {e}"))
+            return None
+
+    def start_recording(
+        self, location: str, segment_duration: int, container: RecordingContainerEnum
+    ) -> bool:
+        """
+        Record the stream into segments alongside streaming it
+
+        :param location: The location of the segments, with a printf format for the segment index
+        :return: False if the stream is not configured
+        """
+        if not self.stream.configured:
+            logging.warning(self._fmt_log("Cannot record a stream which is not configured"))
+            return False
+
+        logging.info(self._fmt_log(f"Recording to {location}"))
+        self.stream.recording = RecordingModel(
+            location=location, segment_duration=segment_duration, container=container
+        )
+        # the same index the recording branch passes to splitmuxsink as its start-index
+        self.recording_stats = RecordingStats(location, start_index=next_segment_index(location))
+        self.start_stream()
+        return True
+
+    def stop_recording(self) -> List[RecordingSegmentModel]:
+        """
+        :return: The segments completed by stopping the recording
+        """
+        if not self.stream.recording:
+            return []
+        self.stream.recording = None
+        if self.stream.configured:
+            self.start_stream()
+
+        logging.info(self._fmt_log("Recording stopped"))
+        return self.recording_stats.finish()
+
+    def sample_recording(self) -> List[RecordingSegmentModel]:
+        """
+        :return: The segments completed since the previous sample
+        """
+        if not self.stream.recording:
+            return []
+        return self.recording_stats.sample()
+
+    def get_recording_segments(self) -> List[RecordingSegmentModel]:
+        return self.recording_stats.get_segments() if self.recording_stats else []
+
+    def set_latency_profile(self, latency_profile: StreamLatencyProfileEnum):
+        self.stream.latency_profile = latency_profile
+        if self.stream.configured:
+            self.start_stream()
+
+    def set_encoder(self, encoder: EncoderModel):
+        """
+        Select the encoder of the SOFTWARE_H264 encode type
+        """
+        self.stream.encoder = encoder
+        if self.stream.configured:
+            self.start_stream()
+
+    def set_frame_tap(self, enabled: bool):
+        """
+        Share the frames of the camera with local processes over shared memory, see shm_client.py
+        """
+        self.stream.frame_tap = enabled
+        if self.stream.configured:
+            self.start_stream()
+
+    def _update_stream_endpoints(self):
+        # the runner adds or removes only the changed clients on a running pipeline
         if self.stream.configured:
             self.start_stream()
 
     def unconfigure_stream(self):
         self.stream.configured = False
         self.stream_runner.stop()
+        if self.stream.recording:
+            self.stream.recording = None
+            self.recording_stats.finish()
+        self._prewarm_stream()
 
         logging.info(self._fmt_log(f"Stream stopped"))
 
     def get_pu(self, control_id: int):
-        control = self.v4l2_device.controls[control_id]
-        return control.value
+        control_infos = [
+            control_info
+            for control_info in self._control_infos
+            if control_info.control_id == control_id
+        ]
+        return read_control_values(self.cameras[0]._fd, control_infos).get(control_id)
 
     def set_pu(self, control_id: int, value: int):
-        if control_id < 0:
-            # DWE control
-            for control in self.controls:
-                if control.control_id == control_id:
-                    control.value = value
-                    for option_name in self._options:
-                        if self._options[option_name].name == control.name:
-                            self.set_option(option_name, value)
-                            return
-            return  # in case the id does not exist in controls
-
-        control = self.v4l2_device.controls[control_id]
-        logging.debug(self._fmt_log(f"Setting UVC control - {control.name} to {value}"))
+        errors = self.apply_controls({control_id: value})
+        if control_id in errors:
+            logging.debug(f"Error setting control value: {errors[control_id]}")
+
+    def apply_controls(self, values: Dict[int, float]) -> Dict[int, str]:
+        """
+        Set multiple controls at once
+
+        Standard UVC controls are set with one VIDIOC_S_EXT_CTRLS per control class, and DWE controls
+        (negative ids) are set through their options.
+
+        :param values: The values keyed by control id
+        :return: The error of every control that could not be set, keyed by control id
+        """
+        errors: Dict[int, str] = {}
+        uvc_values: Dict[int, int] = {}
+        for control_id, value in values.items():
+            if control_id not in self._controls_by_id:
+                errors[control_id] = "Unknown control"
+            elif control_id < 0:
+                # DWE control
+                error = self._set_dwe_control(control_id, value)
+                if error:
+                    errors[control_id] = error
+            else:
+                uvc_values[control_id] = int(value)
+
+        if uvc_values:
+            logging.debug(self._fmt_log(f"Setting UVC controls - {uvc_values}"))
+            errors.update(write_control_values(self.cameras[0]._fd, uvc_values))
+
+        for control_id, value in uvc_values.items():
+            if control_id not in errors:
+                self._controls_by_id[control_id].value = value
+        return errors
+
+    def _set_dwe_control(self, control_id: int, value: float) -> str | None:
+        option_name = self._option_names.get(control_id)
+        if not option_name:
+            return "Unknown option"
         try:
-            control.value = value
-        except (AttributeError, PermissionError) as e:
-            logging.debug(f"Error setting control value: {e.strerror}")
-        for ctrl in self.controls:
-            if ctrl.control_id == control_id:
-                ctrl.value = value
+            self.set_option(option_name, value)
+        except OSError as e:
+            return e.strerror
+        self._controls_by_id[control_id].value = value
+        return None
 
     # get an option
     def get_option(self, opt: str) -> Any:
@@ -3,15 +3,22 @@ import logging
 import time
 import threading
 import re
+import os
 import event_emitter as events
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 from .pydantic_schemas import *
 from .device import Device, lookup_pid_vid, DeviceInfo, DeviceType
 from .settings import SettingsManager
-from .enumeration import list_devices
-from .device_utils import list_diff, find_device_with_bus_info
+from .enumeration import DeviceEnumerator
+from .hotplug import HotplugMode, HotplugWatcher, UEventSource
+from .format_cache import FormatCache
+from .pipeline_engine import PipelineEngineType
+from .device_registry import DeviceRegistry, diff_device_infos
 from .exceptions import DeviceNotFoundException
+from .rtsp_server import RtspServer
+from .encoders import CALIBRATION_CANDIDATES, CALIBRATION_FRAMES, DEFAULT_RAW_FORMAT, calibrate_encoders, jpeg_raw_format
 
 import socketio
 
@@ -43,11 +50,44 @@ class DeviceManager(events.EventEmitter):
     Class for interfacing with and monitoring devices
     '''
 
-    def __init__(self, sio: socketio.Server, settings_manager=SettingsManager()) -> None:
-        self.devices: List[Device] = []
+    # Interval used for polling, and for retrying nodes which were not ready when their uevent arrived
+    POLLING_INTERVAL = 0.1
+    # Time to keep retrying a node which could not be queried after a uevent
+    NODE_READY_TIMEOUT = 5
+    # Maximum number of devices which are constructed at the same time
+    MAX_CONSTRUCTION_WORKERS = 4
+    # Interval between stream stats samples
+    STREAM_STATS_INTERVAL = 1
+    # Minimum interval between stream stats events, so the clients are not flooded
+    STREAM_STATS_EMIT_INTERVAL = 2
+
+    def __init__(self, sio: socketio.Server, settings_manager: SettingsManager | None = None,
+                 hotplug_mode: HotplugMode = HotplugMode.UEVENT, uevent_source: UEventSource | None = None,
+                 format_cache: FormatCache | None = None, engine_type: PipelineEngineType | None = None,
+                 recordings_path: str = 'recordings', rtsp_server: RtspServer | None = None) -> None:
+        self.devices = DeviceRegistry()
         self.sio = sio
-        self.settings_manager = settings_manager
+        # Not a default argument, since that would create the settings file (and sync thread) on import
+        self.settings_manager = settings_manager if settings_manager else SettingsManager()
+        # Formats are enumerated with ioctls every time when there is no cache
+        self.format_cache = format_cache
+        # None picks the in-process engine when it is available
+        self.engine_type = engine_type
+        # Directory the recordings of all devices are written to
+        self.recordings_path = recordings_path
+        # Serves the streams with the RTSP stream type
+        self.rtsp_server = rtsp_server if rtsp_server else RtspServer()
         self._is_monitoring = False
+        self.hotplug_mode = hotplug_mode
+        self.enumerator = DeviceEnumerator()
+        self._hotplug_watcher = HotplugWatcher(uevent_source)
+        # Nodes with a uevent which could not be queried yet, mapped to their retry deadline
+        self._pending_nodes: Dict[str, float] = {}
+        # Devices are constructed in worker threads, since opening them blocks on ioctls
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_CONSTRUCTION_WORKERS, thread_name_prefix='device_init')
+        # Encoder calibrations block for tens of seconds, so they get their own thread instead of starving the
+        # device constructions, stall checks and snapshots
+        self._calibration_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='encoder_calibration')
         # List of devices with gstreamer errors
         self.gst_errors: List[str] = []
 
@@ -56,13 +96,19 @@ class DeviceManager(events.EventEmitter):
         Begin monitoring for devices in the background
         '''
         self._is_monitoring = True
+        self.rtsp_server.start()
         asyncio.create_task(self._monitor())
+        asyncio.create_task(self._monitor_stream_stats())
 
     def stop_monitoring(self):
         '''
         Stop monitoring for devices
         '''
         self._is_monitoring = False
+        self._hotplug_watcher.close()
+        self._executor.shutdown(wait=False)
+        self._calibration_executor.shutdown(wait=False)
+        self.rtsp_server.stop()
 
         for device in self.devices:
             device.stream.stop()
@@ -76,11 +122,11 @@ class DeviceManager(events.EventEmitter):
         device = None
         match device_type:
             case DeviceType.EXPLOREHD:
-                device = EHDDevice(device_info)
+                device = EHDDevice(device_info, self.format_cache, self.engine_type)
             case DeviceType.STELLARHD_LEADER:
-                device = SHDDevice(device_info)
+                device = SHDDevice(device_info, format_cache=self.format_cache, engine_type=self.engine_type)
             case DeviceType.STELLARHD_FOLLOWER:
-                device = SHDDevice(device_info, False)
+                device = SHDDevice(device_info, False, self.format_cache, self.engine_type)
             case _:
                 # Not a DWE device
                 return None
@@ -122,8 +168,53 @@ class DeviceManager(events.EventEmitter):
         endpoints = stream_info.endpoints
 
         device.configure_stream(encode_type, width, height,
-                                interval, StreamTypeEnum.UDP, endpoints)
+                                interval, stream_info.stream_type, endpoints, stream_info.multicast)
         device.start_stream()
+        self.rtsp_server.update_stream(device.stream)
+
+        self.settings_manager.save_device(device)
+        return True
+
+    def prepare_device_stream(self, stream_info: StreamInfoModel) -> bool:
+        '''
+        Build the pipeline of a stream configuration in the background, so configuring the device with it afterwards
+        switches over without waiting for the pipeline to be built
+        '''
+        device = self._find_device_with_bus_info(stream_info.bus_info)
+
+        stream_format = stream_info.stream_format
+        return device.prepare_stream(stream_info.encode_type, stream_format.width, stream_format.height,
+                                     stream_format.interval, stream_info.stream_type, stream_info.endpoints,
+                                     stream_info.multicast)
+
+    def add_stream_endpoint(self, bus_info: str, endpoint: StreamEndpointModel) -> bool:
+        '''
+        Add a client to a device stream without interrupting the existing clients
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        if not device.add_stream_endpoint(endpoint):
+            return False
+
+        self.settings_manager.save_device(device)
+        return True
+
+    def request_device_keyframe(self, bus_info: str) -> bool:
+        '''
+        Make a device stream send a keyframe now, so a client which just joined can start decoding
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        return device.request_keyframe()
+
+    def remove_stream_endpoint(self, bus_info: str, endpoint: StreamEndpointModel) -> bool:
+        '''
+        Remove a client from a device stream without interrupting the other clients
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        if not device.remove_stream_endpoint(endpoint):
+            return False
 
         self.settings_manager.save_device(device)
         return True
@@ -136,7 +227,12 @@ class DeviceManager(events.EventEmitter):
         if not device:
             return False
 
+        # a follower leaves the pipeline of its leader, which needs to be unlinked in the registry as well
+        if device.device_type == DeviceType.STELLARHD_FOLLOWER and cast(SHDDevice, device).leader_device:
+            self.remove_leader(bus_info)
+
         device.unconfigure_stream()
+        self.rtsp_server.update_stream(device.stream)
 
         self.settings_manager.save_device(device)
 
@@ -145,6 +241,172 @@ class DeviceManager(events.EventEmitter):
             self.remove_leader(cast(SHDDevice, device).follower)
         return True
 
+    def get_stream_stats(self) -> List[DeviceStreamStatsModel]:
+        '''
+        Get the recent stream stats of every device
+        '''
+        return [
+            DeviceStreamStatsModel(
+                bus_info=device.bus_info,
+                stats=device.stream_stats.get_history(),
+                restarts=device.get_stream_runner().supervisor.get_model(),
+                time_to_first_packet=self._get_time_to_first_packet(device.bus_info),
+            )
+            for device in self.devices
+        ]
+
+    def refresh_device_formats(self, bus_info: str) -> bool:
+        '''
+        Enumerate the formats of a device again and update the format cache
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        device.refresh_formats()
+        return True
+
+    def refresh_device_controls(self, bus_info: str) -> bool:
+        '''
+        Read the controls and options of a device back from the camera, in case they were changed elsewhere
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        device.refresh_control_values()
+        return True
+
+    def clear_format_cache(self) -> bool:
+        '''
+        Forget the cached formats of every camera model, they will be enumerated the next time a device is plugged in
+        '''
+        if self.format_cache:
+            self.format_cache.invalidate()
+        return True
+
+    async def get_snapshot(self, bus_info: str) -> bytes | None:
+        '''
+        Get a recent JPEG frame of a device stream, shared by concurrent requests
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        return await device.snapshot_cache.get(self._executor)
+
+    def start_device_recording(self, bus_info: str, segment_duration: int, container: RecordingContainerEnum) -> bool:
+        '''
+        Record the stream of a device into segments of the given duration
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        os.makedirs(self.recordings_path, exist_ok=True)
+        name = f'{time.strftime("%Y%m%d_%H%M%S")}_{os.path.basename(device.stream.device_path)}'
+        location = os.path.join(self.recordings_path, f'{name}_%05d.{container.value.lower()}')
+
+        return device.start_recording(location, segment_duration, container)
+
+    def stop_device_recording(self, bus_info: str) -> bool:
+        '''
+        Stop recording the stream of a device
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        device.stop_recording()
+        return True
+
+    def get_recordings(self) -> List[DeviceRecordingModel]:
+        '''
+        Get the recording and the recently completed segments of every device
+        '''
+        return [
+            DeviceRecordingModel(
+                bus_info=device.bus_info,
+                recording=device.stream.recording,
+                segments=device.get_recording_segments(),
+            )
+            for device in self.devices
+        ]
+
+    def set_device_latency_profile(self, bus_info: str, latency_profile: StreamLatencyProfileEnum) -> bool:
+        '''
+        Choose between smooth and low latency streaming for a device
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        device.set_latency_profile(latency_profile)
+
+        self.settings_manager.save_device(device)
+        return True
+
+    def set_device_encoder(self, bus_info: str, encoder: EncoderModel) -> bool:
+        '''
+        Select the encoder of a device with the SOFTWARE_H264 encode type
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        device.set_encoder(encoder)
+
+        self.settings_manager.save_device(device)
+        return True
+
+    async def calibrate_device_encoder(self, bus_info: str) -> List[EncoderCalibrationModel]:
+        '''
+        Benchmark the available encoders at the resolution and frame rate of a device stream and select the fastest
+        one which keeps up with the frame rate
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+        stream = device.stream
+        if not stream.width or not stream.height:
+            logging.warning(f'Cannot calibrate the encoder of {bus_info}, its stream is not configured')
+            return []
+
+        target_fps = stream.interval.denominator / stream.interval.numerator
+        raw_format = await self._get_raw_format(device)
+        # the encoders are benchmarked one after the other, which blocks for several seconds
+        results = await asyncio.get_running_loop().run_in_executor(
+            self._calibration_executor, calibrate_encoders, stream.width, stream.height, target_fps,
+            CALIBRATION_CANDIDATES, CALIBRATION_FRAMES, raw_format)
+        if not results:
+            logging.warning('No encoder could be calibrated')
+            return []
+        if not results[0].meets_target:
+            logging.warning(f'No encoder keeps up with {target_fps} fps at {stream.width}x{stream.height}')
+
+        self.set_device_encoder(bus_info, results[0].encoder)
+        return results
+
+    async def _get_raw_format(self, device: Device) -> str:
+        '''
+        The raw format the JPEG frames of a device decode to, read from a snapshot of its running stream
+        '''
+        # the snapshots of the H264 encode type are encoded by the pipeline instead of the camera
+        snapshot = None
+        if device.stream.encode_type != StreamEncodeTypeEnum.H264:
+            snapshot = await device.snapshot_cache.get(self._executor)
+        raw_format = jpeg_raw_format(snapshot) if snapshot else None
+        if not raw_format:
+            logging.warning(f'Cannot read the frame format of {device.bus_info}, calibrating with {DEFAULT_RAW_FORMAT}')
+            return DEFAULT_RAW_FORMAT
+        return raw_format
+
+    def set_device_frame_tap(self, bus_info: str, enabled: bool) -> bool:
+        '''
+        Share the frames of a device with local processes over shared memory
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        device.set_frame_tap(enabled)
+
+        self.settings_manager.save_device(device)
+        return True
+
+    def set_device_stall_watchdog(self, bus_info: str, enabled: bool, timeout: float) -> bool:
+        '''
+        Configure how long a device stream may go without frames before it is restarted
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        device.configure_stall_watchdog(enabled, timeout)
+
+        self.settings_manager.save_device(device)
+        return True
+
     def set_device_nickname(self, bus_info: str, nickname: str) -> bool:
         '''
         Set a device nickname
@@ -167,6 +429,17 @@ class DeviceManager(events.EventEmitter):
         self.settings_manager.save_device(device)
         return True
     
+    def set_device_uvc_controls(self, bus_info: str, controls: Dict[int, float]) -> List[UVCControlErrorModel]:
+        '''
+        Set multiple device UVC controls at once
+        '''
+        device = self._find_device_with_bus_info(bus_info)
+
+        errors = device.apply_controls(controls)
+
+        self.settings_manager.save_device(device)
+        return [UVCControlErrorModel(control_id=control_id, error=error) for control_id, error in errors.items()]
+
     def set_leader(self, leader_bus_info: str, follower_bus_info: str) -> bool:
         '''
         Set the leader_bus_info as the leader for the follower_bus_info device
@@ -175,7 +448,8 @@ class DeviceManager(events.EventEmitter):
         leader_device = self._find_device_with_bus_info(leader_bus_info)
 
         if follower_device.device_type == DeviceType.STELLARHD_FOLLOWER:
-            cast(SHDDevice, follower_device).set_leader(leader_device)
+            if cast(SHDDevice, follower_device).set_leader(leader_device):
+                self.devices.link(leader_bus_info, follower_bus_info)
             self.settings_manager.save_device(follower_device)
         else:
             logging.warn('Attempting to add leader to a non follower device type.')
@@ -189,6 +463,9 @@ class DeviceManager(events.EventEmitter):
         follower_device = self._find_device_with_bus_info(bus_info)
         if follower_device.device_type == DeviceType.STELLARHD_FOLLOWER:
             cast(SHDDevice, follower_device).remove_leader()
+            self.devices.unlink(bus_info)
+            # a pair still waiting for its leader to be attached would link them again
+            self.settings_manager.forget_leader(bus_info)
             self.settings_manager.save_device(follower_device)
         else:
             logging.warning('Attempting to remove leader from a non follower device type.')
@@ -199,87 +476,185 @@ class DeviceManager(events.EventEmitter):
         '''
         Utility to find a device with bus info
         '''
-        device = find_device_with_bus_info(self.devices, bus_info)
+        device = self.devices.get(bus_info)
         if not device:
             raise DeviceNotFoundException(bus_info)
         return device
     
-    async def _get_devices(self, old_devices: List[DeviceInfo]):
+    async def _get_devices(self, old_devices: List[DeviceInfo], devices_info: List[DeviceInfo] | None = None):
         # enumerate the devices
-        devices_info = list_devices()
-
-        # find the new devices
-        new_devices = list_diff(devices_info, old_devices)
+        if devices_info is None:
+            devices_info = self.enumerator.scan()
 
-        # find the removed devices
-        removed_devices = list_diff(old_devices, devices_info)
+        (new_devices, removed_devices) = diff_device_infos(old_devices, devices_info)
 
-        # add the new devices
-        for device_info in new_devices:
-            device = None
-            try:
-                device = self.create_device(device_info)
-                if not device:
-                    continue
-            except Exception as e:
-                logging.warning(e)
+        # remove the old devices first, since a device can be replaced by one with the same bus info
+        for device_info in removed_devices:
+            device = self.devices.get_with_info(device_info)
+            if not device:
                 continue
-            # append the device to the device list
-            self.devices.append(device)
-            # load the settings
-            self.settings_manager.load_device(device)
+            device.stream_runner.stop()
+            device.stream_runner.discard_prepared()
+            self.rtsp_server.remove_mount(device.stream._rtsp_mount_path())
+            # remove the leader of any followers of the removed device
+            for follower in self.devices.get_followers(device.bus_info):
+                cast(SHDDevice, follower).remove_leader()
+                self.devices.unlink(follower.bus_info)
+
+            self.devices.remove(device.bus_info)
+            logging.info(f'Device Removed: {device_info.bus_info}')
+
+            await self.sio.emit('device_removed', device_info.bus_info)
+
+        # add the new devices, constructing them concurrently without blocking the event loop
+        loop = asyncio.get_running_loop()
+        constructions = [loop.run_in_executor(self._executor, self._construct_device, device_info)
+                         for device_info in new_devices]
+        for construction in asyncio.as_completed(constructions):
+            device = await construction
+            if not device:
+                continue
+            # add the device to the registry
+            self.devices.add(device)
+            # serve the stream loaded from the settings
+            self.rtsp_server.update_stream(device.stream)
 
             # Output device to log (after loading settings)
-            logging.info(f'Device Added: {device_info.bus_info}')
+            logging.info(f'Device Added: {device.bus_info}')
 
             await self.sio.emit('device_added', DeviceModel.model_validate(device).model_dump())
 
-        while len(self.gst_errors) > 0:
-            bus_info = self.gst_errors.pop()
-            await self._emit_gst_error(bus_info, 'GST Error')
+        await self._emit_gst_errors()
 
         # make sure to load the leader followers in case there are new ones to check
         self.settings_manager.load_leader_followers(self.devices)
 
-        # remove the old devices
-        for device_info in removed_devices:
-            for device in self.devices:
-                if device.device_info == device_info:
-                    device.stream_runner.stop()
-                    if device.device_type == DeviceType.STELLARHD_LEADER:
-                        for follower in self.devices:
-                            if follower.device_type == DeviceType.STELLARHD_FOLLOWER:
-                                # remove the leader if its leader is the removed device
-                                # FIXME: This could be cleaner if the leader has a list of followers instead, which it does sorta, but not quite
-                                follower_casted = cast(SHDDevice, follower)
-                                if follower_casted.leader == device.bus_info:
-                                    follower_casted.remove_leader()
-
-                    self.devices.remove(device)
-                    logging.info(f'Device Removed: {device_info.bus_info}')
-
-                    await self.sio.emit('device_removed', device_info.bus_info)
-
         return devices_info
 
+    def _construct_device(self, device_info: DeviceInfo) -> Device | None:
+        '''
+        Create a device and load its settings, this is run in a worker thread
+        '''
+        try:
+            device = self.create_device(device_info)
+            if not device:
+                return None
+        except Exception as e:
+            logging.warning(e)
+            return None
+        # load the settings
+        self.settings_manager.load_device(device)
+        return device
+
     async def _monitor(self):
         '''
         Internal code to monitor devices for changes
         '''
+        # listen before the initial scan, so the uevents of cameras appearing while it runs are buffered
+        if self.hotplug_mode == HotplugMode.UEVENT:
+            try:
+                self._hotplug_watcher.open()
+            except (OSError, AttributeError) as e:
+                logging.warning(f'Unable to listen for uevents: {e}. Falling back to polling.')
+                self.hotplug_mode = HotplugMode.POLLING
+
         devices_info = await self._get_devices([])
 
         while self._is_monitoring:
+            if self.hotplug_mode == HotplugMode.UEVENT:
+                devices_info = await self._wait_for_hotplug(devices_info)
+                continue
+
             # do not overload the bus
-            await asyncio.sleep(0.1)
+            await asyncio.sleep(self.POLLING_INTERVAL)
 
             # get the list of devices and update the internal array
             devices_info = await self._get_devices(devices_info)
 
+    async def _monitor_stream_stats(self):
+        '''
+        Sample the stream stats of every device and emit the latest ones at a throttled rate
+        '''
+        last_emit = 0
+        latest: Dict[str, StreamStatsModel] = {}
+        loop = asyncio.get_running_loop()
+        while self._is_monitoring:
+            await asyncio.sleep(self.STREAM_STATS_INTERVAL)
+            for device in self.devices:
+                stats = device.sample_stream_stats()
+                if stats:
+                    latest[device.bus_info] = stats
+
+                for segment in device.sample_recording():
+                    await self.sio.emit('recording_segment', {'bus_info': device.bus_info, 'segment': segment.model_dump()})
+
+                # restarting the stream blocks until the camera is closed
+                stalled_for = await loop.run_in_executor(self._executor, device.check_stream_stalled)
+                if stalled_for is not None:
+                    await self.sio.emit('stream_stalled', {'bus_info': device.bus_info, 'stalled_for': stalled_for})
+
+            if latest and time.monotonic() - last_emit >= self.STREAM_STATS_EMIT_INTERVAL:
+                last_emit = time.monotonic()
+                await self.sio.emit('stream_stats', [
+                    DeviceStreamStatsModel(
+                        bus_info=bus_info, stats=[stats], restarts=self._get_stream_restarts(bus_info),
+                        time_to_first_packet=self._get_time_to_first_packet(bus_info)
+                    ).model_dump()
+                    for bus_info, stats in latest.items()
+                ])
+                latest.clear()
+
+    def _get_stream_restarts(self, bus_info: str) -> StreamRestartsModel | None:
+        device = self.devices.get(bus_info)
+        return device.get_stream_runner().supervisor.get_model() if device else None
+
+    def _get_time_to_first_packet(self, bus_info: str) -> float | None:
+        device = self.devices.get(bus_info)
+        time_to_first_packet = device.get_time_to_first_packet() if device else None
+        return time_to_first_packet * 1000 if time_to_first_packet is not None else None
+
+    async def _wait_for_hotplug(self, old_devices: List[DeviceInfo]) -> List[DeviceInfo]:
+        '''
+        Wait for uevents and re-enumerate only the nodes which changed
+        '''
+        try:
+            # Wake up regularly to report gstreamer errors
+            changes = await self._hotplug_watcher.wait_for_changes(self.POLLING_INTERVAL)
+        except OSError as e:
+            # The socket buffer may have overrun, so events could have been lost
+            logging.warning(f'Error receiving uevents: {e}. Re-enumerating all devices.')
+            self._pending_nodes.clear()
+            return await self._get_devices(old_devices)
+
+        for devname, action in changes.items():
+            if action == 'remove':
+                self._pending_nodes.pop(devname, None)
+                self.enumerator.remove_node(devname)
+            else:
+                self._pending_nodes[devname] = time.monotonic() + self.NODE_READY_TIMEOUT
+
+        if not changes and not self._pending_nodes:
+            await self._emit_gst_errors()
+            return old_devices
+
+        # The device node may not be accessible yet when the event arrives, so retry until the deadline
+        for devname, deadline in list(self._pending_nodes.items()):
+            if self.enumerator.update_node(devname) or time.monotonic() > deadline:
+                del self._pending_nodes[devname]
+
+        return await self._get_devices(old_devices, self.enumerator.devices())
+
+    async def _emit_gst_errors(self):
+        while len(self.gst_errors) > 0:
+            bus_info = self.gst_errors.pop()
+            await self._emit_gst_error(bus_info, 'GST Error')
+
     async def _emit_gst_error(self, device: str, errors: list):
         '''
         Emit a gst_error and make sure it is not due to the device being unplugged
         '''
-        devices_info = list_devices()
+        # The enumerator is kept up to date by the monitor, so the devices do not need to be queried again
+        devices_info = self.enumerator.devices()
 
         for dev_info in devices_info:
             if device == dev_info.bus_info:
@@ -0,0 +1,102 @@
+from typing import Dict, Iterator, List, Set, Tuple
+
+from .device import Device
+from .enumeration import DeviceInfo
+
+
+def _device_info_key(device_info: DeviceInfo) -> Tuple:
+    return (
+        device_info.bus_info,
+        device_info.device_name,
+        tuple(device_info.device_paths),
+        device_info.vid,
+        device_info.pid,
+    )
+
+
+def diff_device_infos(
+    old_devices: List[DeviceInfo], new_devices: List[DeviceInfo]
+) -> Tuple[List[DeviceInfo], List[DeviceInfo]]:
+    """
+    Find the difference between two enumerations
+
+    :return: The added and the removed devices
+    """
+    old_keys = {_device_info_key(device_info) for device_info in old_devices}
+    new_keys = {_device_info_key(device_info) for device_info in new_devices}
+
+    added = [info for info in new_devices if _device_info_key(info) not in old_keys]
+    removed = [info for info in old_devices if _device_info_key(info) not in new_keys]
+    return (added, removed)
+
+
+class DeviceRegistry:
+    """
+    Devices indexed by bus info, along with the leader and follower relationships between them
+    """
+
+    def __init__(self) -> None:
+        self._devices: Dict[str, Device] = {}
+        # leader bus info -> follower bus infos
+        self._followers: Dict[str, Set[str]] = {}
+        # follower bus info -> leader bus info
+        self._leaders: Dict[str, str] = {}
+
+    def __iter__(self) -> Iterator[Device]:
+        return iter(list(self._devices.values()))
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def __contains__(self, bus_info: str) -> bool:
+        return bus_info in self._devices
+
+    def get(self, bus_info: str) -> Device | None:
+        return self._devices.get(bus_info)
+
+    def get_with_info(self, device_info: DeviceInfo) -> Device | None:
+        """
+        Get the device which was created from this exact enumeration
+        """
+        device = self._devices.get(device_info.bus_info)
+        if device and _device_info_key(device.device_info) == _device_info_key(
+            device_info
+        ):
+            return device
+        return None
+
+    def add(self, device: Device):
+        self._devices[device.bus_info] = device
+
+    def remove(self, bus_info: str) -> Device | None:
+        """
+        Remove a device along with any of its leader or follower links
+        """
+        self.unlink(bus_info)
+        for follower in self._followers.pop(bus_info, set()):
+            self._leaders.pop(follower, None)
+        return self._devices.pop(bus_info, None)
+
+    def link(self, leader_bus_info: str, follower_bus_info: str):
+        self.unlink(follower_bus_info)
+        self._leaders[follower_bus_info] = leader_bus_info
+        self._followers.setdefault(leader_bus_info, set()).add(follower_bus_info)
+
+    def unlink(self, follower_bus_info: str):
+        leader_bus_info = self._leaders.pop(follower_bus_info, None)
+        if leader_bus_info:
+            followers = self._followers[leader_bus_info]
+            followers.discard(follower_bus_info)
+            if not followers:
+                del self._followers[leader_bus_info]
+
+    def get_leader(self, follower_bus_info: str) -> Device | None:
+        leader_bus_info = self._leaders.get(follower_bus_info)
+        return self._devices.get(leader_bus_info) if leader_bus_info else None
+
+    def get_followers(self, leader_bus_info: str) -> List[Device]:
+        return [
+            self._devices[bus_info]
+            for bus_info in self._followers.get(leader_bus_info, set())
+            if bus_info in self._devices
+        ]
@@ -1,5 +1,8 @@
 from typing import Dict
+import logging
 from .enumeration import DeviceInfo
+from .format_cache import FormatCache
+from .pipeline_engine import PipelineEngineType
 from .device import Device, Option, ControlTypeEnum
 from .pydantic_schemas import H264Mode
 from . import ehd_controls as xu
@@ -9,8 +12,9 @@ class EHDDevice(Device):
     Class for exploreHD devices
     '''
 
-    def __init__(self, device_info: DeviceInfo) -> None:
-        super().__init__(device_info)
+    def __init__(self, device_info: DeviceInfo, format_cache: FormatCache | None = None,
+                 engine_type: PipelineEngineType | None = None) -> None:
+        super().__init__(device_info, format_cache, engine_type)
 
         self.add_control_from_option(
             'vbr', False, ControlTypeEnum.BOOLEAN
@@ -24,6 +28,20 @@ class EHDDevice(Device):
             'bitrate', 10, ControlTypeEnum.INTEGER, 15, 0.1, 0.1
         )
 
+        # UVC xu keyframe request, a command rather than a setting, so it is neither an option nor read back
+        self._keyframe_option = Option(
+            self.cameras[2], 'B', xu.Unit.USR_ID, xu.Selector.USR_H264_CTRL, xu.Command.H264_IFRAME_CTRL, 'Keyframe Request')
+
+    def _request_camera_keyframe(self) -> bool:
+        # the option caches the value it was set to, which would skip repeated requests
+        self._keyframe_option.invalidate()
+        try:
+            self._keyframe_option.set_value(1)
+        except OSError as e:
+            logging.warning(self._fmt_log(f'Failed to request a keyframe: {e}'))
+            return False
+        return True
+
     def _get_options(self) -> Dict[str, Option]:
         options = {}
 
@@ -32,4 +32,5 @@ class Selector(Enum):
 class Command(Enum):
     H264_BITRATE_CTRL = 0x02
     GOP_CTRL = 0x03
+    H264_IFRAME_CTRL = 0x04
     H264_MODE_CTRL = 0x06
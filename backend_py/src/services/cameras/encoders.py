@@ -0,0 +1,238 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Tuple, Type
+import resource
+import shlex
+import subprocess
+import time
+import logging
+
+from .pipeline_engine import element_available
+from .pydantic_schemas import EncoderCalibrationModel, EncoderModel, H264EncoderEnum
+
+
+class H264Encoder(ABC):
+    """
+    Encodes raw video into an H.264 byte-stream for the SOFTWARE_H264 encode type
+    """
+
+    # element which needs to be installed for the encoder to be available
+    factory_name: str
+
+    def __init__(self, options: EncoderModel) -> None:
+        self.options = options
+
+    def available(self) -> bool:
+        return element_available(self.factory_name)
+
+    @abstractmethod
+    def build(self, element_name: str, bitrate: int, low_latency: bool = False) -> str:
+        """
+        :param bitrate: The target bitrate in kbit/s
+        :param low_latency: Trade quality for latency, see StreamLatencyProfileEnum
+        :return: The description of the encoder elements, the encoder itself named element_name
+        """
+        pass
+
+    def live_properties(self, element_name: str, bitrate: int) -> List[Tuple[str, str, Any]]:
+        """
+        The (element name, property, value) of the properties which can be changed while the encoder runs
+        """
+        return []
+
+
+class X264Encoder(H264Encoder):
+    factory_name = "x264enc"
+
+    # ms of video the rate control may buffer with the low latency profile, instead of the default 600 ms which lets
+    # single frames grow large enough to take several frame intervals to send
+    LOW_LATENCY_VBV_BUFFER = 100
+
+    def build(self, element_name: str, bitrate: int, low_latency: bool = False) -> str:
+        options = self.options
+        description = (
+            f"x264enc name={element_name} byte-stream=true tune=zerolatency bitrate={bitrate} "
+            f"speed-preset={options.preset.value}"
+        )
+        if low_latency:
+            description += f" vbv-buf-capacity={self.LOW_LATENCY_VBV_BUFFER}"
+        if options.threads:
+            description += f" threads={options.threads}"
+        if options.key_int_max:
+            description += f" key-int-max={options.key_int_max}"
+        return description
+
+    def live_properties(self, element_name: str, bitrate: int) -> List[Tuple[str, str, Any]]:
+        return [(element_name, "bitrate", bitrate)]
+
+
+class OpenH264Encoder(H264Encoder):
+    factory_name = "openh264enc"
+
+    def build(self, element_name: str, bitrate: int, low_latency: bool = False) -> str:
+        # openh264 only takes I420, which is not what jpegdec gives for the 4:2:2 frames of most cameras
+        description = (
+            f"videoconvert ! video/x-raw,format=I420 ! "
+            f"openh264enc name={element_name} bitrate={bitrate * 1000} rate-control=bitrate complexity=low"
+        )
+        if self.options.key_int_max:
+            description += f" gop-size={self.options.key_int_max}"
+        return description
+
+
+class V4L2Encoder(H264Encoder):
+    """
+    The V4L2 memory to memory hardware encoder, e.g. of the Raspberry Pi 4
+    """
+
+    factory_name = "v4l2h264enc"
+
+    def build(self, element_name: str, bitrate: int, low_latency: bool = False) -> str:
+        controls = f"controls,video_bitrate={bitrate * 1000}"
+        if self.options.key_int_max:
+            controls += f",h264_i_frame_period={self.options.key_int_max}"
+        # the hardware takes neither the 4:2:2 frames of some cameras nor the highest levels
+        return (
+            f'videoconvert ! video/x-raw,format=I420 ! v4l2h264enc name={element_name} extra-controls="{controls}" '
+            "! video/x-h264,level=(string)4"
+        )
+
+
+ENCODERS: Dict[H264EncoderEnum, Type[H264Encoder]] = {
+    H264EncoderEnum.X264: X264Encoder,
+    H264EncoderEnum.OPENH264: OpenH264Encoder,
+    H264EncoderEnum.V4L2: V4L2Encoder,
+}
+
+
+def create_encoder(options: EncoderModel) -> H264Encoder:
+    return ENCODERS[options.backend](options)
+
+
+# The encoders tried by calibrate_encoders, with their default options
+CALIBRATION_CANDIDATES = [EncoderModel(backend=backend) for backend in H264EncoderEnum]
+# Frames of the calibration clip
+CALIBRATION_FRAMES = 300
+# Bitrate of the calibration in kbit/s
+CALIBRATION_BITRATE = 5000
+# An encoder which takes this many times the duration of the clip at the target frame rate is given up on, it could
+# not keep up anyway
+CALIBRATION_TIMEOUT_FACTOR = 4
+# Seconds allowed for gst-launch-1.0 to start, on top of the clip
+CALIBRATION_STARTUP_TIME = 5
+# Raw format of the calibration clip when the format the camera frames decode to is not known
+DEFAULT_RAW_FORMAT = "I420"
+# Raw format jpegdec decodes to, by the (horizontal, vertical) sampling factors of the luma over the chroma
+JPEG_SUBSAMPLING_FORMATS = {(1, 1): "Y444", (2, 1): "Y42B", (2, 2): "I420", (4, 1): "Y41B"}
+
+
+def jpeg_raw_format(jpeg: bytes) -> str | None:
+    """
+    Read the raw format a JPEG frame decodes to from its frame header
+
+    :return: The GStreamer video format, or None if the frame header cannot be read
+    """
+    offset = 2
+    while offset + 4 <= len(jpeg) and jpeg[offset] == 0xFF:
+        marker = jpeg[offset + 1]
+        length = int.from_bytes(jpeg[offset + 2 : offset + 4], "big")
+        # start of frame markers, besides the huffman and arithmetic coding tables which share the range
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            header = jpeg[offset + 4 : offset + 2 + length]
+            if len(header) < 6:
+                return None
+            components = header[5]
+            if components == 1:
+                return "GRAY8"
+            if components != 3 or len(header) < 6 + components * 3:
+                return None
+            # the sampling factors of the luma, then of both chroma components
+            factors = [(header[7 + i * 3] >> 4, header[7 + i * 3] & 0x0F) for i in range(components)]
+            if factors[1] != factors[2] or 0 in factors[1]:
+                return None
+            ((luma_h, luma_v), (chroma_h, chroma_v)) = factors[:2]
+            if luma_h % chroma_h or luma_v % chroma_v:
+                return None
+            return JPEG_SUBSAMPLING_FORMATS.get((luma_h // chroma_h, luma_v // chroma_v))
+        offset += 2 + length
+    return None
+
+
+def _measure_encoder(
+    encoder: H264Encoder, width: int, height: int, frames: int, timeout: float, raw_format: str
+) -> Tuple[float, float] | None:
+    """
+    Encode a moving test clip as fast as possible
+
+    :param timeout: Seconds after which the encoder is considered to have failed
+    :param raw_format: The raw format of the clip, that of the frames the encoder gets from the camera
+    :return: The frames per second and the CPU time per frame in ms, or None if the encoder failed
+    """
+    pipeline = (
+        f"videotestsrc num-buffers={frames} horizontal-speed=8 ! "
+        f"video/x-raw,format={raw_format},width={width},height={height},framerate=30/1 ! "
+        f"{encoder.build('encoder', CALIBRATION_BITRATE)} ! fakesink"
+    )
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            ["gst-launch-1.0", "-q", *shlex.split(pipeline)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logging.warning(f"Failed to calibrate {encoder.factory_name}: {e}")
+        return None
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        logging.warning(f"Failed to calibrate {encoder.factory_name}: {result.stderr.strip()}")
+        return None
+
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_time = (children_usage.ru_utime - usage.ru_utime) + (children_usage.ru_stime - usage.ru_stime)
+    return (frames / elapsed, cpu_time / frames * 1000)
+
+
+def calibrate_encoders(
+    width: int,
+    height: int,
+    target_fps: float,
+    candidates: List[EncoderModel] = CALIBRATION_CANDIDATES,
+    frames: int = CALIBRATION_FRAMES,
+    raw_format: str = DEFAULT_RAW_FORMAT,
+) -> List[EncoderCalibrationModel]:
+    """
+    Benchmark every available encoder on a test clip at the given resolution, blocks for several seconds
+
+    :param raw_format: The raw format the camera frames decode to, see jpeg_raw_format
+    :return: The results of the encoders which are available, the first one is selected, see select_encoder
+    """
+    timeout = frames / target_fps * CALIBRATION_TIMEOUT_FACTOR + CALIBRATION_STARTUP_TIME
+    results = []
+    for options in candidates:
+        encoder = create_encoder(options)
+        if not encoder.available():
+            continue
+        measurement = _measure_encoder(encoder, width, height, frames, timeout, raw_format)
+        if not measurement:
+            continue
+        (fps, cpu_time) = measurement
+        logging.info(f"{encoder.factory_name} encodes {width}x{height} at {fps:.1f} fps, {cpu_time:.1f} ms CPU per frame")
+        results.append(
+            EncoderCalibrationModel(
+                encoder=options, fps=fps, cpu_time=cpu_time, meets_target=fps >= target_fps
+            )
+        )
+    return select_encoder(results)
+
+
+def select_encoder(results: List[EncoderCalibrationModel]) -> List[EncoderCalibrationModel]:
+    """
+    Order the results by preference: the fastest encoder which meets the target frame rate, or the fastest encoder
+    if none does
+
+    :return: The ordered results
+    """
+    return sorted(results, key=lambda result: (not result.meets_target, -result.fps))
@@ -4,7 +4,10 @@ import fcntl
 import os
 from natsort import natsorted
 import logging
-from typing import List, Dict
+from typing import List, Dict, Iterable, Tuple
+
+
+VIDEO4LINUX_PATH = '/sys/class/video4linux'
 
 
 @dataclass
@@ -17,50 +20,86 @@ class DeviceInfo:
     pid: int
 
 
+@dataclass
+class NodeInfo:
+    '''
+    Information about a single /dev/videoN node
+    '''
+
+    devname: str
+    device_path: str
+    device_name: str
+    bus_info: str
+    vid: int
+    pid: int
+
+
 def _get_device_attr(device_path, attr):
     file_object = open(device_path + '/' + attr)
     return file_object.read().strip()
 
 
-def _get_vid_pid(devname):
+def _get_vid_pid(devname, sysfs_path=VIDEO4LINUX_PATH):
     cam_name = devname
-    syspath = '/sys/class/video4linux/' + cam_name
+    syspath = f'{sysfs_path}/{cam_name}'
     link = os.readlink(syspath) + '../../../../'
     device_path = os.path.abspath(
-        '/sys/class/video4linux/' + link)
+        f'{sysfs_path}/{link}')
     return (int(_get_device_attr(device_path, 'idVendor'), base=16), int(_get_device_attr(device_path, 'idProduct'), base=16))
 
 
-def list_devices():
-    # traverse the directory that has the list of all devices
-    devnames: List[str] = []
+def _get_sysfs_identity(devname, sysfs_path=VIDEO4LINUX_PATH) -> Tuple[int, int]:
+    '''
+    Get the inode and ctime of the sysfs device directory, which change whenever the node is recreated
+    '''
+    stat = os.stat(f'{sysfs_path}/{devname}')
+    return (stat.st_ino, stat.st_ctime_ns)
+
+
+def query_node(devname: str, sysfs_path=VIDEO4LINUX_PATH) -> NodeInfo | None:
+    '''
+    Query a single video node, returns None if it is not ready yet
+    '''
+    devpath = f'/dev/{devname}'
+    try:
+        fd = open(devpath)
+    except:
+        # Device was not initialized yet, just wait a bit
+        return None
+    cap = v4l2.v4l2_capability()
     try:
-        devnames = os.listdir('/sys/class/video4linux/')
-    except FileNotFoundError as e:
-        return []
-    devices_info: List[DeviceInfo] = []
-    devices_map: Dict[str, DeviceInfo] = {}
-    for devname in devnames:
-        devpath = f'/dev/{devname}'
-        try:
-            fd = open(devpath)
-        except:
-            # Device was not initialized yet, just wait a bit
-            continue
-        cap = v4l2.v4l2_capability()
         fcntl.ioctl(fd, v4l2.VIDIOC_QUERYCAP, cap)
+    except OSError:
+        return None
+    finally:
         fd.close()
-        bus_info: str = bytes.decode(cap.bus_info)
-        # Correct type of bus info
-        if bus_info.startswith('usb'):
-            if bus_info in devices_map:
-                devices_map[bus_info].device_paths.append(devpath)
-            else:
-                device_name = cap.card.decode()
-                (vid, pid) = _get_vid_pid(devname)
-                devices_map[bus_info] = DeviceInfo(
-                    device_name, bus_info, [devpath], vid, pid)
+    bus_info: str = bytes.decode(cap.bus_info)
+    (vid, pid) = (0, 0)
+    # Correct type of bus info
+    if bus_info.startswith('usb'):
+        try:
+            (vid, pid) = _get_vid_pid(devname, sysfs_path)
+        except OSError:
+            # The device was removed while it was being queried
+            return None
+    return NodeInfo(devname, devpath, cap.card.decode(), bus_info, vid, pid)
+
+
+def group_nodes(nodes: Iterable[NodeInfo]) -> List[DeviceInfo]:
+    '''
+    Group usb video nodes into devices by their bus info
+    '''
+    devices_map: Dict[str, DeviceInfo] = {}
+    for node in nodes:
+        if not node.bus_info.startswith('usb'):
+            continue
+        if node.bus_info in devices_map:
+            devices_map[node.bus_info].device_paths.append(node.device_path)
+        else:
+            devices_map[node.bus_info] = DeviceInfo(
+                node.device_name, node.bus_info, [node.device_path], node.vid, node.pid)
 
+    devices_info: List[DeviceInfo] = []
     # flatten the dict
     for bus_info in devices_map:
         device_info = devices_map[bus_info]
@@ -69,3 +108,89 @@ def list_devices():
         devices_info.append(device_info)
 
     return devices_info
+
+
+class DeviceEnumerator:
+    '''
+    Keeps track of the known video nodes so that single nodes can be re-enumerated
+
+    Nodes are cached by their devname and sysfs identity, so a scan only queries nodes which are new or were recreated.
+    '''
+
+    def __init__(self, sysfs_path: str = VIDEO4LINUX_PATH) -> None:
+        self.sysfs_path = sysfs_path
+        self.nodes: Dict[str, NodeInfo] = {}
+        # sysfs identity of every node in self.nodes
+        self._identities: Dict[str, Tuple[int, int]] = {}
+        self._devices: List[DeviceInfo] | None = None
+
+    def scan(self) -> List[DeviceInfo]:
+        '''
+        Re-enumerate every video node, reusing the nodes which have not changed
+        '''
+        try:
+            devnames = set(os.listdir(self.sysfs_path))
+        except FileNotFoundError:
+            devnames = set()
+
+        for devname in list(self.nodes.keys()):
+            if devname not in devnames:
+                self.remove_node(devname)
+
+        for devname in devnames:
+            try:
+                identity = _get_sysfs_identity(devname, self.sysfs_path)
+            except OSError:
+                # Removed while scanning
+                self.remove_node(devname)
+                continue
+            if self._identities.get(devname) == identity:
+                continue
+            self._update_node(devname, identity)
+
+        return self.devices()
+
+    def update_node(self, devname: str) -> bool:
+        '''
+        Re-enumerate a single node, returns False if the node could not be queried yet
+        '''
+        try:
+            identity = _get_sysfs_identity(devname, self.sysfs_path)
+        except OSError:
+            self.remove_node(devname)
+            return False
+        return self._update_node(devname, identity)
+
+    def remove_node(self, devname: str):
+        if self.nodes.pop(devname, None):
+            self._devices = None
+        self._identities.pop(devname, None)
+
+    def devices(self) -> List[DeviceInfo]:
+        '''
+        Get the devices made up of the known nodes
+        '''
+        if self._devices is None:
+            self._devices = group_nodes(self.nodes.values())
+        # a copy, since the cached list is rebuilt when the nodes change
+        return list(self._devices)
+
+    def _update_node(self, devname: str, identity: Tuple[int, int]) -> bool:
+        node = self._query_node(devname)
+        if not node:
+            self.remove_node(devname)
+            return False
+        self.nodes[devname] = node
+        self._identities[devname] = identity
+        self._devices = None
+        return True
+
+    def _query_node(self, devname: str) -> NodeInfo | None:
+        return query_node(devname, self.sysfs_path)
+
+
+_enumerator = DeviceEnumerator()
+
+
+def list_devices():
+    return _enumerator.scan()
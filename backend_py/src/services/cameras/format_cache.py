@@ -0,0 +1,90 @@
+from typing import Dict, List
+import threading
+import json
+import logging
+import os
+
+from .pydantic_schemas import FormatSizeModel
+from .enumeration import VIDEO4LINUX_PATH, _get_device_attr
+
+Formats = Dict[str, List[FormatSizeModel]]
+
+
+def get_format_cache_key(path: str) -> str | None:
+    '''
+    Get the cache key of a video node: VID/PID, bcdDevice and the index of the node within the device
+
+    :param path: The path of the node, e.g. /dev/video0
+    :return: The key or None if the sysfs attributes could not be read
+    '''
+    syspath = f'{VIDEO4LINUX_PATH}/{os.path.basename(path)}'
+    # the device link points to the usb interface, and its parent is the usb device
+    usb_device_path = os.path.realpath(f'{syspath}/device/..')
+    try:
+        vid = _get_device_attr(usb_device_path, 'idVendor')
+        pid = _get_device_attr(usb_device_path, 'idProduct')
+        bcd_device = _get_device_attr(usb_device_path, 'bcdDevice')
+        index = _get_device_attr(syspath, 'index')
+    except OSError:
+        return None
+    return f'{vid}:{pid}:{bcd_device}:{index}'
+
+
+class FormatCache:
+    '''
+    Persistent cache of the formats supported by a camera model and firmware, so they do not need to be enumerated
+    with ioctls every time a known camera is plugged in
+    '''
+
+    def __init__(self, settings_path: str = '.') -> None:
+        self.path = f'{settings_path}/device_formats.json'
+        self._lock = threading.Lock()
+        self._formats: Dict[str, Formats] = {}
+
+        try:
+            with open(self.path, 'r') as f:
+                cached: Dict[str, Dict] = json.loads(f.read())
+            for key, formats in cached.items():
+                self._formats[key] = self._validate(formats)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, ValueError) as e:
+            logging.warning(f'Discarding invalid format cache: {e}')
+
+    def get(self, key: str) -> Formats | None:
+        '''
+        Get a copy of the cached formats, or None if the key is not cached
+        '''
+        with self._lock:
+            formats = self._formats.get(key)
+            if formats is None:
+                return None
+            return {fmt: [size.model_copy(deep=True) for size in sizes] for fmt, sizes in formats.items()}
+
+    def put(self, key: str, formats: Formats):
+        with self._lock:
+            self._formats[key] = {fmt: [size.model_copy(deep=True) for size in sizes] for fmt, sizes in formats.items()}
+            self._write()
+
+    def invalidate(self, key: str | None = None):
+        '''
+        Remove a key from the cache, or every key if none is given
+        '''
+        with self._lock:
+            if key is None:
+                self._formats.clear()
+            else:
+                self._formats.pop(key, None)
+            self._write()
+
+    def _write(self):
+        serialized = {
+            key: {fmt: [size.model_dump() for size in sizes] for fmt, sizes in formats.items()}
+            for key, formats in self._formats.items()
+        }
+        with open(self.path, 'w') as f:
+            f.write(json.dumps(serialized))
+
+    @staticmethod
+    def _validate(formats: Dict) -> Formats:
+        return {fmt: [FormatSizeModel.model_validate(size) for size in sizes] for fmt, sizes in formats.items()}
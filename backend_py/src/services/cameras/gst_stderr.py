@@ -0,0 +1,79 @@
+from enum import IntEnum
+from typing import List
+import re
+
+# e.g. 0:00:01.234567890  1234 0x55d0c0 WARN  v4l2src gstv4l2src.c:1123:gst_v4l2src_create:<v4l2src0> lost frames
+_DEBUG_LOG_PATTERN = re.compile(r"^\d+:\d+:\d+\.\d+\s+\d+\s+0x[0-9a-f]+\s+(\w+)\s")
+# e.g. (gst-launch-1.0:1234): GStreamer-CRITICAL **: gst_segment_to_running_time: assertion failed
+_GLIB_LOG_PATTERN = re.compile(r"^\(.+:\d+\): [\w-]+-(CRITICAL|WARNING) \*\*")
+
+# Errors which will happen again when the same pipeline is restarted
+_INVALID_PIPELINE_MESSAGES = (
+    "erroneous pipeline",
+    "pipeline could not be constructed",
+    "reason not-negotiated",
+)
+
+
+class GstSeverity(IntEnum):
+    """
+    Severity of a line of gst-launch-1.0 output, ordered from least to most severe
+    """
+
+    # Progress messages and the details of a previous message
+    INFO = 0
+    # The pipeline keeps running
+    WARNING = 1
+    # The pipeline stopped, but restarting it may help, e.g. a camera which was busy or briefly disconnected
+    FATAL = 2
+    # The pipeline cannot run as configured, so restarting it does not help
+    INVALID = 3
+
+
+def classify_line(line: str) -> GstSeverity:
+    line = line.strip()
+    if any(message in line for message in _INVALID_PIPELINE_MESSAGES):
+        return GstSeverity.INVALID
+    if line.startswith("ERROR:"):
+        return GstSeverity.FATAL
+    if line.startswith("WARNING:") or _GLIB_LOG_PATTERN.match(line):
+        return GstSeverity.WARNING
+
+    match = _DEBUG_LOG_PATTERN.match(line)
+    if match and match.group(1) in ("ERROR", "WARN"):
+        # errors logged by an element do not stop the pipeline by themselves
+        return GstSeverity.WARNING
+    return GstSeverity.INFO
+
+
+class GstStderrParser:
+    """
+    Parses the stderr of gst-launch-1.0 line by line, collecting the lines of its errors
+    """
+
+    def __init__(self) -> None:
+        self.severity = GstSeverity.INFO
+        self.error_block: List[str] = []
+        self._in_error = False
+
+    @property
+    def restartable(self) -> bool:
+        return self.severity != GstSeverity.INVALID
+
+    def feed(self, line: str) -> GstSeverity:
+        """
+        :return: The severity of the line, the details following an error are part of the error
+        """
+        severity = classify_line(line)
+        if severity >= GstSeverity.FATAL:
+            self._in_error = True
+        elif severity == GstSeverity.WARNING:
+            self._in_error = False
+        elif self._in_error:
+            # additional debug info of the error
+            severity = self.severity
+
+        if self._in_error:
+            self.error_block.append(line)
+        self.severity = max(self.severity, severity)
+        return severity
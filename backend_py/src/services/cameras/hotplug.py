@@ -0,0 +1,188 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict
+import asyncio
+import socket
+import os
+import logging
+
+# From linux/netlink.h
+NETLINK_KOBJECT_UEVENT = 15
+# Multicast group of the raw kernel uevents
+UEVENT_KERNEL_GROUP = 1
+
+UEVENT_BUFFER_SIZE = 64 * 1024
+
+
+class HotplugMode(str, Enum):
+    # Listen for kernel uevents and only re-enumerate the nodes that changed
+    UEVENT = "UEVENT"
+    # Re-enumerate every node at a fixed interval
+    POLLING = "POLLING"
+
+
+@dataclass
+class UEvent:
+    action: str
+    subsystem: str
+    devname: str = ""
+    devpath: str = ""
+    properties: Dict[str, str] = field(default_factory=dict)
+
+
+def parse_uevent(data: bytes) -> UEvent | None:
+    """
+    Parse a kernel uevent message
+
+    :param data: The raw message, an 'action@devpath' header followed by NUL separated KEY=VALUE pairs
+    :return: The parsed event or None if the message is not a kernel uevent
+    """
+    parts = data.split(b"\x00")
+    if not parts or b"@" not in parts[0]:
+        # udev messages (libudev header) or garbage
+        return None
+
+    properties: Dict[str, str] = {}
+    for part in parts[1:]:
+        if b"=" not in part:
+            continue
+        (key, value) = part.decode(errors="replace").split("=", 1)
+        properties[key] = value
+
+    if "ACTION" not in properties or "SUBSYSTEM" not in properties:
+        return None
+
+    # DEVNAME is relative to /dev, but may also include it
+    devname = os.path.basename(properties.get("DEVNAME", ""))
+
+    return UEvent(
+        action=properties["ACTION"],
+        subsystem=properties["SUBSYSTEM"],
+        devname=devname,
+        devpath=properties.get("DEVPATH", ""),
+        properties=properties,
+    )
+
+
+class UEventSource(ABC):
+    """
+    Source of uevents for the hotplug watcher
+    """
+
+    @abstractmethod
+    def open(self):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    @abstractmethod
+    async def receive(self) -> UEvent | None:
+        """
+        Wait for the next event, None is returned for messages that could not be parsed
+        """
+        pass
+
+
+class NetlinkUEventSource(UEventSource):
+    """
+    Kernel uevents over a NETLINK_KOBJECT_UEVENT socket
+    """
+
+    def __init__(self) -> None:
+        self._sock: socket.socket | None = None
+
+    def open(self):
+        # Will raise OSError (or AttributeError on non linux platforms) if netlink is unavailable
+        self._sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT
+        )
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UEVENT_BUFFER_SIZE)
+        self._sock.bind((os.getpid(), UEVENT_KERNEL_GROUP))
+        self._sock.setblocking(False)
+
+    def close(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    async def receive(self) -> UEvent | None:
+        data = await asyncio.get_running_loop().sock_recv(
+            self._sock, UEVENT_BUFFER_SIZE
+        )
+        return parse_uevent(data)
+
+
+class SyntheticUEventSource(UEventSource):
+    """
+    Source fed with synthetic events, used for testing the hotplug handling without hardware
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue[UEvent] = asyncio.Queue()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def push(self, action: str, devname: str, subsystem: str = "video4linux"):
+        self._queue.put_nowait(UEvent(action=action, subsystem=subsystem, devname=devname))
+
+    async def receive(self) -> UEvent | None:
+        return await self._queue.get()
+
+
+class HotplugWatcher:
+    """
+    Watches a uevent source for changes to nodes of a subsystem
+    """
+
+    def __init__(
+        self,
+        source: UEventSource | None = None,
+        subsystem: str = "video4linux",
+        settle_time: float = 0.25,
+    ) -> None:
+        self.source = source if source else NetlinkUEventSource()
+        self.subsystem = subsystem
+        # Time to wait for more events, since a single camera creates multiple nodes
+        self.settle_time = settle_time
+
+    def open(self):
+        self.source.open()
+
+    def close(self):
+        self.source.close()
+
+    async def wait_for_changes(self, timeout: float | None = None) -> Dict[str, str]:
+        """
+        Wait for a burst of events
+
+        :param timeout: Maximum time to wait for the first event, None waits forever
+        :return: The latest action of every changed node, keyed by devname
+        """
+        changes: Dict[str, str] = {}
+        try:
+            await self._collect(changes, timeout)
+        except asyncio.TimeoutError:
+            return changes
+
+        # Collect the remaining events of this burst
+        while True:
+            try:
+                await self._collect(changes, self.settle_time)
+            except asyncio.TimeoutError:
+                return changes
+
+    async def _collect(self, changes: Dict[str, str], timeout: float | None):
+        while True:
+            event = await asyncio.wait_for(self.source.receive(), timeout)
+            if not event or event.subsystem != self.subsystem or not event.devname:
+                continue
+            logging.debug(f"uevent: {event.action} {event.devname}")
+            changes[event.devname] = event.action
+            return
@@ -0,0 +1,664 @@
+from abc import ABC, abstractmethod
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+import subprocess
+import threading
+import shlex
+import time
+import logging
+
+import event_emitter as events
+
+from .gst_stderr import GstSeverity, GstStderrParser, classify_line
+
+# The in-process engine is only available when GStreamer's GObject introspection bindings are installed
+try:
+    import gi
+
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst, GLib
+
+    Gst.init(None)
+except (ImportError, ValueError):
+    Gst = None
+
+
+class PipelineEngineType(Enum):
+    # Run the pipeline with gst-launch-1.0
+    SUBPROCESS = "subprocess"
+    # Run the pipeline in process with the GStreamer python bindings
+    GST = "gst"
+
+
+def get_default_engine_type() -> PipelineEngineType:
+    """
+    Prefer the in-process engine, falling back to gst-launch-1.0 when the bindings are not installed
+    """
+    return PipelineEngineType.GST if Gst else PipelineEngineType.SUBPROCESS
+
+
+@lru_cache
+def element_available(factory_name: str) -> bool:
+    """
+    Whether an element is installed
+    """
+    if Gst:
+        return Gst.ElementFactory.find(factory_name) is not None
+    try:
+        return subprocess.run(["gst-inspect-1.0", "--exists", factory_name]).returncode == 0
+    except OSError:
+        return False
+
+
+class BufferCounter:
+    """
+    Counts the buffers flowing through a pad
+    """
+
+    def __init__(self) -> None:
+        self.buffers = 0
+        self.bytes = 0
+        # time.monotonic of the first buffer
+        self.first_buffer_time: float | None = None
+
+    def _on_buffer(self, pad, info):
+        if self.first_buffer_time is None:
+            self.first_buffer_time = time.monotonic()
+        self.buffers += 1
+        self.bytes += info.get_buffer().get_size()
+        return Gst.PadProbeReturn.OK
+
+
+class PipelineEngine(ABC, events.EventEmitter):
+    """
+    Runs a pipeline made of named branches, each from a gst-launch style description
+
+    Emits "error" with a list of error lines and whether restarting the pipeline may help, when the pipeline fails
+    """
+
+    # Whether set_property can change a running pipeline
+    supports_live_properties = False
+    # Whether pull_sample can read from an appsink
+    supports_samples = False
+    # Whether add_tee_branch can link branches to the tees of the running pipeline
+    supports_tee_branches = False
+
+    def __init__(self) -> None:
+        events.EventEmitter.__init__(self)
+
+    @property
+    @abstractmethod
+    def running(self) -> bool:
+        pass
+
+    @abstractmethod
+    def start(self, branches: Dict[str, str]):
+        pass
+
+    @abstractmethod
+    def stop(self):
+        pass
+
+    def set_property(self, element_name: str, property_name: str, value: Any) -> bool:
+        """
+        Change a property of an element of the running pipeline
+
+        :return: False if the property could not be changed, in which case the pipeline needs to be restarted
+        """
+        return False
+
+    def emit_action_signal(self, element_name: str, signal_name: str, *args) -> bool:
+        """
+        Emit an action signal on an element of the running pipeline, e.g. add on multiudpsink
+
+        :return: False if the signal could not be emitted, in which case the pipeline needs to be restarted
+        """
+        return False
+
+    def add_branch(self, branch_name: str, pipeline_str: str) -> bool:
+        """
+        Add a branch to the running pipeline without interrupting the other branches
+
+        :return: False if the branch could not be added, in which case the pipeline needs to be restarted
+        """
+        return False
+
+    def remove_branch(self, branch_name: str) -> bool:
+        """
+        Remove a branch from the running pipeline without interrupting the other branches
+
+        :return: False if the branch could not be removed, in which case the pipeline needs to be restarted
+        """
+        return False
+
+    def add_tee_branch(
+        self, tee_name: str, branch_name: str, pipeline_str: str, keyframes_after: str | None = None
+    ) -> bool:
+        """
+        Link a branch to a new pad of a tee of the running pipeline, without interrupting the other pads of the tee.
+        The branch needs to start with a queue, and is removed with the branch holding the tee.
+
+        :param keyframes_after: Name of an element of the branch which only passes on the buffers that can be decoded
+            on their own, from the first buffer that reaches the branch
+        :return: False if the branch could not be added
+        """
+        return False
+
+    def remove_tee_branch(self, branch_name: str, drain_timeout: float = 0) -> bool:
+        """
+        Unlink a branch of add_tee_branch from its tee and remove it
+
+        :param drain_timeout: Seconds to wait for the end of stream to reach the sinks of the branch, so e.g. a muxer
+            can finish its file. 0 removes the branch with the buffers it holds.
+        :return: False if the branch could not be removed
+        """
+        return False
+
+    def prepare_branch(self, branch_name: str, pipeline_str: str) -> bool:
+        """
+        Construct a branch ahead of time, so the next start or add_branch with the same description only needs to set
+        it playing. The branch is kept until it is used, replaced or discarded.
+
+        :return: False if the branch could not be prepared, or the engine cannot prepare branches
+        """
+        return False
+
+    def discard_prepared(self):
+        """
+        Release the branches of prepare_branch, which may hold devices open
+        """
+        pass
+
+    def send_upstream_event(self, element_name: str, structure: str) -> bool:
+        """
+        Send a custom upstream event to an element of the running pipeline, as if it came from downstream
+
+        :param structure: The structure of the event, e.g. GstForceKeyUnit for encoders
+        :return: False if the element did not handle the event, or the engine cannot send events
+        """
+        return False
+
+    def get_property(self, element_name: str, property_name: str) -> Any:
+        """
+        Get a property of an element of the running pipeline, structures are returned as dicts
+
+        :return: The value, or None if it is not available
+        """
+        return None
+
+    def count_buffers(self, element_name: str, pad_name: str) -> BufferCounter | None:
+        """
+        Count the buffers flowing through a pad of the running pipeline
+
+        :return: The counter, or None if buffers cannot be counted
+        """
+        return None
+
+    def query_latency(self) -> float | None:
+        """
+        :return: The latency of the running pipeline in seconds, or None if it is not available
+        """
+        return None
+
+    def get_base_time(self) -> int | None:
+        """
+        :return: The clock time in ns at which the running time of the running pipeline is 0, or None if it is not
+            available. The pipeline clock is the monotonic clock, like time.monotonic_ns.
+        """
+        return None
+
+    def pull_sample(self, element_name: str, timeout: float) -> bytes | None:
+        """
+        Take the next buffer from an appsink of the running pipeline
+
+        :return: The data of the buffer, or None if there was none within the timeout
+        """
+        return None
+
+
+class SubprocessEngine(PipelineEngine):
+    """
+    Runs the pipeline with gst-launch-1.0, errors are read from its stderr
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        self._process: subprocess.Popen | None = None
+        self.error_thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None
+
+    def start(self, branches: Dict[str, str]):
+        pipeline_str = " ".join(branches.values())
+        self._process = subprocess.Popen(
+            ["gst-launch-1.0", *shlex.split(pipeline_str)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        self.error_thread = threading.Thread(target=self._log_errors, args=(self._process,))
+        self.error_thread.start()
+
+    def stop(self):
+        with self._lock:
+            process = self._process
+            self._process = None
+        if not process:
+            return
+        process.kill()
+        process.wait()
+        # error handlers run on the error thread, so it cannot be joined from there
+        if self.error_thread and self.error_thread is not threading.current_thread():
+            self.error_thread.join()
+
+    def _log_errors(self, process: subprocess.Popen):
+        parser = GstStderrParser()
+        try:
+            # gst-launch-1.0 keeps running after warnings, and exits by itself after an error
+            for stderr_line in iter(process.stderr.readline, ""):
+                severity = parser.feed(stderr_line)
+                if severity >= GstSeverity.FATAL:
+                    logging.error(stderr_line.rstrip())
+                elif severity == GstSeverity.WARNING:
+                    logging.warning(stderr_line.rstrip())
+                else:
+                    logging.debug(stderr_line.rstrip())
+        except (OSError, ValueError):
+            pass
+        return_code = process.wait()
+
+        with self._lock:
+            # stopped on purpose
+            if self._process is not process:
+                return
+            self._process = None
+        error_block = parser.error_block
+        if not error_block:
+            error_block = [f"gst-launch-1.0 exited with code {return_code}"]
+            logging.error(error_block[0])
+        self.emit("error", error_block, parser.restartable)
+
+
+class GstEngine(PipelineEngine):
+    """
+    Runs the pipeline in process, errors are read from the pipeline bus
+    """
+
+    supports_live_properties = True
+    supports_samples = True
+    supports_tee_branches = True
+
+    # How often the bus thread checks if the pipeline was stopped
+    BUS_POLL_INTERVAL = 0.1
+    # Seconds to wait for a tee to finish pushing a buffer into a branch which is unlinked
+    UNLINK_TIMEOUT = 1.0
+
+    def __init__(self) -> None:
+        if not Gst:
+            raise RuntimeError("The GStreamer python bindings are not installed")
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pipeline: "Gst.Pipeline | None" = None
+        self._bus_thread: threading.Thread | None = None
+        # description and bin of the prepared branches, by branch name
+        self._prepared: Dict[str, Tuple[str, "Gst.Bin"]] = {}
+        # set by the bus thread when the end of stream reached the sinks of a tee branch which is drained
+        self._draining: Dict[str, threading.Event] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._pipeline is not None
+
+    @property
+    def pipeline(self) -> "Gst.Pipeline | None":
+        return self._pipeline
+
+    def start(self, branches: Dict[str, str]):
+        pipeline = Gst.Pipeline.new()
+        try:
+            for branch_name, pipeline_str in branches.items():
+                pipeline.add(self._create_branch(branch_name, pipeline_str))
+        except GLib.Error as e:
+            logging.error(f"Failed to construct pipeline: {e.message}")
+            # releases the prepared branches which were already added
+            pipeline.set_state(Gst.State.NULL)
+            self.emit("error", [e.message], False)
+            return
+
+        with self._lock:
+            self._pipeline = pipeline
+        self._bus_thread = threading.Thread(target=self._watch_bus, args=(pipeline,))
+        self._bus_thread.start()
+        # failures to change state are posted on the bus
+        pipeline.set_state(Gst.State.PLAYING)
+
+    def stop(self):
+        with self._lock:
+            pipeline = self._pipeline
+            self._pipeline = None
+        if not pipeline:
+            return
+        pipeline.set_state(Gst.State.NULL)
+        # the bus thread stops the pipeline itself, so it cannot be joined from there
+        if self._bus_thread and self._bus_thread is not threading.current_thread():
+            self._bus_thread.join()
+
+    def set_property(self, element_name: str, property_name: str, value: Any) -> bool:
+        element = self._get_element(element_name)
+        if not element:
+            return False
+        try:
+            element.set_property(property_name, value)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Failed to set {element_name}.{property_name} to {value}: {e}")
+            return False
+        return True
+
+    def emit_action_signal(self, element_name: str, signal_name: str, *args) -> bool:
+        element = self._get_element(element_name)
+        if not element:
+            return False
+        try:
+            element.emit(signal_name, *args)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Failed to emit {element_name}.{signal_name}{args}: {e}")
+            return False
+        return True
+
+    def send_upstream_event(self, element_name: str, structure: str) -> bool:
+        element = self._get_element(element_name)
+        pad = element.get_static_pad("src") if element else None
+        if not pad:
+            return False
+        event_structure = Gst.Structure.new_from_string(structure)
+        if not event_structure:
+            logging.warning(f"Invalid event structure: {structure}")
+            return False
+        return pad.send_event(Gst.Event.new_custom(Gst.EventType.CUSTOM_UPSTREAM, event_structure))
+
+    def get_property(self, element_name: str, property_name: str) -> Any:
+        element = self._get_element(element_name)
+        if not element or not element.find_property(property_name):
+            return None
+        value = element.get_property(property_name)
+        if isinstance(value, Gst.Structure):
+            return {
+                value.nth_field_name(i): value.get_value(value.nth_field_name(i))
+                for i in range(value.n_fields())
+            }
+        return value
+
+    def count_buffers(self, element_name: str, pad_name: str) -> BufferCounter | None:
+        element = self._get_element(element_name)
+        pad = element.get_static_pad(pad_name) if element else None
+        if not pad:
+            return None
+        counter = BufferCounter()
+        pad.add_probe(Gst.PadProbeType.BUFFER, counter._on_buffer)
+        return counter
+
+    def get_base_time(self) -> int | None:
+        pipeline = self._pipeline
+        return pipeline.get_base_time() if pipeline else None
+
+    def pull_sample(self, element_name: str, timeout: float) -> bytes | None:
+        element = self._get_element(element_name)
+        if not element:
+            return None
+        sample = element.emit("try-pull-sample", int(timeout * Gst.SECOND))
+        if not sample:
+            return None
+        buffer = sample.get_buffer()
+        (mapped, map_info) = buffer.map(Gst.MapFlags.READ)
+        if not mapped:
+            return None
+        try:
+            return bytes(map_info.data)
+        finally:
+            buffer.unmap(map_info)
+
+    def query_latency(self) -> float | None:
+        pipeline = self._pipeline
+        if not pipeline:
+            return None
+        query = Gst.Query.new_latency()
+        if not pipeline.query(query):
+            return None
+        (_, min_latency, _) = query.parse_latency()
+        return min_latency / Gst.SECOND
+
+    def add_branch(self, branch_name: str, pipeline_str: str) -> bool:
+        pipeline = self._pipeline
+        if not pipeline:
+            return False
+        try:
+            branch = self._create_branch(branch_name, pipeline_str)
+        except GLib.Error as e:
+            logging.error(f"Failed to construct branch {branch_name}: {e.message}")
+            return False
+        pipeline.add(branch)
+        # start the branch with the clock and base time of the running pipeline
+        if not branch.sync_state_with_parent():
+            branch.set_state(Gst.State.NULL)
+            pipeline.remove(branch)
+            return False
+        pipeline.recalculate_latency()
+        return True
+
+    def remove_branch(self, branch_name: str) -> bool:
+        pipeline = self._pipeline
+        branch = pipeline.get_by_name(branch_name) if pipeline else None
+        if not branch:
+            return False
+        branch.set_state(Gst.State.NULL)
+        pipeline.remove(branch)
+        pipeline.recalculate_latency()
+        return True
+
+    def add_tee_branch(
+        self, tee_name: str, branch_name: str, pipeline_str: str, keyframes_after: str | None = None
+    ) -> bool:
+        tee = self._get_element(tee_name)
+        if not tee:
+            return False
+        try:
+            # the sink pad of the first element is exposed on the bin
+            branch = Gst.parse_bin_from_description(pipeline_str, True)
+        except GLib.Error as e:
+            logging.error(f"Failed to construct branch {branch_name}: {e.message}")
+            return False
+        branch.set_name(branch_name)
+        if keyframes_after:
+            # the probe is in place before the branch is linked, so not even the first buffer slips through
+            element = branch.get_by_name(keyframes_after)
+            pad = element.get_static_pad("src") if element else None
+            if not pad:
+                logging.error(f"{branch_name} has no element {keyframes_after} to pass keyframes only")
+                return False
+            pad.add_probe(Gst.PadProbeType.BUFFER, self._drop_delta_units)
+
+        # pads can only be linked within the same bin
+        parent = tee.get_parent()
+        # the bin holding the tee keeps the end of stream of its children to itself otherwise, see remove_tee_branch
+        parent.set_property("message-forward", True)
+        parent.add(branch)
+        # start the branch before it receives buffers
+        if not branch.sync_state_with_parent():
+            branch.set_state(Gst.State.NULL)
+            parent.remove(branch)
+            return False
+        tee_pad = tee.request_pad(tee.get_pad_template("src_%u"), None, None)
+        if tee_pad.link(branch.get_static_pad("sink")) != Gst.PadLinkReturn.OK:
+            logging.error(f"Failed to link {branch_name} to {tee_name}")
+            tee.release_request_pad(tee_pad)
+            branch.set_state(Gst.State.NULL)
+            parent.remove(branch)
+            return False
+        return True
+
+    def remove_tee_branch(self, branch_name: str, drain_timeout: float = 0) -> bool:
+        branch = self._get_element(branch_name)
+        sink_pad = branch.get_static_pad("sink") if branch else None
+        tee_pad = sink_pad.get_peer() if sink_pad else None
+        if not tee_pad:
+            return False
+
+        # the tee may be pushing a buffer into the branch, so it is unlinked once the pad is idle
+        unlinked = threading.Event()
+
+        def unlink(pad, info):
+            pad.unlink(sink_pad)
+            unlinked.set()
+            return Gst.PadProbeReturn.REMOVE
+
+        tee_pad.add_probe(Gst.PadProbeType.IDLE, unlink)
+        if not unlinked.wait(self.UNLINK_TIMEOUT):
+            logging.warning(f"Timed out unlinking {branch_name}")
+        tee = tee_pad.get_parent_element()
+        tee.release_request_pad(tee_pad)
+
+        if drain_timeout:
+            drained = threading.Event()
+            with self._lock:
+                self._draining[branch_name] = drained
+            sink_pad.send_event(Gst.Event.new_eos())
+            if not drained.wait(drain_timeout):
+                logging.warning(f"Timed out draining {branch_name}")
+            with self._lock:
+                self._draining.pop(branch_name, None)
+
+        branch.set_state(Gst.State.NULL)
+        branch.get_parent().remove(branch)
+        return True
+
+    def _drop_delta_units(self, pad: "Gst.Pad", info: "Gst.PadProbeInfo") -> "Gst.PadProbeReturn":
+        # buffers which depend on the ones before them cannot be decoded on their own
+        if info.get_buffer().has_flags(Gst.BufferFlags.DELTA_UNIT):
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def prepare_branch(self, branch_name: str, pipeline_str: str) -> bool:
+        with self._lock:
+            prepared = self._prepared.get(branch_name)
+        if prepared and prepared[0] == pipeline_str:
+            return True
+        try:
+            branch = Gst.parse_bin_from_description(pipeline_str, False)
+        except GLib.Error as e:
+            logging.warning(f"Failed to prepare branch {branch_name}: {e.message}")
+            return False
+        branch.set_name(branch_name)
+        # READY loads the elements and opens the camera. Live sources do not preroll, so PAUSED would not get any
+        # further before PLAYING, but would already start the sinks.
+        if branch.set_state(Gst.State.READY) == Gst.StateChangeReturn.FAILURE:
+            logging.warning(f"Failed to prepare branch {branch_name}")
+            branch.set_state(Gst.State.NULL)
+            return False
+
+        with self._lock:
+            replaced = self._prepared.get(branch_name)
+            self._prepared[branch_name] = (pipeline_str, branch)
+        if replaced:
+            replaced[1].set_state(Gst.State.NULL)
+        return True
+
+    def discard_prepared(self):
+        with self._lock:
+            prepared = self._prepared
+            self._prepared = {}
+        for _, branch in prepared.values():
+            branch.set_state(Gst.State.NULL)
+
+    def _create_branch(self, branch_name: str, pipeline_str: str) -> "Gst.Bin":
+        with self._lock:
+            prepared = self._prepared.pop(branch_name, None)
+        if prepared:
+            if prepared[0] == pipeline_str:
+                return prepared[1]
+            # prepared for another configuration
+            prepared[1].set_state(Gst.State.NULL)
+        branch = Gst.parse_bin_from_description(pipeline_str, False)
+        branch.set_name(branch_name)
+        return branch
+
+    def _get_element(self, element_name: str) -> "Gst.Element | None":
+        pipeline = self._pipeline
+        if not pipeline:
+            return None
+        return pipeline.get_by_name(element_name)
+
+    def _watch_bus(self, pipeline: "Gst.Pipeline"):
+        bus = pipeline.get_bus()
+        while self._pipeline is pipeline:
+            message = bus.timed_pop_filtered(
+                int(self.BUS_POLL_INTERVAL * Gst.SECOND),
+                Gst.MessageType.ERROR | Gst.MessageType.EOS | Gst.MessageType.ELEMENT,
+            )
+            if not message:
+                continue
+
+            if message.type == Gst.MessageType.ELEMENT:
+                self._on_element_message(message)
+                continue
+
+            if message.type == Gst.MessageType.EOS:
+                # live sources only end when something went wrong, e.g. the camera was disconnected
+                logging.error("Pipeline reached the end of the stream")
+                if self._stop_failed(pipeline):
+                    self.emit("error", ["Pipeline reached the end of the stream"], True)
+                return
+
+            (error, debug) = message.parse_error()
+            error_block = [f"{message.src.get_name()}: {error.message}"]
+            if debug:
+                error_block.append(debug)
+            for line in error_block:
+                logging.error(line)
+            if self._stop_failed(pipeline):
+                restartable = all(classify_line(line) != GstSeverity.INVALID for line in error_block)
+                self.emit("error", error_block, restartable)
+            return
+
+    def _on_element_message(self, message: "Gst.Message"):
+        structure = message.get_structure()
+        if not structure or structure.get_name() != "GstBinForwarded":
+            return
+        # a child message forwarded by a bin with message-forward, see add_tee_branch
+        forwarded = structure.get_value("message")
+        if forwarded.type != Gst.MessageType.EOS:
+            return
+        with self._lock:
+            drained = self._draining.get(forwarded.src.get_name())
+        if drained:
+            drained.set()
+
+    def _stop_failed(self, pipeline: "Gst.Pipeline") -> bool:
+        """
+        Stop a pipeline which failed, from its bus thread
+
+        :return: False if the pipeline was stopped on purpose in the meantime, in which case the failure is not
+            reported. Whoever stopped it may be waiting for the bus thread.
+        """
+        with self._lock:
+            if self._pipeline is not pipeline:
+                return False
+            self._pipeline = None
+        pipeline.set_state(Gst.State.NULL)
+        return True
+
+
+def create_pipeline_engine(engine_type: PipelineEngineType | None = None) -> PipelineEngine:
+    """
+    Create a pipeline engine, falling back to gst-launch-1.0 if the in-process engine is not available
+    """
+    if engine_type is None:
+        engine_type = get_default_engine_type()
+    if engine_type == PipelineEngineType.GST:
+        if Gst:
+            return GstEngine()
+        logging.warning("GStreamer python bindings not found, falling back to gst-launch-1.0")
+    return SubprocessEngine()
@@ -23,6 +23,41 @@ class StreamEncodeTypeEnum(str, Enum):
 
 class StreamTypeEnum(str, Enum):
     UDP = "UDP"
+    # served to any number of clients by the RTSP server
+    RTSP = "RTSP"
+
+
+class RecordingContainerEnum(str, Enum):
+    MKV = "MKV"
+    MP4 = "MP4"
+
+
+class StreamLatencyProfileEnum(str, Enum):
+    # frames are buffered and sent in time, so the video plays evenly
+    SMOOTH = "SMOOTH"
+    # frames are sent as soon as they are ready and dropped when anything falls behind
+    LOW_LATENCY = "LOW_LATENCY"
+
+
+class H264EncoderEnum(str, Enum):
+    X264 = "X264"
+    OPENH264 = "OPENH264"
+    # V4L2 memory to memory hardware encoder
+    V4L2 = "V4L2"
+
+
+class X264PresetEnum(str, Enum):
+    # the speed-preset values of x264enc, from the fastest to the best compression
+    ULTRAFAST = "ultrafast"
+    SUPERFAST = "superfast"
+    VERYFAST = "veryfast"
+    FASTER = "faster"
+    FAST = "fast"
+    MEDIUM = "medium"
+    SLOW = "slow"
+    SLOWER = "slower"
+    VERYSLOW = "veryslow"
+    PLACEBO = "placebo"
 
 
 class H264Mode(IntEnum):
@@ -127,6 +162,132 @@ class StreamEndpointModel(BaseModel):
         from_attributes = True
 
 
+class MulticastOptionsModel(BaseModel):
+    """
+    Options of the endpoints of a stream with a multicast group address as host, which are sent a single copy of the
+    stream however many viewers joined the group
+    """
+
+    # hops the packets may travel, 1 keeps them on the local network
+    ttl: int = Field(1, ge=0, le=255)
+    # also deliver the packets to viewers on this device
+    loopback: bool = False
+    # network interface to send on, e.g. eth0, or None for the default route. Interface names are at most 15
+    # characters, and are part of the pipeline description
+    interface: Optional[str] = Field(None, pattern=r'^[A-Za-z0-9_.-]{1,15}$')
+
+    class Config:
+        from_attributes = True
+
+
+class StreamEndpointDescriptorModel(BaseModel):
+    bus_info: str
+    endpoint: StreamEndpointModel
+
+    class Config:
+        from_attributes = True
+
+
+class StreamStatsModel(BaseModel):
+    timestamp: float
+    # frames per second delivered by the encoder or camera
+    fps: float
+    # encoded bitrate in kbit/s
+    bitrate: float
+    # late buffers dropped by the sink since the previous sample
+    dropped: Optional[int] = None
+    # buffers waiting in the queue
+    queue_level: Optional[int] = None
+    # pipeline latency in ms
+    latency: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+
+class StreamRestartsModel(BaseModel):
+    # restarts after the pipeline failed
+    restart_count: int
+    # seconds between the failures and the restarts
+    total_downtime: float
+    last_downtime: Optional[float] = None
+    # the restart budget was used up, so the stream was stopped
+    gave_up: bool
+
+    class Config:
+        from_attributes = True
+
+
+class DeviceStreamStatsModel(BaseModel):
+    bus_info: str
+    stats: List[StreamStatsModel]
+    restarts: Optional[StreamRestartsModel] = None
+    # ms from starting the stream to its first frame being sent
+    time_to_first_packet: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+
+class StallWatchdogModel(BaseModel):
+    enabled: bool = True
+    # seconds without a new frame before the stream is restarted
+    timeout: float = 5.0
+
+    class Config:
+        from_attributes = True
+
+
+class EncoderModel(BaseModel):
+    # encoder of the SOFTWARE_H264 encode type
+    backend: H264EncoderEnum = H264EncoderEnum.X264
+    # x264 only, 0 picks the number of threads automatically
+    threads: int = Field(0, ge=0)
+    # x264 only
+    preset: X264PresetEnum = X264PresetEnum.ULTRAFAST
+    # maximum frames between keyframes, None for the default of the encoder
+    key_int_max: Optional[int] = Field(None, gt=0)
+
+    class Config:
+        from_attributes = True
+
+
+class EncoderCalibrationModel(BaseModel):
+    encoder: EncoderModel
+    # frames per second encoded on the test clip
+    fps: float
+    # ms of CPU time per frame
+    cpu_time: float
+    meets_target: bool
+
+    class Config:
+        from_attributes = True
+
+
+class RecordingModel(BaseModel):
+    # splitmuxsink location, with a printf format for the segment index
+    location: str
+    # seconds per segment
+    segment_duration: int
+    container: RecordingContainerEnum
+
+    class Config:
+        from_attributes = True
+
+
+class RecordingSegmentModel(BaseModel):
+    location: str
+    # bytes
+    size: int
+    # seconds between the start and the end of writing the segment
+    duration: float
+    # kB/s written to the storage
+    throughput: float
+
+    class Config:
+        from_attributes = True
+
+
 class StreamModel(BaseModel):
     device_path: str
     encode_type: StreamEncodeTypeEnum
@@ -136,6 +297,15 @@ class StreamModel(BaseModel):
     height: int
     interval: IntervalModel
     configured: bool
+    frame_tap: bool = False
+    # socket to connect to with shm_client.py when the frame tap is enabled
+    frame_tap_path: Optional[str] = None
+    recording: Optional[RecordingModel] = None
+    # path of the stream on the RTSP server, with the RTSP stream type
+    rtsp_mount: Optional[str] = None
+    multicast: Optional[MulticastOptionsModel] = None
+    encoder: Optional[EncoderModel] = None
+    latency_profile: StreamLatencyProfileEnum = StreamLatencyProfileEnum.SMOOTH
 
     class Config:
         from_attributes = True
@@ -156,6 +326,7 @@ class DeviceModel(BaseModel):
     is_leader: Optional[bool] = None
     leader: Optional[str] = None
     follower: Optional[str] = None
+    stall_watchdog: Optional[StallWatchdogModel] = None
 
     class Config:
         from_attributes = True
@@ -178,6 +349,8 @@ class StreamInfoModel(BaseModel):
     stream_format: StreamFormatModel
     encode_type: StreamEncodeTypeEnum
     endpoints: List[StreamEndpointModel]
+    stream_type: StreamTypeEnum = StreamTypeEnum.UDP
+    multicast: Optional[MulticastOptionsModel] = None
 
     class Config:
         from_attributes = True
@@ -192,6 +365,30 @@ class UVCControlModel(BaseModel):
         from_attributes = True
 
 
+class UVCControlValueModel(BaseModel):
+    control_id: int
+    value: float | int
+
+    class Config:
+        from_attributes = True
+
+
+class UVCControlsModel(BaseModel):
+    bus_info: str
+    controls: List[UVCControlValueModel]
+
+    class Config:
+        from_attributes = True
+
+
+class UVCControlErrorModel(BaseModel):
+    control_id: int
+    error: str
+
+    class Config:
+        from_attributes = True
+
+
 class DeviceNicknameModel(BaseModel):
     bus_info: str
     nickname: str
@@ -200,6 +397,58 @@ class DeviceNicknameModel(BaseModel):
         from_attributes = True
 
 
+class StartRecordingModel(BaseModel):
+    bus_info: str
+    segment_duration: int = Field(60, gt=0)
+    container: RecordingContainerEnum = RecordingContainerEnum.MKV
+
+    class Config:
+        from_attributes = True
+
+
+class DeviceRecordingModel(BaseModel):
+    bus_info: str
+    recording: Optional[RecordingModel] = None
+    # the most recent completed segments
+    segments: List[RecordingSegmentModel]
+
+    class Config:
+        from_attributes = True
+
+
+class DeviceEncoderModel(BaseModel):
+    bus_info: str
+    encoder: EncoderModel
+
+    class Config:
+        from_attributes = True
+
+
+class DeviceLatencyProfileModel(BaseModel):
+    bus_info: str
+    latency_profile: StreamLatencyProfileEnum
+
+    class Config:
+        from_attributes = True
+
+
+class DeviceFrameTapModel(BaseModel):
+    bus_info: str
+    enabled: bool
+
+    class Config:
+        from_attributes = True
+
+
+class DeviceStallWatchdogModel(BaseModel):
+    bus_info: str
+    enabled: bool
+    timeout: float = Field(gt=0)
+
+    class Config:
+        from_attributes = True
+
+
 class DeviceLeaderModel(BaseModel):
     follower: str
     leader: Optional[str] = None
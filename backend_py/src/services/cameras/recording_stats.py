@@ -0,0 +1,92 @@
+from collections import deque
+from typing import Deque, List
+import os
+import time
+
+from .pydantic_schemas import RecordingSegmentModel
+
+
+class RecordingStats:
+    """
+    Write throughput of the segments of a recording, from the files splitmuxsink writes. A segment is complete once
+    the next one was opened.
+    """
+
+    HISTORY_SIZE = 100
+
+    def __init__(
+        self,
+        location: str,
+        started_at: float | None = None,
+        history_size: int = HISTORY_SIZE,
+        start_index: int = 0,
+    ) -> None:
+        # splitmuxsink location, with a printf format for the segment index
+        self.location = location
+        self._segments: Deque[RecordingSegmentModel] = deque(maxlen=history_size)
+        # index of the segment being written, splitmuxsink starts at its start-index
+        self._index = start_index
+        # time the current segment was opened
+        self._opened_at = started_at if started_at is not None else time.time()
+
+    def sample(self, now: float | None = None) -> List[RecordingSegmentModel]:
+        """
+        Check for segments which were completed since the previous sample
+
+        :return: The completed segments
+        """
+        if now is None:
+            now = time.time()
+        completed = []
+        while os.path.exists(self.location % (self._index + 1)):
+            completed.append(self._complete(self.location % self._index, now))
+        return completed
+
+    def finish(self, now: float | None = None) -> List[RecordingSegmentModel]:
+        """
+        Complete the segment being written when the recording stopped
+
+        :return: The completed segments
+        """
+        if now is None:
+            now = time.time()
+        completed = self.sample(now)
+        current = self.location % self._index
+        if os.path.exists(current):
+            completed.append(self._complete(current, now))
+        return completed
+
+    def get_segments(self) -> List[RecordingSegmentModel]:
+        return list(self._segments)
+
+    def _complete(self, location: str, now: float) -> RecordingSegmentModel:
+        size = os.path.getsize(location)
+        # the last write to a segment is when it was closed
+        closed_at = self._get_mtime(location, now)
+        duration = max(closed_at - self._opened_at, 0)
+        segment = RecordingSegmentModel(
+            location=location,
+            size=size,
+            duration=duration,
+            throughput=size / duration / 1000 if duration else 0,
+        )
+        self._segments.append(segment)
+        self._index += 1
+        self._opened_at = closed_at
+        return segment
+
+    def _get_mtime(self, location: str, default: float) -> float:
+        try:
+            return os.path.getmtime(location)
+        except OSError:
+            return default
+
+
+def next_segment_index(location: str) -> int:
+    """
+    Index of the first segment which was not written yet, so a restarted recording does not overwrite its segments
+    """
+    index = 0
+    while os.path.exists(location % index):
+        index += 1
+    return index
@@ -0,0 +1,97 @@
+from typing import Dict
+import threading
+import logging
+
+from .pipeline_engine import Gst
+from .pydantic_schemas import StreamTypeEnum
+from .stream import Stream
+
+# The RTSP server is only available when the GObject introspection bindings of gst-rtsp-server are installed
+try:
+    import gi
+
+    gi.require_version("GstRtspServer", "1.0")
+    from gi.repository import GstRtspServer, GLib
+except (ImportError, ValueError):
+    GstRtspServer = None
+
+
+class RtspServer:
+    """
+    Serves the streams with the RTSP stream type to any number of clients. Every stream is encoded once by its own
+    pipeline and relayed to a shared media factory, so clients join and leave without touching the device.
+    """
+
+    DEFAULT_PORT = 8554
+
+    def __init__(self, port: int = DEFAULT_PORT) -> None:
+        self.port = port
+        self._server = None
+        self._loop = None
+        self._thread: threading.Thread | None = None
+        # mount path of every served stream, mapped to its launch description
+        self._mounts: Dict[str, str] = {}
+
+    @property
+    def available(self) -> bool:
+        return Gst is not None and GstRtspServer is not None
+
+    def start(self):
+        if not self.available:
+            logging.warning("The gst-rtsp-server python bindings are not installed, RTSP streams are not served")
+            return
+        if self._server:
+            return
+
+        context = GLib.MainContext()
+        self._server = GstRtspServer.RTSPServer()
+        self._server.set_service(str(self.port))
+        self._server.attach(context)
+        self._loop = GLib.MainLoop(context)
+        self._thread = threading.Thread(target=self._loop.run, daemon=True)
+        self._thread.start()
+        logging.info(f"RTSP server listening on port {self.port}")
+
+        for mount, launch in self._mounts.items():
+            self._add_factory(mount, launch)
+
+    def stop(self):
+        if not self._server:
+            return
+        self._loop.quit()
+        self._thread.join()
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    def update_stream(self, stream: Stream):
+        """
+        Serve the stream when it is configured with the RTSP stream type, stop serving it otherwise
+        """
+        mount = stream._rtsp_mount_path()
+        if stream.configured and stream.stream_type == StreamTypeEnum.RTSP:
+            launch = stream._construct_rtsp_launch()
+            if self._mounts.get(mount) == launch:
+                return
+            self.remove_mount(mount)
+            self._mounts[mount] = launch
+            if self._server:
+                self._add_factory(mount, launch)
+            return
+
+        self.remove_mount(mount)
+
+    def remove_mount(self, mount: str):
+        if self._mounts.pop(mount, None) is None:
+            return
+        if self._server:
+            self._server.get_mount_points().remove_factory(mount)
+            logging.info(f"Stopped serving {mount}")
+
+    def _add_factory(self, mount: str, launch: str):
+        factory = GstRtspServer.RTSPMediaFactory()
+        factory.set_launch(launch)
+        # every client of a mount shares one media, so the stream is relayed only once
+        factory.set_shared(True)
+        self._server.get_mount_points().add_factory(mount, factory)
+        logging.info(f"Serving rtsp://<host>:{self.port}{mount}")
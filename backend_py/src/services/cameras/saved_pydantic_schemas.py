@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from typing import List, Optional
 
-from .pydantic_schemas import StreamEndpointModel, IntervalModel, DeviceType, StreamEncodeTypeEnum, StreamTypeEnum
+from .pydantic_schemas import StreamEndpointModel, IntervalModel, DeviceType, StreamEncodeTypeEnum, StreamTypeEnum, StallWatchdogModel, MulticastOptionsModel, EncoderModel, StreamLatencyProfileEnum
 
 
 class SavedControlModel(BaseModel):
@@ -20,6 +20,10 @@ class SavedStreamModel(BaseModel):
     height: int
     interval: IntervalModel
     configured: bool
+    frame_tap: Optional[bool] = None
+    multicast: Optional[MulticastOptionsModel] = None
+    encoder: Optional[EncoderModel] = None
+    latency_profile: Optional[StreamLatencyProfileEnum] = None
 
     class Config:
         # use_enum_values = True
@@ -35,6 +39,7 @@ class SavedDeviceModel(BaseModel):
     device_type: DeviceType
     is_leader: Optional[bool] = None
     leader: Optional[str] = None
+    stall_watchdog: Optional[StallWatchdogModel] = None
 
     class Config:
         from_attributes = True
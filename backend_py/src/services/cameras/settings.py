@@ -9,7 +9,7 @@ from .saved_pydantic_schemas import SavedDeviceModel, SavedLeaderFollowerPairMod
 from .device import Device
 from .shd import SHDDevice
 
-from .device_utils import find_device_with_bus_info
+from .device_registry import DeviceRegistry
 
 class SettingsManager:
 
@@ -21,6 +21,8 @@ class SettingsManager:
             open(path, 'w').close()
             self.file_object = open(path, 'r+')
         self.to_save: List[SavedDeviceModel] = []
+        # Devices are loaded from multiple worker threads
+        self._load_lock = threading.Lock()
         self.thread = threading.Thread(target=self._run_settings_sync)
         self.thread.start()
 
@@ -37,6 +39,15 @@ class SettingsManager:
             self.file_object.flush()
 
     def load_device(self, device: Device):
+        with self._load_lock:
+            saved_device = self._find_saved_device(device)
+        if saved_device:
+            device.load_settings(saved_device)
+
+    def _find_saved_device(self, device: Device) -> SavedDeviceModel | None:
+        '''
+        Find the saved settings of a device, discarding them if they do not match the device type
+        '''
         for saved_device in self.settings:
             if saved_device.bus_info == device.bus_info:
                 if device.device_type != saved_device.device_type:
@@ -48,16 +59,16 @@ class SettingsManager:
                         if saved_device.leader:
                             self.leader_follower_pairs.append(SavedLeaderFollowerPairModel(leader_bus_info=saved_device.leader, follower_bus_info=saved_device.bus_info))
 
-                device.load_settings(saved_device)
-                return
+                return saved_device
+        return None
 
-    def load_leader_followers(self, devices: List[Device]):
+    def load_leader_followers(self, devices: DeviceRegistry):
         # TODO: make this code maybe in another class or something, but it works for now and it is clean enough
         # If a follower is plugged in and the leader is not attached yet, wait until it is attached to do anything
         # If a follower is plugged in and the leader is not a stellar leader, remove the leader information
         for leader_follower_pair in self.leader_follower_pairs:
-            leader = find_device_with_bus_info(devices, leader_follower_pair.leader_bus_info)
-            follower = find_device_with_bus_info(devices, leader_follower_pair.follower_bus_info)
+            leader = devices.get(leader_follower_pair.leader_bus_info)
+            follower = devices.get(leader_follower_pair.follower_bus_info)
 
             if not leader or not follower:
                 logging.warn(f'Error finding devices: {leader_follower_pair.leader_bus_info}, {leader_follower_pair.follower_bus_info}')
@@ -80,11 +91,21 @@ class SettingsManager:
             leader = cast(SHDDevice, leader)
 
             # set the leader
-            follower.set_leader(leader)
+            if follower.set_leader(leader):
+                devices.link(leader.bus_info, follower.bus_info)
 
             # The leader follower pair has been used and everything is good
             self.leader_follower_pairs.remove(leader_follower_pair)
 
+    def forget_leader(self, follower_bus_info: str):
+        '''
+        Drop the saved leader of a follower which load_leader_followers did not link yet
+        '''
+        with self._load_lock:
+            for pair in list(self.leader_follower_pairs):
+                if pair.follower_bus_info == follower_bus_info:
+                    self.leader_follower_pairs.remove(pair)
+
     def _save_device(self, saved_device: SavedDeviceModel):
         for dev in self.settings:
             if dev.bus_info == saved_device.bus_info:
@@ -2,6 +2,8 @@ import logging
 
 from .saved_pydantic_schemas import SavedDeviceModel
 from .enumeration import DeviceInfo
+from .format_cache import FormatCache
+from .pipeline_engine import PipelineEngineType
 from .device import Device, BaseOption, ControlTypeEnum, StreamEncodeTypeEnum
 from typing import Dict
 
@@ -15,6 +17,9 @@ class StellarOption(BaseOption, EventEmitter):
         self.value = value
 
     def set_value(self, value):
+        if value == self.value:
+            # avoid restarting the stream when nothing changed
+            return
         self.value = value
         self.emit("value_changed")
 
@@ -27,15 +32,19 @@ class SHDDevice(Device):
     Class for stellarHD devices
     """
 
-    def __init__(self, device_info: DeviceInfo, is_leader=True) -> None:
-        super().__init__(device_info)
+    def __init__(
+        self,
+        device_info: DeviceInfo,
+        is_leader=True,
+        format_cache: FormatCache | None = None,
+        engine_type: PipelineEngineType | None = None,
+    ) -> None:
+        super().__init__(device_info, format_cache, engine_type)
         self.is_leader = is_leader
         self.leader: str = None
         self.leader_device: "SHDDevice" = None
 
-        # Copy MJPEG over to Software H264, since they are the same thing
-        mjpg_camera = self.find_camera_with_format("MJPG")
-        mjpg_camera.formats["SOFTWARE_H264"] = mjpg_camera.formats["MJPG"]
+        self._add_software_h264_format()
 
         # For backend internal use only
         self.follower: str = None
@@ -44,6 +53,15 @@ class SHDDevice(Device):
             "bitrate", 5, ControlTypeEnum.INTEGER, 10, 0.1, 0.1
         )
 
+    def _add_software_h264_format(self):
+        # Copy MJPEG over to Software H264, since they are the same thing
+        mjpg_camera = self.find_camera_with_format("MJPG")
+        mjpg_camera.formats["SOFTWARE_H264"] = mjpg_camera.formats["MJPG"]
+
+    def refresh_formats(self):
+        super().refresh_formats()
+        self._add_software_h264_format()
+
     def _get_options(self) -> Dict[str, StellarOption]:
         options = {}
 
@@ -63,18 +81,18 @@ class SHDDevice(Device):
 
         return options
 
-    def set_leader(self, leader: "SHDDevice"):
+    def set_leader(self, leader: "SHDDevice") -> bool:
         # We love forward references
         if not leader.is_leader:
             logging.warning(
                 "Attempting to add follower SHD as a leader. This is undefined behavior and will not be permitted."
             )
-            return
+            return False
         if leader.follower:
             logging.warning(
                 "Attempted to add follower to SHD with follower. This is undefined behavior and will not be permitted."
             )
-            return
+            return False
         if self.leader_device:
             logging.info(
                 self._fmt_log(
@@ -91,10 +109,11 @@ class SHDDevice(Device):
         else:
             leader.stream_runner.streams[1] = self.stream
 
-        # restart leader's stream to now include this device
+        # add this device to the leader's pipeline, the leader is only restarted if the engine cannot add it live
         leader.stream.configured = True
         leader.follower = self.bus_info
         leader.start_stream()
+        return True
 
     def load_settings(self, saved_device: SavedDeviceModel):
         return super().load_settings(saved_device)
@@ -109,7 +128,7 @@ class SHDDevice(Device):
             self.leader_device.stream_runner.streams.remove(self.stream)
         except ValueError:
             logging.warning("Tried to remove stream from leader without a stream")
-        # restart the leader device stream to take this device out of it
+        # take this device out of the leader's pipeline, without restarting the leader when possible
         if self.leader_device.stream_runner.started:
             self.leader_device.start_stream()
         self.leader_device.follower = None
@@ -119,6 +138,12 @@ class SHDDevice(Device):
         if self.stream.configured:
             self.stream_runner.start()
 
+    def get_stream_runner(self):
+        # a follower's stream is part of the leader's pipeline
+        if self.leader_device:
+            return self.leader_device.stream_runner
+        return self.stream_runner
+
     def start_stream(self):
         if not self.is_leader:
             if self.leader:
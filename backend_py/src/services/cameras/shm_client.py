@@ -0,0 +1,153 @@
+"""
+Client for the frame tap of a stream, the shared memory sink enabled with /devices/set_frame_tap
+
+Speaks the control protocol of GStreamer's shmsink over its unix socket and maps the shared memory areas it announces,
+so frames are read without copying them and without GStreamer. The frames are in the format the camera delivers them
+in (see the encode type of the stream), one encoded frame per buffer.
+
+Has no dependencies on the rest of the backend, so it can be copied into other processes:
+
+    with ShmFrameClient("/tmp/dwe_os_frames_video0") as client:
+        while True:
+            with client.read_frame() as frame:
+                process(frame.data)
+"""
+
+from ctypes import Structure, Union, c_int, c_size_t, c_uint, c_ulong, sizeof
+from typing import Dict
+import mmap
+import os
+import socket
+
+# command types of shmpipe.c
+_COMMAND_NEW_SHM_AREA = 1
+_COMMAND_CLOSE_SHM_AREA = 2
+_COMMAND_NEW_BUFFER = 3
+_COMMAND_ACK_BUFFER = 4
+
+
+class _NewShmArea(Structure):
+    _fields_ = [("size", c_size_t), ("path_size", c_uint)]
+
+
+class _Buffer(Structure):
+    _fields_ = [("offset", c_ulong), ("size", c_ulong), ("bsize", c_ulong)]
+
+
+class _AckBuffer(Structure):
+    _fields_ = [("offset", c_ulong)]
+
+
+class _Payload(Union):
+    _fields_ = [("new_shm_area", _NewShmArea), ("buffer", _Buffer), ("ack_buffer", _AckBuffer)]
+
+
+class _CommandBuffer(Structure):
+    """
+    struct CommandBuffer of shmpipe.c, in the layout of the native ABI like shmsink itself
+    """
+
+    _fields_ = [("type", c_uint), ("area_id", c_int), ("payload", _Payload)]
+
+
+class ShmFrame:
+    """
+    A frame in the shared memory of the sink. The sink does not reuse its memory until the frame is released.
+    """
+
+    def __init__(self, client: "ShmFrameClient", area_id: int, offset: int, data: memoryview) -> None:
+        self._client = client
+        self._area_id = area_id
+        self._offset = offset
+        self.data = data
+
+    def release(self):
+        if self.data is None:
+            return
+        self.data.release()
+        self.data = None
+        self._client._ack_buffer(self._area_id, self._offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class ShmFrameClient:
+    """
+    Reads the frames of a frame tap. Not thread safe, use one client per thread.
+    """
+
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+        self._socket: socket.socket | None = None
+        self._areas: Dict[int, mmap.mmap] = {}
+
+    def connect(self, timeout: float | None = None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(self.socket_path)
+
+    def close(self):
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+        for area in self._areas.values():
+            area.close()
+        self._areas = {}
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read_frame(self) -> ShmFrame:
+        """
+        Wait for the next frame
+
+        :raises ConnectionError: When the stream stopped
+        :raises TimeoutError: When no frame arrived within the timeout passed to connect
+        """
+        while True:
+            command = _CommandBuffer.from_buffer_copy(self._recv(sizeof(_CommandBuffer)))
+            if command.type == _COMMAND_NEW_SHM_AREA:
+                new_area = command.payload.new_shm_area
+                path = self._recv(new_area.path_size).rstrip(b"\0").decode()
+                self._open_area(command.area_id, path, new_area.size)
+            elif command.type == _COMMAND_CLOSE_SHM_AREA:
+                area = self._areas.pop(command.area_id, None)
+                if area:
+                    area.close()
+            elif command.type == _COMMAND_NEW_BUFFER:
+                buffer = command.payload.buffer
+                area = self._areas[command.area_id]
+                data = memoryview(area)[buffer.offset : buffer.offset + buffer.size]
+                return ShmFrame(self, command.area_id, buffer.offset, data)
+
+    def _open_area(self, area_id: int, path: str, size: int):
+        # shm_open names live in /dev/shm
+        fd = os.open(os.path.join("/dev/shm", path.lstrip("/")), os.O_RDONLY)
+        try:
+            self._areas[area_id] = mmap.mmap(fd, size, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+    def _ack_buffer(self, area_id: int, offset: int):
+        if not self._socket:
+            return
+        command = _CommandBuffer(type=_COMMAND_ACK_BUFFER, area_id=area_id)
+        command.payload.ack_buffer.offset = offset
+        self._socket.sendall(bytes(command))
+
+    def _recv(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("The frame tap was closed")
+            data += chunk
+        return bytes(data)
@@ -0,0 +1,53 @@
+from concurrent.futures import Executor
+from typing import Callable
+import asyncio
+import time
+
+
+class SnapshotCache:
+    """
+    Caches the snapshot of a device for a short time, and lets concurrent requests share a single frame grab
+    """
+
+    DEFAULT_TTL = 1.0
+
+    def __init__(
+        self,
+        grab: Callable[[], bytes | None],
+        ttl: float = DEFAULT_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._grab = grab
+        self.ttl = ttl
+        self._clock = clock
+        self._snapshot: bytes | None = None
+        self._taken_at = 0.0
+        self._pending: asyncio.Future | None = None
+        # frames grabbed, as opposed to requests served
+        self.grabs = 0
+
+    async def get(self, executor: Executor | None = None) -> bytes | None:
+        """
+        :param executor: Executor to grab the frame in, since grabbing blocks until the next frame
+        :return: The snapshot, or None if no frame could be grabbed
+        """
+        if self._snapshot is not None and self._clock() - self._taken_at < self.ttl:
+            return self._snapshot
+        if not self._pending:
+            self._pending = asyncio.ensure_future(self._grab_snapshot(executor))
+        # a cancelled request must not cancel the grab the other requests wait for
+        return await asyncio.shield(self._pending)
+
+    def invalidate(self):
+        self._snapshot = None
+
+    async def _grab_snapshot(self, executor: Executor | None) -> bytes | None:
+        try:
+            self.grabs += 1
+            snapshot = await asyncio.get_running_loop().run_in_executor(executor, self._grab)
+            if snapshot is not None:
+                self._snapshot = snapshot
+                self._taken_at = self._clock()
+            return snapshot
+        finally:
+            self._pending = None
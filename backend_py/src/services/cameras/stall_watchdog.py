@@ -0,0 +1,52 @@
+import time
+
+
+class StallWatchdog:
+    """
+    Detects a stream whose camera stopped delivering frames while the pipeline keeps running, e.g. after a USB
+    brown-out
+    """
+
+    DEFAULT_TIMEOUT = 5.0
+
+    def __init__(self, enabled: bool = True, timeout: float = DEFAULT_TIMEOUT) -> None:
+        self.enabled = enabled
+        # seconds without a new frame before the stream is considered stalled
+        self.timeout = timeout
+        self._last_frames: int | None = None
+        self._last_progress: float | None = None
+
+    def configure(self, enabled: bool, timeout: float):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.reset()
+
+    def reset(self):
+        self._last_frames = None
+        self._last_progress = None
+
+    def check(self, frames: int | None, now: float | None = None) -> float | None:
+        """
+        Check the frame count of the stream
+
+        :param frames: The number of frames delivered so far, or None if the stream is not running
+        :return: The time in seconds since the last frame if the stream stalled, otherwise None. A stall is reported
+            once per timeout, so it can be acted on again if the stream does not recover.
+        """
+        if now is None:
+            now = time.monotonic()
+        if not self.enabled or frames is None:
+            self.reset()
+            return None
+
+        # the count starts over when the stream is restarted, which is progress too
+        if frames != self._last_frames or self._last_progress is None:
+            self._last_frames = frames
+            self._last_progress = now
+            return None
+
+        stalled_for = now - self._last_progress
+        if stalled_for < self.timeout:
+            return None
+        self._last_progress = now
+        return stalled_for
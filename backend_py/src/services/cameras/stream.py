@@ -1,16 +1,32 @@
 from dataclasses import dataclass, field
-from typing import List
-import subprocess
-from multiprocessing import Process
-import time
-import shlex
+from typing import Any, Callable, Dict, List, Tuple
+import os
 import threading
+import time
 import event_emitter as events
 
 from .pydantic_schemas import *
+from .pipeline_engine import BufferCounter, PipelineEngineType, create_pipeline_engine, element_available
+from .stream_stats import StreamCounters
+from .recording_stats import next_segment_index
+from .encoders import create_encoder
+from .stream_supervisor import StreamSupervisor
 
 import logging
 
+# unix socket of the shared memory sink, see shm_client.py
+FRAME_TAP_PATH = "/tmp/dwe_os_frames_{}"
+# room for a few frames of the largest MJPG frames
+FRAME_TAP_SHM_SIZE = 32 * 1024 * 1024
+# the streams with the RTSP stream type are relayed to the RTSP server from this port on, see rtsp_server.py
+RTSP_RELAY_BASE_PORT = 18000
+# nanoseconds of frames the recording queue holds while the storage is slow, before it drops them
+RECORDING_QUEUE_TIME = 3_000_000_000
+# seconds the recording branch may take to finish its last segment when the recording stops
+RECORDING_DRAIN_TIMEOUT = 2.0
+# makes a video encoder encode the next frame as a keyframe, with the stream headers
+FORCE_KEY_UNIT_EVENT = "GstForceKeyUnit, all-headers=(boolean)true"
+
 
 @dataclass
 class Stream(events.EventEmitter):
@@ -24,11 +40,155 @@ class Stream(events.EventEmitter):
         default_factory=lambda: IntervalModel(numerator=1, denominator=30)
     )
     configured: bool = False
+    # share the frames of the camera with local processes over shared memory
+    frame_tap: bool = False
+    latency_profile: StreamLatencyProfileEnum = StreamLatencyProfileEnum.SMOOTH
+    # encoder of the SOFTWARE_H264 encode type
+    encoder: EncoderModel = field(default_factory=EncoderModel)
+    # options of the endpoints with a multicast group address
+    multicast: MulticastOptionsModel | None = None
+    # record the encoded stream into segments while streaming
+    recording: RecordingModel | None = None
 
     software_h264_bitrate = 5000
 
-    def _construct_pipeline(self):
-        return f"{self._build_source()} ! {self._construct_caps()} ! {self._build_payload()} ! {self._build_sink()}"
+    def __post_init__(self):
+        # emits "clients_added" when clients were added to the sink of the running stream
+        events.EventEmitter.__init__(self)
+
+    def _element_name(self, role: str):
+        # element names need to be unique when a leader and follower share a pipeline
+        return f"{os.path.basename(self.device_path)}_{role}"
+
+    def _branch_name(self):
+        """
+        Name of the bin holding the elements of this stream, when it shares a pipeline with other streams
+        """
+        return self._element_name("branch")
+
+    @property
+    def frame_tap_path(self) -> str | None:
+        if not self.frame_tap:
+            return None
+        return FRAME_TAP_PATH.format(os.path.basename(self.device_path))
+
+    @property
+    def rtsp_mount(self) -> str | None:
+        if self.stream_type != StreamTypeEnum.RTSP:
+            return None
+        return self._rtsp_mount_path()
+
+    def _rtsp_mount_path(self):
+        return f"/{os.path.basename(self.device_path)}"
+
+    def _rtsp_relay_port(self):
+        # unique per video node
+        node_number = "".join(filter(str.isdigit, os.path.basename(self.device_path)))
+        return RTSP_RELAY_BASE_PORT + int(node_number or 0)
+
+    def _construct_rtsp_launch(self):
+        """
+        The launch description of the RTSP media factory, which receives the stream relayed by _build_sink
+        """
+        if self.encode_type == StreamEncodeTypeEnum.MJPG:
+            caps = "application/x-rtp,media=video,clock-rate=90000,encoding-name=JPEG,payload=26"
+        else:
+            caps = "application/x-rtp,media=video,clock-rate=90000,encoding-name=H264,payload=96"
+        return f'( udpsrc name=pay0 address=127.0.0.1 port={self._rtsp_relay_port()} caps="{caps}" )'
+
+    def _structure_key(self) -> Tuple:
+        """
+        Everything which changes the elements of the pipeline, as opposed to the properties in _live_properties
+        """
+        return (
+            self.device_path,
+            self.encode_type,
+            self.stream_type,
+            self.width,
+            self.height,
+            self.interval.numerator,
+            self.interval.denominator,
+            len(self.endpoints) > 0,
+            self.frame_tap,
+            self.latency_profile,
+            # applied when the sink opens its socket
+            self.multicast.model_dump_json() if self.multicast else None,
+            self._encoder_structure_key(),
+        )
+
+    def _recording_key(self):
+        """
+        Everything which changes the recording branch, which is linked and unlinked on its own, see
+        StreamRunner._update_recording
+        """
+        if not self.recording:
+            return None
+        return (self.recording.location, self.recording.segment_duration, self.recording.container)
+
+    def _live_properties(self) -> List[Tuple[str, str, Any]]:
+        """
+        The (element name, property, value) of every property which can be changed on a running pipeline
+        """
+        if self.encode_type != StreamEncodeTypeEnum.SOFTWARE_H264:
+            return []
+        return create_encoder(self.encoder).live_properties(
+            self._element_name("encoder"), self.software_h264_bitrate
+        )
+
+    def _encoder_structure_key(self):
+        if self.encode_type != StreamEncodeTypeEnum.SOFTWARE_H264:
+            return None
+        # encoders which cannot change their bitrate live are rebuilt with the new bitrate
+        live = bool(self._live_properties())
+        return (self.encoder.model_dump_json(), None if live else self.software_h264_bitrate)
+
+    def _sink_clients(self) -> List[Tuple[str, int]]:
+        """
+        The (host, port) of every client of the UDP sink
+        """
+        if self.stream_type != StreamTypeEnum.UDP:
+            return []
+        return [(endpoint.host, endpoint.port) for endpoint in self.endpoints]
+
+    def _clients(self):
+        return ",".join(f"{host}:{port}" for (host, port) in self._sink_clients())
+
+    def _construct_pipeline(self, dynamic_branches: bool = False):
+        """
+        :param dynamic_branches: Keep the tees the runner links the snapshot and recording branches to when they are
+            needed, when the engine can link branches to a running pipeline. Otherwise the recording is part of the
+            pipeline.
+        """
+        # (tee, branch) of every branch besides the stream itself
+        tee_branches = []
+        if self.frame_tap:
+            tee_branches.append((self._element_name("tee"), self._build_frame_tap()))
+        if self.recording and not dynamic_branches:
+            tee_branches.append((self._recording_tee(), self._build_recording()))
+
+        pipeline = f"{self._build_source()} ! {self._construct_caps()}"
+        if any(tee == self._element_name("tee") for (tee, _) in tee_branches):
+            # the camera delivers whole JPEG frames, except on the H264 encode type
+            leaky = self.encode_type != StreamEncodeTypeEnum.H264
+            pipeline += f" ! tee name={self._element_name('tee')} ! {self._build_queue(leaky=leaky)}"
+        elif dynamic_branches:
+            # the linked branches start with their own queue, so the tee only passes the frames on
+            pipeline += f" ! tee name={self._element_name('tee')}"
+        pipeline += f" ! {self._build_payload(dynamic_branches)} ! {self._build_sink()}"
+        for tee, branch in tee_branches:
+            pipeline += f" {tee}. ! {branch}"
+        return pipeline
+
+    def _prepare(self):
+        """
+        Clean up after a previous pipeline before this stream is started
+        """
+        # shmsink cannot listen on the socket of a pipeline which was killed
+        if self.frame_tap and os.path.exists(self.frame_tap_path):
+            try:
+                os.remove(self.frame_tap_path)
+            except OSError as e:
+                logging.warning(f"Cannot remove the stale frame tap socket: {e}")
 
     def _get_format(self):
         match self.encode_type:
@@ -47,29 +207,119 @@ class Stream(events.EventEmitter):
     def _construct_caps(self):
         return f"{self._get_format()},width={self.width},height={self.height},framerate={self.interval.denominator}/{self.interval.numerator}"
 
-    def _build_payload(self):
+    def _build_payload(self, dynamic_branches: bool = False):
         match self.encode_type:
             case StreamEncodeTypeEnum.H264:
-                return "h264parse ! queue ! rtph264pay config-interval=10 pt=96"
+                return f"h264parse ! {self._build_queue('queue')} ! rtph264pay name={self._element_name('payloader')} config-interval={self._config_interval()} pt=96"
             case StreamEncodeTypeEnum.MJPG:
-                return "rtpjpegpay"
+                return f"rtpjpegpay name={self._element_name('payloader')}"
             case StreamEncodeTypeEnum.SOFTWARE_H264:
-                return f"jpegdec ! queue ! x264enc byte-stream=true tune=zerolatency bitrate={self.software_h264_bitrate} speed-preset=ultrafast ! rtph264pay config-interval=10 pt=96"
+                encoder = create_encoder(self.encoder).build(
+                    self._element_name("encoder"), self.software_h264_bitrate, self._low_latency()
+                )
+                return f"jpegdec ! {self._build_queue('queue', leaky=True)} ! {encoder}{self._build_encoder_tee(dynamic_branches)} ! rtph264pay name={self._element_name('payloader')} config-interval={self._config_interval()} pt=96"
             case _:
                 return ""
 
+    def _low_latency(self):
+        return self.latency_profile == StreamLatencyProfileEnum.LOW_LATENCY
+
+    def _build_queue(self, role: str | None = None, leaky: bool = False):
+        """
+        A queue of the path of the stream
+
+        :param leaky: Whether the queue may drop frames with the low latency profile, only for raw or JPEG frames.
+            Dropping an H.264 frame corrupts the picture until the next keyframe, so those queues never drop, the
+            low latency profile relies on the sink not syncing instead.
+        """
+        queue = f"queue name={self._element_name(role)}" if role else "queue"
+        if leaky and self._low_latency():
+            # hold one frame at most, a newer frame replaces it when the next element falls behind
+            queue += " leaky=downstream max-size-buffers=1 max-size-bytes=0 max-size-time=0"
+        return queue
+
+    def _config_interval(self):
+        # with -1 the SPS and PPS are sent with every keyframe, so a decoder which joins can start right away
+        return -1 if self._low_latency() else 10
+
+    def _sink_sync(self):
+        # without sync, packets are sent as soon as they are ready instead of waiting for their timestamp
+        return "false" if self._low_latency() else "true"
+
+    def _build_frame_tap(self):
+        # a reader which does not keep up only misses frames, it does not hold up the stream
+        return (
+            f"queue name={self._element_name('frame_tap_queue')} leaky=downstream max-size-buffers=2 ! "
+            f"shmsink name={self._element_name('frame_tap')} socket-path={self.frame_tap_path} "
+            f"shm-size={FRAME_TAP_SHM_SIZE} wait-for-connection=false sync=false"
+        )
+
+    def _snapshot_supported(self):
+        # the other encode types deliver JPEG frames from the camera
+        return self.encode_type != StreamEncodeTypeEnum.H264 or element_available("avdec_h264")
+
+    def _build_snapshot(self):
+        """
+        The branch linked to the camera tee while StreamRunner.pull_snapshot takes a snapshot
+        """
+        sink = f"appsink name={self._element_name('snapshot')} max-buffers=1 drop=true sync=false"
+        if self.encode_type != StreamEncodeTypeEnum.H264:
+            return f"queue leaky=downstream max-size-buffers=1 ! {sink}"
+        # a new decoder for every snapshot, which starts from the keyframe the parser lets through
+        return (
+            f"queue ! h264parse name={self._element_name('snapshot_parse')} ! avdec_h264 ! videoconvert ! jpegenc ! "
+            f"{sink}"
+        )
+
+    def _recording_tee(self):
+        # software encoded streams are recorded after the encoder, the others as the camera delivers them
+        if self.encode_type == StreamEncodeTypeEnum.SOFTWARE_H264:
+            return self._element_name("encoder_tee")
+        return self._element_name("tee")
+
+    def _build_encoder_tee(self, dynamic_branches: bool = False):
+        if self._recording_tee() != self._element_name("encoder_tee"):
+            return ""
+        if dynamic_branches:
+            return f" ! tee name={self._element_name('encoder_tee')}"
+        if not self.recording:
+            return ""
+        return f" ! tee name={self._element_name('encoder_tee')} ! {self._build_queue()}"
+
+    def _build_recording(self):
+        recording = self.recording
+        parse = "" if self.encode_type == StreamEncodeTypeEnum.MJPG else "h264parse ! "
+        muxer = "matroskamux"
+        if recording.container == RecordingContainerEnum.MP4:
+            # fragmented, so the segment being written when the recording stops can still be played
+            muxer = 'mp4mux muxer-properties="properties,fragment-duration=1000"'
+        # storage which does not keep up drops frames of the recording, it does not hold up the stream
+        return (
+            f"queue name={self._element_name('recording_queue')} leaky=downstream max-size-buffers=0 "
+            f"max-size-bytes=0 max-size-time={RECORDING_QUEUE_TIME} ! {parse}"
+            f"splitmuxsink name={self._element_name('recorder')} location={recording.location} "
+            f"max-size-time={recording.segment_duration * 1_000_000_000} "
+            f"start-index={next_segment_index(recording.location)} muxer-factory={muxer}"
+        )
+
+    def _build_multicast_options(self):
+        if not self.multicast:
+            return ""
+        # the sink only sends to the groups, joining them is up to the viewers
+        options = f" auto-multicast=false ttl-mc={self.multicast.ttl} loop={str(self.multicast.loopback).lower()}"
+        if self.multicast.interface:
+            options += f" multicast-iface={self.multicast.interface}"
+        return options
+
     def _build_sink(self):
         match self.stream_type:
             case StreamTypeEnum.UDP:
                 if len(self.endpoints) == 0:
-                    return "fakesink"
-                sink = "multiudpsink sync=true clients="
-                for endpoint, i in zip(self.endpoints, range(len(self.endpoints))):
-                    sink += f"{endpoint.host}:{endpoint.port}"
-                    if i < len(self.endpoints) - 1:
-                        sink += ","
-
-                return sink
+                    return f"fakesink name={self._element_name('sink')}"
+                return f"multiudpsink name={self._element_name('sink')} sync={self._sink_sync()} clients={self._clients()}{self._build_multicast_options()}"
+            case StreamTypeEnum.RTSP:
+                # relayed to the RTSP server, which serves every client from the same stream
+                return f"udpsink name={self._element_name('sink')} host=127.0.0.1 port={self._rtsp_relay_port()} sync={self._sink_sync()}"
             case _:
                 return ""
 
@@ -82,62 +332,412 @@ class Stream(events.EventEmitter):
 
 class StreamRunner(events.EventEmitter):
 
-    def __init__(self, *streams: Stream) -> None:
+    def __init__(
+        self, *streams: Stream, engine_type: PipelineEngineType | None = None
+    ) -> None:
         super().__init__()
         self.streams = [*streams]
-        self.pipeline = None
-        self.loop = None
         self.started = False
-        self.error_thread = None
+        # held by every public method and by the restart timer and engine callbacks, which run on other threads
+        self._lock = threading.RLock()
+        self.engine = create_pipeline_engine(engine_type)
+        self.engine.on("error", self._on_error)
+        # structure of every branch of the running pipeline, see Stream._structure_key
+        self._structure: Dict[str, Tuple] = {}
+        # clients of the UDP sink of every branch of the running pipeline
+        self._sink_clients: Dict[str, List[Tuple[str, int]]] = {}
+        # encoded frames of every branch of the running pipeline
+        self._frame_counters: Dict[str, BufferCounter] = {}
+        # time.monotonic at which every branch of the running pipeline was started
+        self._started_at: Dict[str, float] = {}
+        # recording linked to every branch of the running pipeline, see Stream._recording_key
+        self._recordings: Dict[str, Tuple] = {}
+        # restarts the pipeline after it failed
+        self.supervisor = StreamSupervisor()
+        self._restart_timer: threading.Timer | None = None
 
     def start(self):
-        if self.started:
-            logging.info("Joining thread")
-            self.stop()
-            self.error_thread.join()
-        self.started = True
-        self._run_pipeline()
+        with self._lock:
+            if self.started:
+                if self._update_live():
+                    return
+                logging.info("Restarting pipeline")
+                self.stop()
+            self.started = True
+            self.supervisor.reset()
+            self._run_pipeline()
 
     def stop(self):
-        if not self.started or not self._process:
-            return
-        self.started = False
-        self._process.kill()
-        self._process.wait()
-        del self._process
+        with self._lock:
+            if not self.started:
+                return
+            self.started = False
+            self._cancel_restart()
+            self._structure = {}
+            self._sink_clients = {}
+            self._frame_counters = {}
+            self._started_at = {}
+            self._recordings = {}
+            self.engine.stop()
+
+    def prepare_stream(self, stream: Stream) -> bool:
+        """
+        Construct the branch of a stream ahead of time and open its camera, so starting the stream, or switching the
+        running stream to its format, does not wait for the pipeline to be built. The stream does not need to be
+        configured or part of this runner yet.
+
+        :return: False if the engine cannot prepare the branch
+        """
+        with self._lock:
+            # the stale frame tap socket is only removed when the branch is started, it may belong to the running branch
+            pipeline_str = stream._construct_pipeline(self.engine.supports_tee_branches)
+            if not self.engine.prepare_branch(stream._branch_name(), pipeline_str):
+                return False
+            logging.info(f"Prepared {stream._branch_name()}")
+            return True
+
+    def discard_prepared(self):
+        """
+        Release the branches of prepare_stream and their cameras
+        """
+        with self._lock:
+            self.engine.discard_prepared()
+
+    def set_property(self, element_name: str, property_name: str, value: Any) -> bool:
+        """
+        Change a property of the running pipeline without restarting it
+
+        :return: False if the engine cannot change the property live
+        """
+        with self._lock:
+            return self.started and self.engine.set_property(element_name, property_name, value)
+
+    def restart_stream(self, stream: Stream) -> bool:
+        """
+        Rebuild the branch of one stream, which re-opens its camera, without interrupting the other streams. Counts
+        against the restart budget of the supervisor, and waits for its backoff delay like a failed pipeline.
+
+        :return: False if the restart budget is used up, in which case the runner is stopped
+        """
+        with self._lock:
+            if self._restart_timer:
+                # a restart is already scheduled
+                return True
+            delay = self.supervisor.on_failure()
+            if delay is None:
+                logging.error("Stream stalled too many times, giving up")
+                self.stop()
+                self.emit("gst_error", ["Stream stalled too many times"])
+                return False
+
+            logging.warning(
+                f"Restarting {stream._branch_name()} in {delay} s (restart {self.supervisor.restart_count})"
+            )
+            self._schedule_restart(delay, self._restart_branch, stream)
+            return True
+
+    def _restart_branch(self, stream: Stream):
+        with self._lock:
+            self._restart_timer = None
+            if not self.started:
+                return
+
+            branch_name = stream._branch_name()
+            if (
+                self.engine.running
+                and branch_name in self._structure
+                and self.engine.remove_branch(branch_name)
+            ):
+                self._forget_branch(branch_name)
+                # adds the branch again
+                if self._update_live():
+                    self.supervisor.on_started()
+                    return
+
+            self.stop()
+            self.started = True
+            self._run_pipeline()
+
+    def pull_snapshot(
+        self, stream: Stream, timeout: float, request_keyframe: Callable[[], bool] | None = None
+    ) -> bytes | None:
+        """
+        Take the next frame of a stream as JPEG. The snapshot branch is only linked to the running pipeline while
+        taking the snapshot, H.264 frames are decoded from the next keyframe on.
+
+        :param request_keyframe: Makes the camera send a keyframe, so an H.264 snapshot does not wait for the next one
+        :return: The frame, or None if the stream is not running or the engine cannot read frames
+        """
+        branch_name = stream._element_name("snapshot_branch")
+        sink_name = stream._element_name("snapshot")
+        h264 = stream.encode_type == StreamEncodeTypeEnum.H264
+        with self._lock:
+            if (
+                not self.started
+                or not self.engine.supports_samples
+                or not self.engine.supports_tee_branches
+                or not stream._snapshot_supported()
+                or stream._branch_name() not in self._structure
+            ):
+                return None
+            # the decoder cannot start from the frames in between keyframes
+            keyframes_after = stream._element_name("snapshot_parse") if h264 else None
+            if not self.engine.add_tee_branch(
+                stream._element_name("tee"), branch_name, stream._build_snapshot(), keyframes_after
+            ):
+                return None
+        # the lock is not held while waiting for the frame, the sink is gone if the pipeline changes meanwhile
+        try:
+            if h264 and request_keyframe:
+                request_keyframe()
+            return self.engine.pull_sample(sink_name, timeout)
+        finally:
+            with self._lock:
+                self.engine.remove_tee_branch(branch_name)
+
+    def request_keyframe(self, stream: Stream) -> bool:
+        """
+        Make the software encoder of a stream encode the next frame as a keyframe, so new clients can start decoding
+
+        :return: False if the stream is not running or the engine cannot send events to the encoder
+        """
+        with self._lock:
+            if not self.started:
+                return False
+            return self.engine.send_upstream_event(stream._element_name("encoder"), FORCE_KEY_UNIT_EVENT)
+
+    def get_counters(self, stream: Stream) -> StreamCounters | None:
+        """
+        Read the counters of a stream from the running pipeline
+
+        :return: The counters, or None if the stream is not running or the engine cannot count frames
+        """
+        with self._lock:
+            frame_counter = self._frame_counters.get(stream._branch_name())
+            if not self.started or not frame_counter:
+                return None
+            sink_stats = self.engine.get_property(stream._element_name("sink"), "stats") or {}
+            return StreamCounters(
+                frames=frame_counter.buffers,
+                bytes=frame_counter.bytes,
+                dropped=sink_stats.get("dropped"),
+                queue_level=self.engine.get_property(
+                    stream._element_name("queue"), "current-level-buffers"
+                ),
+                latency=self.engine.query_latency(),
+            )
+
+    def get_time_to_first_packet(self, stream: Stream) -> float | None:
+        """
+        The time in seconds from starting the branch of a stream to its first encoded frame reaching the payloader
+
+        :return: The time, or None if the stream is not running, has not sent a frame yet or the engine cannot count
+            frames
+        """
+        with self._lock:
+            branch_name = stream._branch_name()
+            frame_counter = self._frame_counters.get(branch_name)
+            started_at = self._started_at.get(branch_name)
+            if not self.started or not frame_counter or frame_counter.first_buffer_time is None or started_at is None:
+                return None
+            return frame_counter.first_buffer_time - started_at
+
+    def _count_frames(self, stream: Stream):
+        # every buffer entering the payloader is an encoded frame
+        frame_counter = self.engine.count_buffers(stream._element_name("payloader"), "sink")
+        if frame_counter:
+            self._frame_counters[stream._branch_name()] = frame_counter
+
+    def _configured_streams(self) -> List[Stream]:
+        return [stream for stream in self.streams if stream.configured]
+
+    def _update_live(self) -> bool:
+        """
+        Bring the running pipeline up to date with the streams without stopping it. Branches of streams which were
+        added, removed or changed structure are linked or unlinked, the other branches are only updated in place.
+
+        :return: False if the pipeline needs to be restarted
+        """
+        if not self.engine.supports_live_properties or not self.engine.running:
+            return False
+        streams = {stream._branch_name(): stream for stream in self._configured_streams()}
+        if not streams:
+            return False
+
+        for branch_name, structure in list(self._structure.items()):
+            stream = streams.get(branch_name)
+            if stream and stream._structure_key() == structure:
+                continue
+            if not self.engine.remove_branch(branch_name):
+                return False
+            logging.info(f"Removed {branch_name} from the running pipeline")
+            self._forget_branch(branch_name)
+
+        for branch_name, stream in streams.items():
+            if branch_name not in self._structure:
+                stream._prepare()
+                pipeline_str = stream._construct_pipeline(self.engine.supports_tee_branches)
+                logging.info(pipeline_str)
+                self._started_at[branch_name] = time.monotonic()
+                if not self.engine.add_branch(branch_name, pipeline_str):
+                    return False
+                logging.info(f"Added {branch_name} to the running pipeline")
+                self._structure[branch_name] = stream._structure_key()
+                self._sink_clients[branch_name] = stream._sink_clients()
+                self._count_frames(stream)
+                if not self._update_recording(stream):
+                    return False
+                continue
+
+            for element_name, property_name, value in stream._live_properties():
+                if not self.engine.set_property(element_name, property_name, value):
+                    return False
+            if not self._update_sink_clients(stream):
+                return False
+            if not self._update_recording(stream):
+                return False
+        return True
+
+    def _forget_branch(self, branch_name: str):
+        """
+        Forget the state of a branch which was removed from the running pipeline, with the tee branches it held
+        """
+        del self._structure[branch_name]
+        self._sink_clients.pop(branch_name, None)
+        self._frame_counters.pop(branch_name, None)
+        self._started_at.pop(branch_name, None)
+        self._recordings.pop(branch_name, None)
+
+    def _update_recording(self, stream: Stream) -> bool:
+        """
+        Link or unlink the recording branch of a stream on the running pipeline, without interrupting the stream.
+        Engines which cannot link branches get the recording as part of the pipeline instead.
+
+        :return: False if the recording branch could not be linked
+        """
+        if not self.engine.supports_tee_branches:
+            return True
+        branch_name = stream._branch_name()
+        recording = stream._recording_key()
+        if self._recordings.get(branch_name) == recording:
+            return True
+
+        recording_name = stream._element_name("recording")
+        if self._recordings.pop(branch_name, None):
+            # lets the muxer finish the segment being written
+            self.engine.remove_tee_branch(recording_name, RECORDING_DRAIN_TIMEOUT)
+            logging.info(f"Unlinked the recording of {branch_name}")
+        if not recording:
+            return True
+        if not self.engine.add_tee_branch(stream._recording_tee(), recording_name, stream._build_recording()):
+            return False
+        logging.info(f"Linked the recording of {branch_name}")
+        self._recordings[branch_name] = recording
+        return True
+
+    def _update_sink_clients(self, stream: Stream) -> bool:
+        """
+        Add and remove the changed clients of a UDP sink, so the existing clients do not miss any packets
+        """
+        sink_name = stream._element_name("sink")
+        old_clients = self._sink_clients.get(stream._branch_name(), [])
+        new_clients = stream._sink_clients()
+        for client in old_clients:
+            if client not in new_clients and not self.engine.emit_action_signal(sink_name, "remove", *client):
+                return False
+        added = [client for client in new_clients if client not in old_clients]
+        for client in added:
+            if not self.engine.emit_action_signal(sink_name, "add", *client):
+                return False
+        self._sink_clients[stream._branch_name()] = new_clients
+        if added:
+            # the new clients cannot decode anything before the next keyframe
+            stream.emit("clients_added")
+        return True
 
     def _run_pipeline(self):
-        pipeline_str = self._construct_pipeline()
-        logging.info(pipeline_str)
-        self._process = subprocess.Popen(
-            f"gst-launch-1.0 {pipeline_str}".split(" "),
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        self.error_thread = threading.Thread(target=self._log_errors)
-        self.error_thread.start()
+        branches = self._construct_branches()
+        logging.info(" ".join(branches.values()))
+        self._structure = {
+            stream._branch_name(): stream._structure_key()
+            for stream in self._configured_streams()
+        }
+        self._sink_clients = {
+            stream._branch_name(): stream._sink_clients()
+            for stream in self._configured_streams()
+        }
+        self._frame_counters = {}
+        self._started_at = dict.fromkeys(branches, time.monotonic())
+        self._recordings = {}
+        self.supervisor.on_started()
+        self.engine.start(branches)
+        for stream in self._configured_streams():
+            self._count_frames(stream)
+            if not self._update_recording(stream):
+                logging.error(f"Failed to record {stream._branch_name()}")
+
+    def _construct_branches(self) -> Dict[str, str]:
+        """
+        The pipeline description of every configured stream, keyed by branch name
+        """
+        for stream in self._configured_streams():
+            stream._prepare()
+        return {
+            stream._branch_name(): stream._construct_pipeline(self.engine.supports_tee_branches)
+            for stream in self._configured_streams()
+        }
 
     def _construct_pipeline(self):
-        pipeline_strs = []
-        for stream in self.streams:
-            if stream.configured:
-                pipeline_strs.append(stream._construct_pipeline())
-        return " ".join(pipeline_strs)
-
-    def _log_errors(self):
-        error_block = []
-        try:
-            for stderr_line in iter(self._process.stderr.readline, ""):
-                stderr_line = self._process.stderr.readline()
-                if stderr_line:
-                    error_block.append(stderr_line)
-                    logging.error(stderr_line)
-                    self.stop()
-                else:
-                    break
-        except:
-            pass
-        if len(error_block) > 0:
-            self.stop()
+        return " ".join(self._construct_branches().values())
+
+    def _on_error(self, error_block: List[str], restartable: bool):
+        with self._lock:
+            # the engine stops a pipeline before reporting its failure, so a running pipeline was started after the
+            # failed one, while this callback waited for the lock
+            if self.engine.running:
+                return
+            # the counters of the failed pipeline would read as a stalled stream until it is restarted
+            self._structure = {}
+            self._recordings = {}
+            self._frame_counters = {}
+            self._started_at = {}
+            if not self.started:
+                return
+
+            delay = self.supervisor.on_failure() if restartable else None
+            if delay is not None:
+                logging.warning(
+                    f"Restarting pipeline in {delay} s (restart {self.supervisor.restart_count})"
+                )
+                self._schedule_restart(delay, self._restart)
+                return
+
+            if restartable:
+                logging.error("Pipeline failed too many times, giving up")
+            self.started = False
             self.emit("gst_error", error_block)
+
+    @property
+    def restart_pending(self) -> bool:
+        """
+        Whether a restart of the pipeline or of a branch is waiting for its backoff delay
+        """
+        with self._lock:
+            return self._restart_timer is not None
+
+    def _restart(self):
+        with self._lock:
+            self._restart_timer = None
+            if self.started and not self.engine.running:
+                self._run_pipeline()
+
+    def _schedule_restart(self, delay: float, restart, *args):
+        self._cancel_restart()
+        self._restart_timer = threading.Timer(delay, restart, args)
+        self._restart_timer.daemon = True
+        self._restart_timer.start()
+
+    def _cancel_restart(self):
+        if self._restart_timer:
+            self._restart_timer.cancel()
+            self._restart_timer = None
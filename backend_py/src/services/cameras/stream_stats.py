@@ -0,0 +1,75 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List
+import time
+
+from .pydantic_schemas import StreamStatsModel
+
+
+@dataclass
+class StreamCounters:
+    """
+    Cumulative counters of a running stream, read from its pipeline
+    """
+
+    # encoded frames and their size since the branch was started
+    frames: int
+    bytes: int
+    # late buffers dropped by the sink since the branch was started
+    dropped: int | None = None
+    # buffers waiting in the queue before the encoder or payloader
+    queue_level: int | None = None
+    # latency of the pipeline in seconds
+    latency: float | None = None
+
+
+class StreamStatsHistory:
+    """
+    Bounded history of the statistics of a stream, computed from the difference between successive counter samples
+    """
+
+    HISTORY_SIZE = 120
+
+    def __init__(self, history_size: int = HISTORY_SIZE) -> None:
+        self._history: Deque[StreamStatsModel] = deque(maxlen=history_size)
+        self._last_counters: StreamCounters | None = None
+        self._last_timestamp: float | None = None
+
+    def sample(
+        self, counters: StreamCounters | None, timestamp: float | None = None
+    ) -> StreamStatsModel | None:
+        """
+        Add a sample of the counters to the history
+
+        :param counters: The counters, or None if the stream is not running
+        :return: The statistics since the previous sample, or None if there is no previous sample to compare to
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        (last_counters, last_timestamp) = (self._last_counters, self._last_timestamp)
+        self._last_counters = counters
+        self._last_timestamp = timestamp
+
+        if counters is None or last_counters is None:
+            return None
+        elapsed = timestamp - last_timestamp
+        # the counters start over when the branch is restarted
+        if elapsed <= 0 or counters.frames < last_counters.frames:
+            return None
+
+        dropped = None
+        if counters.dropped is not None and last_counters.dropped is not None:
+            dropped = max(counters.dropped - last_counters.dropped, 0)
+        stats = StreamStatsModel(
+            timestamp=timestamp,
+            fps=(counters.frames - last_counters.frames) / elapsed,
+            bitrate=(counters.bytes - last_counters.bytes) * 8 / elapsed / 1000,
+            dropped=dropped,
+            queue_level=counters.queue_level,
+            latency=counters.latency * 1000 if counters.latency is not None else None,
+        )
+        self._history.append(stats)
+        return stats
+
+    def get_history(self) -> List[StreamStatsModel]:
+        return list(self._history)
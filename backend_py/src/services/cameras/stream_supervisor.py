@@ -0,0 +1,77 @@
+from collections import deque
+from typing import Callable, Deque
+import time
+
+from .pydantic_schemas import StreamRestartsModel
+
+
+class StreamSupervisor:
+    """
+    Decides when a failed pipeline is restarted: with exponential backoff between consecutive failures, and at most
+    RESTART_BUDGET restarts within BUDGET_WINDOW, after which the stream is given up on
+    """
+
+    INITIAL_BACKOFF = 1
+    MAX_BACKOFF = 30
+    RESTART_BUDGET = 5
+    BUDGET_WINDOW = 600
+    # A pipeline which ran this long before failing starts over from the initial backoff
+    STABLE_TIME = 60
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._restart_times: Deque[float] = deque()
+        self._backoff = self.INITIAL_BACKOFF
+        self._started_at: float | None = None
+        self._failed_at: float | None = None
+
+        self.restart_count = 0
+        self.total_downtime = 0.0
+        self.last_downtime: float | None = None
+        self.gave_up = False
+
+    def reset(self):
+        """
+        Start over with the full restart budget, e.g. when the stream was started by the user
+        """
+        self._restart_times.clear()
+        self._backoff = self.INITIAL_BACKOFF
+        self._failed_at = None
+        self.gave_up = False
+
+    def on_started(self):
+        now = self._clock()
+        if self._failed_at is not None:
+            self.last_downtime = now - self._failed_at
+            self.total_downtime += self.last_downtime
+            self._failed_at = None
+        self._started_at = now
+
+    def on_failure(self) -> float | None:
+        """
+        :return: The delay before restarting the pipeline, or None if the restart budget is used up
+        """
+        now = self._clock()
+        self._failed_at = now
+        if self._started_at is not None and now - self._started_at >= self.STABLE_TIME:
+            self._backoff = self.INITIAL_BACKOFF
+
+        while self._restart_times and now - self._restart_times[0] > self.BUDGET_WINDOW:
+            self._restart_times.popleft()
+        if len(self._restart_times) >= self.RESTART_BUDGET:
+            self.gave_up = True
+            return None
+
+        delay = self._backoff
+        self._backoff = min(self._backoff * 2, self.MAX_BACKOFF)
+        self._restart_times.append(now)
+        self.restart_count += 1
+        return delay
+
+    def get_model(self) -> StreamRestartsModel:
+        return StreamRestartsModel(
+            restart_count=self.restart_count,
+            total_downtime=self.total_downtime,
+            last_downtime=self.last_downtime,
+            gave_up=self.gave_up,
+        )